@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+#
+# Benchmarks loading a batch of ABI (.ab1) trace files.  By default, the batch
+# consists of 96 copies of the ABI test file, which simulates loading the
+# results from a 96-well plate.
+#
+
+import sys
+import os.path
+import time
+from argparse import ArgumentParser
+
+
+# Make sure we can find the seqtrace modules.
+seqtrace_dir = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.realpath(__file__)),
+        '../'
+    )
+)
+sys.path.append(seqtrace_dir)
+
+from seqtrace.core.sequencetrace import ABISequenceTrace, TS_LIST, TS_ARRAY, TS_MMAP
+
+storage_types = {'list': TS_LIST, 'array': TS_ARRAY, 'mmap': TS_MMAP}
+
+
+argp = ArgumentParser(description='Benchmarks loading a batch of ABI trace files.')
+argp.add_argument(
+    'abi_file', type=str, nargs='*', help='An ABI file to load.  If no files '
+    'are provided, the ABI test file is used.'
+)
+argp.add_argument(
+    '-c', '--count', type=int, default=96, help='The number of times to load '
+    'each file in a batch (default: 96).'
+)
+argp.add_argument(
+    '-r', '--repeats', type=int, default=3, help='The number of times to load '
+    'the batch; the fastest time is reported (default: 3).'
+)
+argp.add_argument(
+    '-s', '--storage', choices=sorted(storage_types.keys()), default='list',
+    help='The trace sample storage backend to use (default: list).'
+)
+args = argp.parse_args()
+
+if len(args.abi_file) > 0:
+    fnames = args.abi_file
+else:
+    fnames = [os.path.join(seqtrace_dir, 'test', 'test_data', 'forward.ab1')]
+
+times = []
+for rep in range(args.repeats):
+    starttime = time.time()
+    for fname in fnames:
+        for cnt in range(args.count):
+            trace = ABISequenceTrace(storage_types[args.storage])
+            trace.loadFile(fname)
+    times.append(time.time() - starttime)
+
+numloads = len(fnames) * args.count
+best = min(times)
+print 'Loaded {0} traces in {1:.3f} s ({2:.2f} ms per trace).'.format(
+    numloads, best, best * 1000 / numloads
+)
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+#
+# Benchmarks pairwise alignments of simulated forward and reverse reads.  Each
+# simulated read pair overlaps by about 900 bases, has a low error rate in the
+# middle, and has noisy, low-quality ends, as real reads do.  The alignments
+# are calculated with and without a band, using each available alignment
+# implementation.  The compiled implementation is also run on several threads
+# at once to measure how well alignments run in parallel, and with the batch
+# alignment API, alignMany().
+#
+
+import sys
+import os.path
+import random
+import time
+import threading
+from argparse import ArgumentParser
+
+
+# Make sure we can find the seqtrace modules.
+seqtrace_dir = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.realpath(__file__)),
+        '../'
+    )
+)
+sys.path.append(seqtrace_dir)
+
+from seqtrace.core.align import pyalign
+try:
+    from seqtrace.core.align import calign
+except ImportError:
+    calign = None
+try:
+    from seqtrace.core.align import npalign
+except ImportError:
+    npalign = None
+
+
+def mutate(rng, seq, rate):
+    """
+    Introduces random substitutions, insertions, and deletions into a sequence.
+    """
+    res = []
+    for base in seq:
+        val = rng.random()
+        if val < rate / 3:
+            pass
+        elif val < rate * 2 / 3:
+            res.append(rng.choice('ACGT') + base)
+        elif val < rate:
+            res.append(rng.choice('ACGTN'))
+        else:
+            res.append(base)
+
+    return ''.join(res)
+
+def simulateRead(rng, template, badstart, badend, errorrate):
+    return (
+        mutate(rng, template[:badstart], 0.25)
+        + mutate(rng, template[badstart:len(template) - badend], errorrate)
+        + mutate(rng, template[len(template) - badend:], 0.25)
+    )
+
+def makeReadPairs(rng, numpairs):
+    pairs = []
+    for cnt in range(numpairs):
+        template = ''.join([rng.choice('ACGT') for basecnt in range(1000)])
+        badend = rng.choice((0, 30, 80, 150))
+        fwdread = simulateRead(
+            rng, template[rng.randint(0, 40):], 20, badend, rng.choice((0.002, 0.01, 0.03))
+        )
+        revread = simulateRead(
+            rng, template[:1000 - rng.randint(0, 40)], badend, 20, rng.choice((0.002, 0.01, 0.03))
+        )
+        pairs.append((fwdread, revread))
+
+    return pairs
+
+def timeAlignments(module, pairs, bandwidth):
+    starttime = time.time()
+    for seq1, seq2 in pairs:
+        align = module.PairwiseAlignment()
+        align.setBandWidth(bandwidth)
+        align.setSequences(seq1, seq2)
+        align.doAlignment()
+
+    return (time.time() - starttime) * 1000 / len(pairs)
+
+def timeThreadedAlignments(module, pairs, bandwidth, numthreads):
+    """
+    Aligns the read pairs on numthreads threads and returns the average time per
+    pair.
+    """
+    def alignPairs(threadpairs):
+        timeAlignments(module, threadpairs, bandwidth)
+
+    threads = [
+        threading.Thread(target=alignPairs, args=(pairs[cnt::numthreads],))
+        for cnt in range(numthreads)
+    ]
+
+    starttime = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return (time.time() - starttime) * 1000 / len(pairs)
+
+def timeBatchAlignments(module, pairs, bandwidth, numthreads):
+    """
+    Aligns the read pairs with a single call to alignMany() and returns the
+    average time per pair.
+    """
+    align = module.PairwiseAlignment()
+    align.setBandWidth(bandwidth)
+
+    starttime = time.time()
+    align.alignMany(pairs, numthreads=numthreads)
+
+    return (time.time() - starttime) * 1000 / len(pairs)
+
+
+argp = ArgumentParser(description='Benchmarks pairwise alignments of simulated forward and reverse reads.')
+argp.add_argument(
+    '-n', '--numpairs', type=int, default=20, help='The number of read pairs '
+    'to align (default: 20).'
+)
+argp.add_argument(
+    '-b', '--bandwidth', type=int, default=20, help='The band width to use '
+    'for banded alignments (default: 20).'
+)
+argp.add_argument(
+    '-t', '--threads', type=int, default=4, help='The number of threads to '
+    'use for the parallel alignment test (default: 4).'
+)
+argp.add_argument(
+    '-s', '--seed', type=int, default=1, help='The random number seed.'
+)
+args = argp.parse_args()
+
+pairs = makeReadPairs(random.Random(args.seed), args.numpairs)
+
+modules = [('pyalign', pyalign)]
+if npalign is not None:
+    modules.append(('npalign', npalign))
+if calign is not None:
+    modules.append(('calign', calign))
+
+for name, module in modules:
+    fulltime = timeAlignments(module, pairs, 0)
+    bandtime = timeAlignments(module, pairs, args.bandwidth)
+    print '{0}: full: {1:.1f} ms per pair; banded: {2:.1f} ms per pair ({3:.1f}x faster)'.format(
+        name, fulltime, bandtime, fulltime / bandtime
+    )
+
+if calign is not None:
+    singletime = timeAlignments(calign, pairs, 0)
+    threadtime = timeThreadedAlignments(calign, pairs, 0, args.threads)
+    print 'calign, full alignments on {0} threads: {1:.1f} ms per pair ({2:.1f}x faster than 1 thread)'.format(
+        args.threads, threadtime, singletime / threadtime
+    )
+    batchtime = timeBatchAlignments(calign, pairs, 0, 1)
+    print 'calign, full alignments with alignMany(): {0:.1f} ms per pair'.format(batchtime)
+    batchtime = timeBatchAlignments(calign, pairs, 0, args.threads)
+    print 'calign, full alignments with alignMany() on {0} threads: {1:.1f} ms per pair'.format(
+        args.threads, batchtime
+    )
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+#
+# Benchmarks a "cold start" of a large project, i.e., loading every trace in
+# the project in a new session, with and without the on-disk trace cache.  The
+# project is simulated by creating many links to (or copies of) the three test
+# trace files.
+#
+
+import sys
+import os
+import os.path
+import shutil
+import tempfile
+import time
+from argparse import ArgumentParser
+
+
+# Make sure we can find the seqtrace modules.
+seqtrace_dir = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.realpath(__file__)),
+        '../'
+    )
+)
+sys.path.append(seqtrace_dir)
+
+from seqtrace.core.sequencetrace import SequenceTraceFactory, TS_LIST, TS_ARRAY, TS_MMAP
+from seqtrace.core.tracecache import DiskTraceCache
+
+storage_types = {'list': TS_LIST, 'array': TS_ARRAY, 'mmap': TS_MMAP}
+
+
+def loadAll(fnames, sampstorage, diskcache=None):
+    starttime = time.time()
+    for fname in fnames:
+        SequenceTraceFactory.loadTraceFile(fname, sampstorage, diskcache)
+
+    return time.time() - starttime
+
+
+argp = ArgumentParser(description='Benchmarks loading a large project with and without the on-disk trace cache.')
+argp.add_argument(
+    '-n', '--numtraces', type=int, default=2000, help='The number of traces in '
+    'the simulated project (default: 2000).'
+)
+argp.add_argument(
+    '-s', '--storage', choices=sorted(storage_types.keys()), default='array',
+    help='The trace sample storage backend to use (default: array).'
+)
+args = argp.parse_args()
+sampstorage = storage_types[args.storage]
+
+test_data = os.path.join(seqtrace_dir, 'test', 'test_data')
+srcfiles = [
+    os.path.join(test_data, fname) for fname in ('forward.ab1', 'forward.scf', 'forward.ztr')
+]
+
+tmpdir = tempfile.mkdtemp(prefix='seqtrace_bench_')
+try:
+    print 'Creating a project with {0} trace files...'.format(args.numtraces)
+    fnames = []
+    for cnt in range(args.numtraces):
+        srcfile = srcfiles[cnt % len(srcfiles)]
+        fname = os.path.join(
+            tmpdir, 'trace_{0:05d}{1}'.format(cnt, os.path.splitext(srcfile)[1])
+        )
+        try:
+            os.link(srcfile, fname)
+        except (AttributeError, OSError):
+            shutil.copy2(srcfile, fname)
+        fnames.append(fname)
+
+    cachedir = os.path.join(tmpdir, 'project_tracecache')
+
+    nocache_time = loadAll(fnames, sampstorage)
+    print 'Without the trace cache: {0:.2f} s'.format(nocache_time)
+
+    populate_time = loadAll(fnames, sampstorage, DiskTraceCache(cachedir))
+    print 'First session with the trace cache (populating): {0:.2f} s'.format(populate_time)
+
+    cached_time = loadAll(fnames, sampstorage, DiskTraceCache(cachedir))
+    print 'New session with the trace cache: {0:.2f} s ({1:.1f}x faster)'.format(
+        cached_time, nocache_time / cached_time
+    )
+finally:
+    shutil.rmtree(tmpdir)
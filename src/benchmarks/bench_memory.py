@@ -0,0 +1,93 @@
+#!/usr/bin/python
+
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+#
+# Measures the memory used by loaded sequence traces.  The three test trace
+# files (ABI, SCF, and ZTR) are loaded repeatedly and kept in memory, and the
+# increase in the resident set size (RSS) of the process is reported as the
+# average number of resident bytes per trace.
+#
+
+import sys
+import os.path
+import resource
+from argparse import ArgumentParser
+
+
+# Make sure we can find the seqtrace modules.
+seqtrace_dir = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.realpath(__file__)),
+        '../'
+    )
+)
+sys.path.append(seqtrace_dir)
+
+from seqtrace.core.sequencetrace import SequenceTraceFactory, TS_LIST, TS_ARRAY, TS_MMAP
+
+storage_types = {'list': TS_LIST, 'array': TS_ARRAY, 'mmap': TS_MMAP}
+
+
+def getRSS():
+    """
+    Returns the current resident set size of this process, in bytes.  On
+    systems without /proc, the peak resident set size is used instead, which
+    is equivalent here because memory use only grows while traces are loaded.
+    """
+    try:
+        statm = open('/proc/self/statm').read().split()
+        return int(statm[1]) * resource.getpagesize()
+    except IOError:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            return maxrss
+        else:
+            return maxrss * 1024
+
+
+argp = ArgumentParser(description='Measures the memory used by loaded sequence traces.')
+argp.add_argument(
+    '-n', '--numtraces', type=int, default=300, help='The number of traces to '
+    'load (default: 300).'
+)
+argp.add_argument(
+    '-s', '--storage', choices=sorted(storage_types.keys()), default='list',
+    help='The trace sample storage backend to use (default: list).'
+)
+args = argp.parse_args()
+
+test_data = os.path.join(seqtrace_dir, 'test', 'test_data')
+fnames = [
+    os.path.join(test_data, fname) for fname in ('forward.ab1', 'forward.scf', 'forward.ztr')
+]
+
+# Load one trace of each type first so that all modules and caches are
+# initialized before taking the starting measurement.
+for fname in fnames:
+    SequenceTraceFactory.loadTraceFile(fname, storage_types[args.storage])
+
+traces = []
+startrss = getRSS()
+for cnt in range(args.numtraces):
+    traces.append(
+        SequenceTraceFactory.loadTraceFile(fnames[cnt % len(fnames)], storage_types[args.storage])
+    )
+endrss = getRSS()
+
+print 'Loaded {0} traces using "{1}" sample storage.'.format(len(traces), args.storage)
+print 'Resident bytes per trace: {0:.0f}'.format(float(endrss - startrss) / len(traces))
@@ -0,0 +1,224 @@
+#!/usr/bin/python
+
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+#
+# Benchmarks ZTR trace file loading on a synthetic 96-well plate.  Each
+# synthetic trace is encoded with the same filter chains that the Staden
+# package uses for real ZTR files (delta, 16/32 to 8 bit conversion, "follow",
+# RLE, and zlib), so the decoders are exercised the same way they are when
+# loading real data.
+#
+
+import sys
+import os.path
+import shutil
+import tempfile
+import random
+import zlib
+import time
+from struct import pack
+from argparse import ArgumentParser
+
+
+# Make sure we can find the seqtrace modules.
+seqtrace_dir = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.realpath(__file__)),
+        '../'
+    )
+)
+sys.path.append(seqtrace_dir)
+
+from seqtrace.core.sequencetrace import ZTRSequenceTrace
+
+
+def deltaEncode(vals, levels, mask):
+    for level in range(levels):
+        prev = 0
+        for cnt in range(len(vals)):
+            vals[cnt], prev = (vals[cnt] - prev) & mask, vals[cnt]
+
+    return vals
+
+def encode8BitDelta(data, levels=1):
+    vals = deltaEncode([ord(byte) for byte in data], levels, 0xff)
+    return chr(64) + chr(levels) + ''.join([chr(val) for val in vals])
+
+def encode16BitDelta(data, levels=3):
+    vals = [ord(data[cnt]) * 256 + ord(data[cnt+1]) for cnt in range(0, len(data), 2)]
+    vals = deltaEncode(vals, levels, 0xffff)
+    return chr(65) + chr(levels) + ''.join([pack('>H', val) for val in vals])
+
+def encode32BitDelta(data, levels=1):
+    vals = [
+        (ord(data[cnt]) << 24) + (ord(data[cnt+1]) << 16) + (ord(data[cnt+2]) << 8)
+        + ord(data[cnt+3]) for cnt in range(0, len(data), 4)
+    ]
+    vals = deltaEncode(vals, levels, 0xffffffff)
+    return chr(66) + chr(levels) + '\0\0' + ''.join([pack('>I', val) for val in vals])
+
+def encode16To8(data):
+    res = [chr(70)]
+    for cnt in range(0, len(data), 2):
+        val = ord(data[cnt]) * 256 + ord(data[cnt+1])
+        if val >= 0x8000:
+            val -= 0x10000
+        if -128 < val < 128:
+            res.append(chr(val & 0xff))
+        else:
+            res.append('\x80' + data[cnt:cnt+2])
+
+    return ''.join(res)
+
+def encode32To8(data):
+    res = [chr(71)]
+    for cnt in range(0, len(data), 4):
+        val = (ord(data[cnt]) << 24) + (ord(data[cnt+1]) << 16) + (ord(data[cnt+2]) << 8) + ord(data[cnt+3])
+        if val >= 0x80000000:
+            val -= 0x100000000
+        if -128 < val < 128:
+            res.append(chr(val & 0xff))
+        else:
+            res.append('\x80' + data[cnt:cnt+4])
+
+    return ''.join(res)
+
+def followEncode(data):
+    # Build the table of most likely successors for each byte value.
+    counts = [[0] * 256 for cnt in range(256)]
+    for cnt in range(1, len(data)):
+        counts[ord(data[cnt-1])][ord(data[cnt])] += 1
+    table = [row.index(max(row)) for row in counts]
+
+    res = [chr(72), ''.join([chr(val) for val in table]), data[0]]
+    for cnt in range(1, len(data)):
+        res.append(chr((table[ord(data[cnt-1])] - ord(data[cnt])) & 0xff))
+
+    return ''.join(res)
+
+def RLECompress(data, minrun=4):
+    # Use the least frequent byte value as the guard byte.
+    counts = [0] * 256
+    for byte in data:
+        counts[ord(byte)] += 1
+    guard = chr(counts.index(min(counts)))
+
+    res = [chr(1), pack('I', len(data)), guard]
+    cnt = 0
+    while cnt < len(data):
+        runlen = 1
+        while (cnt + runlen < len(data)) and (data[cnt+runlen] == data[cnt]) and (runlen < 255):
+            runlen += 1
+        if runlen >= minrun:
+            res.append(guard + chr(runlen) + data[cnt])
+            cnt += runlen
+        else:
+            if data[cnt] == guard:
+                res.append(guard + '\0')
+            else:
+                res.append(data[cnt])
+            cnt += 1
+
+    return ''.join(res)
+
+def zlibCompress(data):
+    return chr(2) + pack('I', len(data)) + zlib.compress(data)
+
+def makeChunk(chtype, data):
+    return chtype + pack('>I', 0) + pack('>I', len(data)) + data
+
+def makeTrace(rng, numbases=800, spacing=12):
+    """
+    Generates a synthetic, but reasonably realistic, ZTR file and returns it
+    as a string.
+    """
+    numsamps = numbases * spacing
+    bases = ''.join([rng.choice('ACGT') for cnt in range(numbases)])
+    basepos = [cnt * spacing + spacing / 2 for cnt in range(numbases)]
+    confs = [rng.randint(5, 60) for cnt in range(numbases)]
+
+    # Simulate the trace data as a series of peaks on a noisy baseline.
+    samps = {}
+    for base in 'ACGT':
+        samps[base] = [rng.randint(0, 40) for cnt in range(numsamps)]
+    for cnt in range(numbases):
+        height = rng.randint(200, 2000)
+        for offset in range(-spacing / 2, spacing / 2):
+            val = height - abs(offset) * height * 2 / spacing
+            samps[bases[cnt]][basepos[cnt] + offset] += val
+
+    smpdata = '\0\0' + ''.join(
+        [pack('>' + str(numsamps) + 'H', *samps[base]) for base in 'ACGT']
+    )
+    smpdata = zlibCompress(RLECompress(followEncode(encode16To8(encode16BitDelta(smpdata)))))
+
+    basedata = zlibCompress('\0' + bases)
+    posdata = zlibCompress(encode32To8(encode32BitDelta('\0\0\0\0' + pack('>' + str(numbases) + 'I', *basepos))))
+
+    cnfdata = '\0' + ''.join([chr(val) for val in confs]) + '\0' * (3 * numbases)
+    cnfdata = zlibCompress(RLECompress(encode8BitDelta(cnfdata)))
+
+    textdata = '\0MACH\0synthetic\0\0'
+
+    return ('\256ZTR\r\n\032\n' + chr(1) + chr(2)
+        + makeChunk('SMP4', smpdata) + makeChunk('BASE', basedata)
+        + makeChunk('BPOS', posdata) + makeChunk('CNF4', cnfdata)
+        + makeChunk('TEXT', textdata))
+
+
+argp = ArgumentParser(description='Benchmarks loading a synthetic 96-well plate of ZTR files.')
+argp.add_argument(
+    '-w', '--wells', type=int, default=96, help='The number of traces to '
+    'generate (default: 96).'
+)
+argp.add_argument(
+    '-r', '--repeats', type=int, default=3, help='The number of times to load '
+    'the plate; the fastest time is reported (default: 3).'
+)
+argp.add_argument(
+    '-s', '--seed', type=int, default=1, help='The random number seed.'
+)
+args = argp.parse_args()
+
+rng = random.Random(args.seed)
+
+tmpdir = tempfile.mkdtemp(prefix='seqtrace_bench_')
+try:
+    print 'Generating {0} synthetic ZTR files...'.format(args.wells)
+    fnames = []
+    for cnt in range(args.wells):
+        fname = os.path.join(tmpdir, 'well_{0:02d}.ztr'.format(cnt))
+        fout = open(fname, 'wb')
+        fout.write(makeTrace(rng))
+        fout.close()
+        fnames.append(fname)
+
+    times = []
+    for rep in range(args.repeats):
+        starttime = time.time()
+        for fname in fnames:
+            trace = ZTRSequenceTrace()
+            trace.loadFile(fname)
+        times.append(time.time() - starttime)
+
+    best = min(times)
+    print 'Loaded {0} traces in {1:.3f} s ({2:.2f} ms per trace).'.format(
+        args.wells, best, best * 1000 / args.wells
+    )
+finally:
+    shutil.rmtree(tmpdir)
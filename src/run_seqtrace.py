@@ -21,33 +21,42 @@ from gi.repository import Gtk
 from seqtrace.gui.maingui import MainWindow
 
 from argparse import ArgumentParser
-
-
-argp = ArgumentParser(
-    prog='seqtrace', description='User-friendly software for viewing and '
-    'processing Sanger DNA sequencing trace files.'
-)
-argp.add_argument(
-    'filename', type=str, nargs='?', default='', help='If [filename] is '
-    'provided and appears to be a project file (from its extension), SeqTrace '
-    'will attempt to load the project.  Otherwise, SeqTrace will treat the '
-    'file as a sequencing trace file and attempt to load the trace file '
-    'directly.'
-)
-
-# parse command-line arguments
-args = argp.parse_args()
-filein = args.filename
-
-mainwin = MainWindow()
-
-if filein != '':
-    # see if the file name looks like a project file
-    if filein.endswith(mainwin.getFileExtension()):
-        mainwin.openProject(filein)
-    else:
-        # not a project file, so attempt to open it as a sequence trace file
-        mainwin.openTraceFile(filein)
-
-Gtk.main()
-
+import multiprocessing
+
+
+def main():
+    argp = ArgumentParser(
+        prog='seqtrace', description='User-friendly software for viewing and '
+        'processing Sanger DNA sequencing trace files.'
+    )
+    argp.add_argument(
+        'filename', type=str, nargs='?', default='', help='If [filename] is '
+        'provided and appears to be a project file (from its extension), SeqTrace '
+        'will attempt to load the project.  Otherwise, SeqTrace will treat the '
+        'file as a sequencing trace file and attempt to load the trace file '
+        'directly.'
+    )
+
+    # parse command-line arguments
+    args = argp.parse_args()
+    filein = args.filename
+
+    mainwin = MainWindow()
+
+    if filein != '':
+        # see if the file name looks like a project file
+        if filein.endswith(mainwin.getFileExtension()):
+            mainwin.openProject(filein)
+        else:
+            # not a project file, so attempt to open it as a sequence trace file
+            mainwin.openTraceFile(filein)
+
+    Gtk.main()
+
+
+# Sequences are generated in worker processes, which import this module on some
+# platforms (e.g., Windows), so only run the program if it is the main module.
+# freeze_support() lets the workers of a frozen executable start correctly.
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
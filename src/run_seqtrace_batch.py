@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# This program does not use the GUI, so it must not import Gtk.
+from seqtrace.core import batch
+from seqtrace.core import fwdrev
+from seqtrace.core import seqwriter
+from seqtrace.core import stproject_io
+
+from argparse import ArgumentParser
+import os.path
+import sys
+
+
+FORMATS = {
+    'fasta': seqwriter.FORMAT_FASTA,
+    'nexus': seqwriter.FORMAT_NEXUS,
+    'text': seqwriter.FORMAT_PLAINTEXT
+}
+
+
+def main():
+    argp = ArgumentParser(
+        prog='seqtrace-batch', description='Generates consensus sequences for '
+        'a SeqTrace project or a directory of sequencing trace files and '
+        'exports them to a sequence file, without using the GUI.'
+    )
+    argp.add_argument(
+        'input', type=str, help='A SeqTrace project file or a directory of '
+        'trace files.  Matching forward and reverse trace files in a directory '
+        'are paired automatically.'
+    )
+    argp.add_argument(
+        '-o', '--output', type=str, required=True, help='The output sequence file.'
+    )
+    argp.add_argument(
+        '-f', '--format', type=str, choices=sorted(FORMATS.keys()),
+        default='fasta', help='The output file format (default: fasta).'
+    )
+    argp.add_argument(
+        '-w', '--workers', type=int, default=None, help='The number of worker '
+        'processes (default: the number of CPUs).'
+    )
+    argp.add_argument(
+        '--fwd', type=str, default='_F', help='The search string for forward '
+        'trace files in a directory (default: _F).'
+    )
+    argp.add_argument(
+        '--rev', type=str, default='_R', help='The search string for reverse '
+        'trace files in a directory (default: _R).'
+    )
+    namegroup = argp.add_mutually_exclusive_group()
+    namegroup.add_argument(
+        '--pattern', type=str, default=None, help='A regular expression that '
+        'describes the names of the trace files in a directory.  It must match '
+        'entire file names and have a group called "dir" that matches the '
+        'forward or reverse search string.'
+    )
+    namegroup.add_argument(
+        '--template', type=str, default=None, help='A template for the names '
+        'of the trace files in a directory, in which "{dir}" stands for the '
+        'entire forward or reverse search string (including any separator, '
+        'such as the "_" in "_F") and "*" matches any text (for example, '
+        '"*{dir}.ab1").'
+    )
+    argp.add_argument(
+        '--no-filenames', action='store_true', help='Do not include the trace '
+        'file names in the exported sequence descriptions.'
+    )
+
+    args = argp.parse_args()
+    if (args.workers is not None) and (args.workers < 1):
+        argp.error('the number of workers must be at least 1')
+
+    pattern = args.pattern
+    if args.template is not None:
+        pattern = fwdrev.templateToPattern(args.template, args.fwd, args.rev)
+
+    try:
+        if os.path.isdir(args.input):
+            items = batch.readTraceDirectory(args.input, args.fwd, args.rev, pattern)
+            settings = None
+            tracedir = os.path.abspath(args.input)
+        else:
+            items, settings, tracedir = batch.readProjectFile(args.input)
+    except IOError:
+        sys.stderr.write('Error: the file "' + args.input + '" could not be opened.\n')
+        return 1
+    except stproject_io.ReaderError:
+        sys.stderr.write('Error: "' + args.input + '" is not a valid SeqTrace project file.\n')
+        return 1
+    except batch.BatchError as err:
+        sys.stderr.write('Error: ' + str(err) + '\n')
+        return 1
+
+    pipeline = batch.BatchPipeline(settings, tracedir, args.workers)
+    try:
+        pipeline.run(items, args.output, FORMATS[args.format], not(args.no_filenames))
+    except batch.BatchError as err:
+        sys.stderr.write('Error: ' + str(err) + '\n')
+        return 1
+
+    for filepath, errmsg in pipeline.getErrors():
+        if errmsg is None:
+            errmsg = 'The file could not be opened.'
+        sys.stderr.write('Error opening "' + filepath + '": ' + errmsg + '\n')
+
+    print pipeline.getTimingReport()
+
+    if len(pipeline.getErrors()) > 0:
+        return 1
+    else:
+        return 0
+
+
+# The worker processes import this module on some platforms, so only run the
+# program if it is the main module.
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,12 +18,17 @@
 # Sets up a reference to a PairwiseAlignment object.  This will allow client
 # code to use PairwiseAlignment without needing to worry about whether or not
 # the compiled C extension is available.  If the compiled module is available,
-# it will be used automatically; otherwise, the native Python module will be used.
+# it will be used automatically; otherwise, the NumPy module will be used if
+# NumPy is installed, and the native Python module will be used if it is not.
 
 try:
     # Try to load the compiled C module.
     from calign import PairwiseAlignment
 except ImportError:
-    # If that fails, load the Python module.
-    from pyalign import PairwiseAlignment
+    try:
+        # If that fails, try the NumPy module.
+        from npalign import PairwiseAlignment
+    except ImportError:
+        # If that also fails, load the Python module.
+        from pyalign import PairwiseAlignment
 
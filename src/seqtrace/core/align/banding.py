@@ -0,0 +1,145 @@
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Support code for banded pairwise alignments that is shared by the Python and
+C implementations of PairwiseAlignment.
+
+A band is defined by the lowest and highest diagonals, (lo, hi), of the
+alignment matrix that it includes, where the diagonal of matrix cell (i, j) is
+j - i.  Because end gaps are free, the last row and the last column of the
+matrix are also searched wherever they can be reached from the band.  A banded
+alignment only considers paths through the band, so its score is a lower bound
+of the optimal score.  The bounds calculated here are upper bounds for the
+scores of all of the paths that the band excludes, which makes it possible to
+prove that a banded alignment is optimal.
+"""
+
+
+# The k-mer size used to estimate the alignment diagonal.
+KMER_SIZE = 8
+
+# k-mers that occur more often than this in the first sequence are ignored when
+# estimating the alignment diagonal so that low-complexity regions cannot
+# dominate the estimate (or the running time).
+MAX_KMER_OCCURRENCES = 4
+
+# A score that is low enough to mark cells outside of the band as unreachable.
+UNREACHABLE = -(1 << 30)
+
+
+def estimateDiagonal(seq1, seq2, ksize=KMER_SIZE):
+    """
+    Estimates the main diagonal of the alignment of two sequences as the offset
+    (position in sequence 2 minus position in sequence 1) that is shared by the
+    largest number of k-mers.  Returns None if the sequences do not share any
+    k-mers.
+    """
+    kmers = {}
+    for i in range(len(seq1) - ksize + 1):
+        kmers.setdefault(seq1[i:i+ksize], []).append(i)
+
+    votes = {}
+    for j in range(len(seq2) - ksize + 1):
+        positions = kmers.get(seq2[j:j+ksize])
+        if (positions is not None) and (len(positions) <= MAX_KMER_OCCURRENCES):
+            for i in positions:
+                votes[j - i] = votes.get(j - i, 0) + 1
+
+    if len(votes) == 0:
+        return None
+
+    # Break ties in favor of the diagonal closest to the main diagonal of the
+    # matrix so that the result does not depend on dictionary ordering.
+    return max(votes.iteritems(), key=lambda vote: (vote[1], -abs(vote[0])))[0]
+
+def getAlignmentBand(seq1, seq2, bandwidth):
+    """
+    Returns the band, (lo, hi), to use for aligning two sequences with the
+    given band width (the number of diagonals searched on either side of the
+    estimated alignment diagonal).  Returns None if the sequences should be
+    aligned without a band, either because no alignment diagonal could be
+    estimated or because the band would cover the entire alignment matrix.
+    """
+    if bandwidth <= 0:
+        return None
+
+    diag = estimateDiagonal(seq1, seq2)
+    if diag is None:
+        return None
+
+    lo = diag - bandwidth
+    hi = diag + bandwidth
+    if (lo <= -len(seq1)) and (hi >= len(seq2)):
+        return None
+
+    return (lo, hi)
+
+def getMaxSubstitutionScore(svals):
+    """
+    Returns the largest score in a substitution score matrix.
+    """
+    return max([max(row.values()) for row in svals.values()])
+
+def _diagonalLength(d, seq1len, seq2len):
+    if d >= 0:
+        return min(seq1len, seq2len - d)
+    else:
+        return min(seq1len + d, seq2len)
+
+def getOutsideBandBound(seq1len, seq2len, lo, hi, maxscore):
+    """
+    Returns an upper bound for the score of any alignment path that begins (at
+    the end of its leading end gap) on a diagonal outside of the band.  Such a
+    path can include at most as many aligned base pairs as the length of its
+    starting diagonal, and internal gaps never increase the score.
+    """
+    maxscore = max(maxscore, 0)
+    bound = UNREACHABLE
+
+    # The diagonal lengths increase up to a plateau that spans the diagonals
+    # between 0 and seq2len - seq1len and then decrease, so the longest
+    # diagonals outside of the band are the ones closest to the plateau.
+    plateaustart = min(0, seq2len - seq1len)
+    plateauend = max(0, seq2len - seq1len)
+    if lo - 1 >= -seq1len:
+        d = min(lo - 1, plateaustart)
+        bound = max(bound, maxscore * _diagonalLength(d, seq1len, seq2len))
+    if hi + 1 <= seq2len:
+        d = max(hi + 1, plateauend)
+        bound = max(bound, maxscore * _diagonalLength(d, seq1len, seq2len))
+
+    return bound
+
+def getWiderBand(seq1len, seq2len, band, bandscore, maxscore):
+    """
+    Returns a wider band to try after a banded alignment with the given band and
+    score could not be proven optimal.  The new band is at least twice as wide
+    and wide enough that alignments starting outside of it cannot beat the
+    previous band's score.  Returns None if the new band would cover so much of
+    the alignment matrix that a full alignment should be used instead.
+    """
+    lo, hi = band
+    center = (lo + hi) / 2
+    width = max(1, (hi - lo) / 2) * 2
+    maxwidth = max(seq1len, seq2len) / 4
+
+    while width <= maxwidth:
+        if getOutsideBandBound(
+            seq1len, seq2len, center - width, center + width, maxscore
+        ) <= bandscore:
+            return (center - width, center + width)
+        width += 1
+
+    return None
@@ -0,0 +1,72 @@
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Support code for aligning many pairs of sequences at once that is shared by
+all of the implementations of PairwiseAlignment.
+"""
+
+import threading
+
+
+def alignMany(aligner, pairs, gap_penalty=None, numthreads=1):
+    """
+    Aligns a list of sequence pairs, (sequence1, sequence2), with the settings
+    of the PairwiseAlignment object aligner and returns a list that contains
+    the tuple (seq1aligned, seq2aligned, seq1indexed, seq2indexed) for each
+    pair.  Each thread aligns its share of the pairs with a separate worker
+    object, which is created by aligner._newWorker() and can reuse its memory
+    from one alignment to the next.  If an alignment on a worker thread fails,
+    the first exception is raised after all of the threads have finished.
+    """
+    if gap_penalty is None:
+        gap_penalty = aligner.getGapPenalty()
+
+    maxseq1len = max([0] + [len(pair[0]) for pair in pairs])
+    maxseq2len = max([0] + [len(pair[1]) for pair in pairs])
+
+    results = [None] * len(pairs)
+    errors = []
+
+    def alignPairs(indexes):
+        worker = aligner._newWorker(maxseq1len, maxseq2len)
+        worker.setGapPenalty(gap_penalty)
+        for index in indexes:
+            worker.setSequences(pairs[index][0], pairs[index][1])
+            worker.doAlignment()
+            results[index] = worker.getAlignedSequences() + worker.getAlignedSeqIndexes()
+
+    def runThread(indexes):
+        try:
+            alignPairs(indexes)
+        except Exception as err:
+            errors.append(err)
+
+    numthreads = min(numthreads, len(pairs))
+    if numthreads <= 1:
+        alignPairs(range(len(pairs)))
+    else:
+        threads = [
+            threading.Thread(target=runThread, args=(range(cnt, len(pairs), numthreads),))
+            for cnt in range(numthreads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    if len(errors) > 0:
+        raise errors[0]
+
+    return results
@@ -14,10 +14,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 This module is functionally identical to pyalign.py, except that the core pairwise alignment
-algorithm, doAlignment(), is implemented mostly in C (via Cython).  Performance tests indicate
-that this improves the average time (n=1000) to calculate a pairwise alignment by more than
-88% compared to the pure Python implementation.  In other words, alignments run in 11% of the
-time taken by the pure Python implementation, or just over 9 times faster.
+algorithm, doAlignment(), is implemented in C (via Cython).  Before an alignment is calculated,
+the sequences are converted to strings of small integer codes, and the substitution score
+matrix is converted to a flat table of integers, so that the matrix calculations and the
+traceback run entirely in C without holding the global interpreter lock.  This allows several
+alignments to run in parallel on separate threads.  The traceback matrix for a full alignment is
+a single contiguous buffer, and only two rows of scores are kept in memory.  The buffers are
+kept in a workspace object that can be reused for many alignments, which is how alignMany()
+avoids allocating memory for each alignment.
 
 The code has also been thoroughly tested to ensure that it does not leak memory.
 """
@@ -25,11 +29,500 @@ The code has also been thoroughly tested to ensure that it does not leak memory.
 
 
 # Declarations for the C stdlib dynamic memory functions.
-cdef extern from 'stdlib.h':
+cdef extern from 'stdlib.h' nogil:
     void* malloc(size_t size)
     void* calloc(size_t size1, size_t size2)
     void* free(void* ptr)
 
+cdef extern from 'string.h' nogil:
+    void* memcpy(void* dest, void* src, size_t n)
+    void* memset(void* ptr, int value, size_t n)
+
+
+import banding
+import batch
+
+
+# The maximum number of distinct symbols in the substitution score matrix.
+DEF MAX_CODES = 32
+
+# The code used to mark characters that are not in the substitution matrix.
+DEF INVALID_CODE = 255
+
+# The score used to mark unreachable cells (the same as banding.UNREACHABLE).
+DEF UNREACHABLE = -(1 << 30)
+
+# The workspace buffers.  Each alignment mode uses the matrix buffer and, if
+# needed, the auxiliary buffers for its scores and traceback pointers, and the
+# traceback results are collected in the traceback buffer.
+DEF BUF_MATRIX = 0
+DEF BUF_AUX1 = 1
+DEF BUF_AUX2 = 2
+DEF BUF_TRACEBACK = 3
+DEF NUM_BUFFERS = 4
+
+
+cdef class _AlignmentInput:
+    """
+    Holds the encoded sequences and the flat substitution score table for one
+    alignment.
+    """
+    cdef bytes seq1, seq2
+    cdef bytes seq1codes, seq2codes
+    cdef int seq1len, seq2len
+    cdef int subst[MAX_CODES * MAX_CODES]
+
+    def __init__(self, obj):
+        self.seq1 = _toBytes(obj.seq1)
+        self.seq2 = _toBytes(obj.seq2)
+        self.seq1len = len(self.seq1)
+        self.seq2len = len(self.seq2)
+
+        symbols = sorted(obj.svals.keys())
+        if len(symbols) > MAX_CODES:
+            raise ValueError('The substitution score matrix contains too many symbols.')
+
+        transtable = [chr(INVALID_CODE)] * 256
+        for code1, symbol1 in enumerate(symbols):
+            transtable[ord(symbol1)] = chr(code1)
+            for code2, symbol2 in enumerate(symbols):
+                self.subst[code1 * MAX_CODES + code2] = obj.svals[symbol1][symbol2]
+        transtable = ''.join(transtable)
+
+        self.seq1codes = self.seq1.translate(transtable)
+        self.seq2codes = self.seq2.translate(transtable)
+
+        # As with dictionary lookups, only report invalid characters if they
+        # would actually be used by the alignment.
+        if (self.seq1len > 0) and (self.seq2len > 0):
+            for seq, codes in ((self.seq1, self.seq1codes), (self.seq2, self.seq2codes)):
+                index = codes.find(chr(INVALID_CODE))
+                if index >= 0:
+                    raise KeyError(seq[index])
+
+cdef class _Workspace:
+    """
+    Holds the scratch buffers for alignments.  A buffer is only reallocated if
+    an alignment needs more memory than it has, so a workspace that is reused
+    for many alignments quickly stops allocating memory.
+    """
+    cdef void* buffers[NUM_BUFFERS]
+    cdef size_t sizes[NUM_BUFFERS]
+
+    def __cinit__(self):
+        cdef int cnt
+        for cnt in range(NUM_BUFFERS):
+            self.buffers[cnt] = NULL
+            self.sizes[cnt] = 0
+
+    def __dealloc__(self):
+        cdef int cnt
+        for cnt in range(NUM_BUFFERS):
+            free(self.buffers[cnt])
+
+    cdef void* getBuffer(self, int which, size_t size) except NULL:
+        """
+        Returns a buffer with room for at least size bytes.  The contents of the
+        buffer are undefined.
+        """
+        if size > self.sizes[which] or self.buffers[which] == NULL:
+            free(self.buffers[which])
+            self.sizes[which] = 0
+            self.buffers[which] = malloc(max(size, 1))
+            if not self.buffers[which]:
+                raise MemoryError('Unable to malloc() alignment data structures.')
+            self.sizes[which] = size
+
+        return self.buffers[which]
+
+    def reserve(self, int seq1len, int seq2len, lowmemory):
+        """
+        Allocates the buffers for aligning sequences of up to the given lengths
+        without a band.  (Banded alignments always need less memory.)
+        """
+        cdef size_t rowlen = seq2len + 1
+        cdef int blocksize
+
+        if lowmemory:
+            blocksize = _getBlockSize(seq1len)
+            self.getBuffer(BUF_MATRIX, (_getNumBlocks(seq1len, blocksize) + 3) * rowlen * sizeof(int))
+            self.getBuffer(BUF_AUX1, blocksize * rowlen * sizeof(char))
+        else:
+            self.getBuffer(BUF_MATRIX, _getFullMatrixSize(seq1len, seq2len))
+        self.getBuffer(BUF_AUX1, (seq1len + 1) * sizeof(Py_ssize_t))
+        self.getBuffer(BUF_AUX2, 2 * rowlen * sizeof(int))
+        self.getBuffer(BUF_TRACEBACK, _getTracebackSize(seq1len, seq2len))
+
+cdef inline size_t _getFullMatrixSize(int seq1len, int seq2len):
+    # Four rows of scores and the traceback matrix without row 0.
+    cdef size_t rowlen = seq2len + 1
+    return 4 * rowlen * sizeof(int) + seq1len * rowlen * sizeof(char)
+
+cdef inline int _getBlockSize(int seq1len):
+    return int(seq1len ** 0.5) + 1
+
+cdef inline int _getNumBlocks(int seq1len, int blocksize):
+    return (seq1len + blocksize - 1) / blocksize
+
+cdef inline size_t _getTracebackSize(int seq1len, int seq2len):
+    # Two index arrays and two aligned sequences of up to seq1len + seq2len.
+    cdef size_t maxlen = seq1len + seq2len + 1
+    return maxlen * (2 * sizeof(int) + 2 * sizeof(char))
+
+cdef bytes _toBytes(seq):
+    if isinstance(seq, unicode):
+        try:
+            return seq.encode('ascii')
+        except UnicodeEncodeError as err:
+            raise KeyError(seq[err.start])
+    else:
+        return seq
+
+
+cdef void _fillRows(
+    const unsigned char* seq1, int seq1len, const unsigned char* seq2, int seq2len,
+    const int* subst, int gapp, const int* startrow, int* endrow, int* work1,
+    int* work2, int firstrow, int lastrow, char* tracebk
+) nogil:
+    """
+    Calculates the scores for the rows firstrow to lastrow of the alignment
+    matrix, given the scores for the preceding row in startrow.  If endrow is
+    not NULL, the scores for the last row are copied to it.  work1 and work2 are
+    used to store the intermediate rows.  If tracebk is not NULL, the
+    directional pointers for row i are saved in tracebk starting at
+    (i - firstrow) * (seq2len + 1).
+    """
+    cdef int rowlen = seq2len + 1
+    cdef int i, j, sdiag, sup, sleft, upgapp
+    cdef const int* prevrow = startrow
+    cdef const int* substrow
+    cdef int* currow = work1
+    cdef char* rowtb = NULL
+    cdef char direc
+
+    for i in range(firstrow, lastrow + 1):
+        substrow = subst + seq1[i-1] * MAX_CODES
+        if tracebk != NULL:
+            rowtb = tracebk + (i - firstrow) * rowlen
+            rowtb[0] = c'l'
+
+        # do not assess a penalty for end gaps in the last row
+        if i == seq1len:
+            upgapp = 0
+        else:
+            upgapp = gapp
+
+        # Column 0 is the free leading end gap.
+        currow[0] = 0
+        for j in range(1, rowlen):
+            # calculate the maximum subscores for this position
+            sdiag = prevrow[j-1] + substrow[seq2[j-1]]
+            sup = currow[j-1] + upgapp
+            sleft = prevrow[j]
+            # do not assess a penalty for end gaps in the last column
+            if j != seq2len:
+                sleft += gapp
+            # record maximum subscore and direction
+            if (sdiag >= sup) and (sdiag >= sleft):
+                currow[j] = sdiag
+                direc = c'd'
+            elif sup >= sleft:
+                currow[j] = sup
+                direc = c'u'
+            else:
+                currow[j] = sleft
+                direc = c'l'
+            if rowtb != NULL:
+                rowtb[j] = direc
+
+        prevrow = currow
+        if currow == work1:
+            currow = work2
+        else:
+            currow = work1
+
+    if endrow != NULL:
+        memcpy(endrow, prevrow, rowlen * sizeof(int))
+
+cdef bint _calcScore(
+    const unsigned char* seq1, int seq1len, const unsigned char* seq2, int seq2len,
+    const int* subst, int gapp, int maxscore, bint useminscore, int minscore,
+    int* rows, int* score
+) nogil:
+    """
+    Calculates the score of an optimal alignment, one row of the alignment
+    matrix at a time, and saves it in score.  rows must have room for four
+    rows of scores.  If useminscore is true, the calculation stops and 0 is
+    returned as soon as the score cannot reach minscore; otherwise, 1 is
+    returned.
+    """
+    cdef int rowlen = seq2len + 1
+    cdef int* prevrow = rows
+    cdef int* currow = rows + rowlen
+    cdef int* tmprow
+    cdef int i, j, rowmax
+
+    memset(prevrow, 0, rowlen * sizeof(int))
+    for i in range(1, seq1len + 1):
+        _fillRows(
+            seq1, seq1len, seq2, seq2len, subst, gapp, prevrow, currow,
+            rows + 2 * rowlen, rows + 3 * rowlen, i, i, NULL
+        )
+        # If gaps are not rewarded, the rest of any path can gain at most
+        # maxscore for each remaining row.
+        if useminscore and (gapp <= 0):
+            rowmax = currow[0]
+            for j in range(1, rowlen):
+                if currow[j] > rowmax:
+                    rowmax = currow[j]
+            if rowmax + maxscore * (seq1len - i) < minscore:
+                return 0
+
+        tmprow = prevrow
+        prevrow = currow
+        currow = tmprow
+
+    score[0] = prevrow[seq2len]
+    if useminscore and (score[0] < minscore):
+        return 0
+
+    return 1
+
+cdef inline void _getBandRow(
+    int i, int lo, int hi, int seq1len, int seq2len, int* start, int* end
+) nogil:
+    """
+    Gets the first and last columns of row i that are searched by a banded
+    alignment.  The last row is searched all the way to the end because of the
+    free end gaps.
+    """
+    start[0] = min(max(1, i + lo), seq2len)
+    if i == seq1len:
+        end[0] = seq2len
+    else:
+        end[0] = min(i + hi, seq2len)
+
+cdef int _fillBand(
+    const unsigned char* seq1, int seq1len, const unsigned char* seq2, int seq2len,
+    const int* subst, int gapp, int lo, int hi, int maxscore, int* bound,
+    int* prevrow, int* currow, char* tracebk, const Py_ssize_t* rowbase
+) nogil:
+    """
+    Calculates the scores for the cells of the alignment matrix in the band of
+    diagonals from lo to hi and returns the banded alignment score.  prevrow
+    and currow must each have room for a full row of scores.  The directional
+    pointer for cell (i, j) is saved in tracebk[rowbase[i] + j].  bound must be
+    initialized with the bound for paths that start outside of the band, and it
+    is updated with the bounds for paths that leave the band (see banding.py).
+    """
+    cdef int unreachable = UNREACHABLE
+    cdef int i, j, start, end, prevstart, prevend, sdiag, sup, sleft, exitscore
+    cdef const int* substrow
+    cdef int* tmprow
+    cdef char* rowtb
+
+    # The two rows of scores span the full width of the matrix, but only the
+    # cells from the column just before the band to the end of the band are
+    # used.  Row 0 and column 0 are the free leading end gaps, so they all have
+    # a score of 0.
+    for j in range(seq2len + 1):
+        prevrow[j] = 0
+    prevstart = 1
+    prevend = seq2len
+
+    for i in range(1, seq1len + 1):
+        _getBandRow(i, lo, hi, seq1len, seq2len, &start, &end)
+        substrow = subst + seq1[i-1] * MAX_CODES
+        rowtb = tracebk + rowbase[i]
+
+        if start == 1:
+            currow[0] = 0
+        else:
+            currow[start - 1] = unreachable
+
+        for j in range(start, end + 1):
+            # calculate the maximum subscores for this position
+            if j - 1 <= prevend:
+                sdiag = prevrow[j-1] + substrow[seq2[j-1]]
+            else:
+                sdiag = unreachable
+            if j <= prevend:
+                sleft = prevrow[j] + gapp
+            else:
+                sleft = unreachable
+            sup = currow[j-1] + gapp
+            # do not assess a penalty for end gaps
+            if j == seq2len:
+                sleft -= gapp
+            if i == seq1len:
+                sup -= gapp
+            # record maximum subscore and direction
+            if (sdiag >= sup) and (sdiag >= sleft):
+                rowtb[j] = c'd'
+                currow[j] = sdiag
+            elif (sup >= sdiag) and (sup >= sleft):
+                rowtb[j] = c'u'
+                currow[j] = sup
+            else:
+                rowtb[j] = c'l'
+                currow[j] = sleft
+
+        # Update the bound with the paths that leave the band from this row by
+        # a gap from either edge of the band.
+        if i < seq1len:
+            j = i + hi
+            if (j >= start) and (j < seq2len):
+                exitscore = currow[j] + gapp + maxscore * min(seq1len - i, seq2len - j - 1)
+                if exitscore > bound[0]:
+                    bound[0] = exitscore
+            j = i + lo
+            if (j >= start) and (j <= end) and (j < seq2len):
+                exitscore = currow[j] + gapp + maxscore * min(seq1len - i - 1, seq2len - j)
+                if exitscore > bound[0]:
+                    bound[0] = exitscore
+
+        tmprow = prevrow
+        prevrow = currow
+        currow = tmprow
+        prevstart = start
+        prevend = max(end, start - 1)
+
+    return prevrow[seq2len]
+
+cdef void _tracePath(
+    const char* seq1, const char* seq2, const char* tracebk,
+    const Py_ssize_t* rowbase, Py_ssize_t rowlen, int rowoffset, int stoprow,
+    int* pos, char* aligned1, char* aligned2, int* indexes1, int* indexes2,
+    int* alignlen
+) nogil:
+    """
+    Follows the directional pointers in a traceback matrix, starting from the
+    matrix cell (pos[0], pos[1]), until the traceback reaches the row stoprow.
+    If stoprow is 0, the traceback continues to the start of the matrix.  The
+    aligned bases and sequence indexes are appended, in reverse order, to the
+    output arrays starting at alignlen[0], and the final position and alignment
+    length are saved in pos and alignlen.  The pointer for cell (i, j) is in
+    tracebk[(i - rowoffset) * rowlen + j] or, if rowbase is not NULL, in
+    tracebk[rowbase[i - rowoffset] + j].  Row 0 and column 0 are never
+    accessed.
+    """
+    cdef int i = pos[0]
+    cdef int j = pos[1]
+    cdef int cnt = alignlen[0]
+    cdef char direc
+
+    while (i > stoprow) or ((i == 0) and (j > 0)):
+        if i == 0:
+            direc = c'u'
+        elif j == 0:
+            direc = c'l'
+        elif rowbase == NULL:
+            direc = tracebk[(i - rowoffset) * rowlen + j]
+        else:
+            direc = tracebk[rowbase[i - rowoffset] + j]
+
+        if direc == c'd':
+            aligned1[cnt] = seq1[i-1]
+            aligned2[cnt] = seq2[j-1]
+            indexes1[cnt] = i-1
+            indexes2[cnt] = j-1
+            i -= 1
+            j -= 1
+        elif direc == c'u':
+            aligned1[cnt] = c'-'
+            aligned2[cnt] = seq2[j-1]
+            indexes1[cnt] = -1
+            indexes2[cnt] = j-1
+            j -= 1
+        else:
+            aligned1[cnt] = seq1[i-1]
+            aligned2[cnt] = c'-'
+            indexes1[cnt] = i-1
+            indexes2[cnt] = -1
+            i -= 1
+        cnt += 1
+
+    pos[0] = i
+    pos[1] = j
+    alignlen[0] = cnt
+
+
+cdef class _Traceback:
+    """
+    Collects the results of a traceback, in the traceback buffer of a
+    workspace, and saves them in a PairwiseAlignment object.
+    """
+    cdef _AlignmentInput data
+    cdef _Workspace workspace
+    cdef const char* seq1
+    cdef const char* seq2
+    cdef char* aligned1
+    cdef char* aligned2
+    cdef int* indexes1
+    cdef int* indexes2
+    cdef int alignlen
+    cdef int pos[2]
+
+    def __cinit__(self, _AlignmentInput data, _Workspace workspace):
+        cdef int maxlen = data.seq1len + data.seq2len + 1
+        self.data = data
+        self.workspace = workspace
+        self.seq1 = data.seq1
+        self.seq2 = data.seq2
+        self.indexes1 = <int*>workspace.getBuffer(
+            BUF_TRACEBACK, _getTracebackSize(data.seq1len, data.seq2len)
+        )
+        self.indexes2 = self.indexes1 + maxlen
+        self.aligned1 = <char*>(self.indexes2 + maxlen)
+        self.aligned2 = self.aligned1 + maxlen
+        self.alignlen = 0
+        self.pos[0] = data.seq1len
+        self.pos[1] = data.seq2len
+
+    cdef void trace(
+        self, const char* tracebk, const Py_ssize_t* rowbase, Py_ssize_t rowlen,
+        int rowoffset, int stoprow
+    ) nogil:
+        _tracePath(
+            self.seq1, self.seq2, tracebk, rowbase, rowlen, rowoffset,
+            stoprow, self.pos, self.aligned1, self.aligned2, self.indexes1,
+            self.indexes2, &self.alignlen
+        )
+
+    cdef saveAlignment(self, obj):
+        cdef int cnt, tmp
+        cdef int length = self.alignlen
+        cdef int seq1gv = -1
+        cdef int seq2gv = -1
+
+        # Reverse the results of the traceback.
+        for cnt in range(length / 2):
+            self.aligned1[cnt], self.aligned1[length - cnt - 1] = self.aligned1[length - cnt - 1], self.aligned1[cnt]
+            self.aligned2[cnt], self.aligned2[length - cnt - 1] = self.aligned2[length - cnt - 1], self.aligned2[cnt]
+            tmp = self.indexes1[cnt]
+            self.indexes1[cnt] = self.indexes1[length - cnt - 1]
+            self.indexes1[length - cnt - 1] = tmp
+            tmp = self.indexes2[cnt]
+            self.indexes2[cnt] = self.indexes2[length - cnt - 1]
+            self.indexes2[length - cnt - 1] = tmp
+
+        # go through the sequence indexes and mark the gaps with (-nextbaseindex - 1)
+        # so that the index lookups return a more informative value
+        for cnt in range(length):
+            if self.indexes1[cnt] == -1:
+                self.indexes1[cnt] = seq1gv
+            else:
+                seq1gv -= 1
+            if self.indexes2[cnt] == -1:
+                self.indexes2[cnt] = seq2gv
+            else:
+                seq2gv -= 1
+
+        obj.seq1aligned = self.aligned1[:length]
+        obj.seq2aligned = self.aligned2[:length]
+        obj.seq1indexed = [self.indexes1[cnt] for cnt in range(length)]
+        obj.seq2indexed = [self.indexes2[cnt] for cnt in range(length)]
+
 
 
 class PairwiseAlignment:
@@ -56,6 +549,15 @@ class PairwiseAlignment:
         # Define the gap penalty.
         self.gapp = -6
 
+        # The band width for banded alignments; 0 means "do not use a band".
+        self.bandwidth = 0
+        self.band = None
+
+        self.lowmemory = False
+
+        # The scratch buffers to reuse for alignments, if any (see alignMany()).
+        self.workspace = None
+
         self.seq1 = ''
         self.seq2 = ''
 
@@ -72,6 +574,21 @@ class PairwiseAlignment:
     def getGapPenalty(self):
         return self.gapp
 
+    def setBandWidth(self, bandwidth):
+        self.bandwidth = bandwidth
+
+    def getBandWidth(self):
+        return self.bandwidth
+
+    def getAlignmentBand(self):
+        return self.band
+
+    def setLowMemory(self, lowmemory):
+        self.lowmemory = lowmemory
+
+    def getLowMemory(self):
+        return self.lowmemory
+
     def setSequences(self, sequence1, sequence2):
         self.seq1 = sequence1
         self.seq2 = sequence2
@@ -88,138 +605,237 @@ class PairwiseAlignment:
     def getAlignmentScore(self):
         return self.score
 
+    def alignMany(self, pairs, gap_penalty=None, numthreads=1):
+        """
+        Aligns many sequence pairs at once.  See pyalign.py for details.  Each
+        worker thread reuses one set of buffers that are sized for the longest
+        sequences, and the alignments run in parallel because they do not hold
+        the global interpreter lock.
+        """
+        return batch.alignMany(self, pairs, gap_penalty, numthreads)
+
+    def calcAlignmentScore(self, minscore=None):
+        """
+        Calculates the score of an optimal alignment without the traceback.  See
+        pyalign.py for details.
+        """
+        cdef _AlignmentInput data = _AlignmentInput(self)
+        cdef _Workspace workspace = self.workspace
+        if workspace is None:
+            workspace = _Workspace()
+
+        cdef int seq1len = data.seq1len
+        cdef int seq2len = data.seq2len
+        cdef int gapp = self.gapp
+        cdef int maxscore = max(banding.getMaxSubstitutionScore(self.svals), 0)
+        cdef bint useminscore = minscore is not None
+        cdef int cminscore = minscore if useminscore else 0
+        cdef int score
+        cdef bint found
+        cdef const unsigned char* seq1codes = <const unsigned char*><char*>data.seq1codes
+        cdef const unsigned char* seq2codes = <const unsigned char*><char*>data.seq2codes
+        cdef int* rows = <int*>workspace.getBuffer(BUF_MATRIX, 4 * (seq2len + 1) * sizeof(int))
+
+        with nogil:
+            found = _calcScore(
+                seq1codes, seq1len, seq2codes, seq2len, data.subst, gapp,
+                maxscore, useminscore, cminscore, rows, &score
+            )
+
+        if found:
+            return score
+        else:
+            return None
+
+    def _newWorker(self, maxseq1len, maxseq2len):
+        worker = PairwiseAlignment()
+        worker.svals = self.svals
+        worker.gapp = self.gapp
+        worker.bandwidth = self.bandwidth
+        worker.lowmemory = self.lowmemory
+        worker.workspace = _Workspace()
+        worker.workspace.reserve(maxseq1len, maxseq2len, self.lowmemory)
+
+        return worker
+
     def doAlignment(self):
         """
-        Implements the Needleman-Wunsch pairwise sequence alignment algorithm.
-        Most of the implementation is in C (using Cython).  2D C arrays (arrays
-        of arrays) are dynamically allocated for the score and traceback matrices.
-        All of the core algorithm should run as "pure" C, except for lookups to the
-        substitution cost matrix.
+        Calculates an optimal alignment of the two sequences, using a banded
+        alignment if possible.  See pyalign.py for details.
         """
-        cdef int seq1len = len(self.seq1)
-        cdef int seq2len = len(self.seq2)
+        self.band = None
+        data = _AlignmentInput(self)
+        if self.workspace is not None:
+            workspace = self.workspace
+        else:
+            workspace = _Workspace()
 
-        # 1st subscript = sequence 1,
-        # 2nd subscript = sequence 2
-        cdef int cnt
-    
-        cdef int** scores
-        cdef char** tracebk
-    
-        # allocate the 2D scores array, initialized to all zeros
-        scores = <int**>malloc((seq1len + 1) * sizeof(int*));
-        if not scores:
-            raise MemoryError('Unable to malloc() alignment data structures.')
-        for cnt in range(seq1len + 1):
-            scores[cnt] = <int*>calloc(seq2len + 1, sizeof(int));
-            if not scores[cnt]:
-                raise MemoryError('Unable to calloc() alignment data structures.')
-        
-        # allocate the 2D traceback array
-        tracebk = <char**>malloc((seq1len + 1) * sizeof(char*));
-        if not tracebk:
-            raise MemoryError('Unable to malloc() alignment data structures.')
-        for cnt in range(seq1len + 1):
-            tracebk[cnt] = <char*>calloc(seq2len + 1, sizeof(char));
-            if not tracebk[cnt]:
-                raise MemoryError('Unable to malloc() alignment data structures.')
-    
-        # initialize the traceback matrix
-        for cnt in range(1, seq1len+1):
-            tracebk[cnt][0] = 'l'
-        for cnt in range(1, seq2len+1):
-            tracebk[0][cnt] = 'u'
-        #print tracebk
-        
-        cdef int i, j, sdiag, sup, sleft
+        # Banded alignments can only be proven optimal if gaps are not rewarded.
+        if self.gapp <= 0:
+            band = banding.getAlignmentBand(self.seq1, self.seq2, self.bandwidth)
+            maxscore = banding.getMaxSubstitutionScore(self.svals)
+            while band is not None:
+                isoptimal, bandscore = self._doBandedAlignment(
+                    data, workspace, band[0], band[1], maxscore
+                )
+                if isoptimal:
+                    self.band = band
+                    return
+                band = banding.getWiderBand(
+                    len(self.seq1), len(self.seq2), band, bandscore, maxscore
+                )
+
+        if self.lowmemory:
+            self._doCheckpointedAlignment(data, workspace)
+        else:
+            self._doFullAlignment(data, workspace)
+
+    def _doFullAlignment(self, _AlignmentInput data, _Workspace workspace):
+        """
+        Implements the Needleman-Wunsch pairwise sequence alignment algorithm.
+        The traceback matrix is a single contiguous buffer, and only two rows of
+        scores are kept in memory.
+        """
+        cdef int seq1len = data.seq1len
+        cdef int seq2len = data.seq2len
+        cdef Py_ssize_t rowlen = seq2len + 1
         cdef int gapp = self.gapp
+        cdef int score
+        cdef const unsigned char* seq1codes = <const unsigned char*><char*>data.seq1codes
+        cdef const unsigned char* seq2codes = <const unsigned char*><char*>data.seq2codes
 
-        # calculate the scores for the alignment matrix and directional
-        # pointers for the traceback matrix
-        for i in range(1, seq1len+1):
-            for j in range(1, seq2len+1):
-                # calculate the maximum subscores for this position
-                sdiag = scores[i-1][j-1] + self.svals[self.seq1[i-1]][self.seq2[j-1]]
-                sup = scores[i][j-1] + gapp
-                sleft = scores[i-1][j] + gapp
-                # do not assess a penalty for end gaps
-                if j == seq2len:
-                    sleft -= gapp
-                if i == seq1len:
-                    sup -= gapp
-                # record maximum subscore and direction
-                if (sdiag >= sup) and (sdiag >= sleft):
-                    tracebk[i][j] = 'd'
-                    scores[i][j] = sdiag
-                elif (sup >= sdiag) and (sup >= sleft):
-                    tracebk[i][j] = 'u'
-                    scores[i][j] = sup
-                else:
-                    tracebk[i][j] = 'l'
-                    scores[i][j] = sleft
-
-        self.score = scores[seq1len][seq2len]
-        
-        # follow the directional pointers in the traceback matrix
-        # to generate an optimal alignment
-        seq1a = list()
-        seq2a = list()
-        seq1aindex = list()
-        seq2aindex = list()
-        i = seq1len
-        j = seq2len
-        while (i > 0) or (j > 0):
-            if tracebk[i][j] == 'd':
-                seq1a.append(self.seq1[i-1])
-                seq2a.append(self.seq2[j-1])
-                seq1aindex.append(i-1)
-                seq2aindex.append(j-1)
-                i -= 1
-                j -= 1
-            elif tracebk[i][j] == 'u':
-                seq1a.append('-')
-                seq2a.append(self.seq2[j-1])
-                seq1aindex.append(-1)
-                seq2aindex.append(j-1)
-                j -= 1
-            else:
-                seq1a.append(self.seq1[i-1])
-                seq2a.append('-')
-                seq1aindex.append(i-1)
-                seq2aindex.append(-1)
-                i -= 1
-        
-        seq1a.reverse()
-        seq2a.reverse()
-        seq1aindex.reverse()
-        seq2aindex.reverse()
-        self.seq1aligned = ''.join(seq1a)
-        self.seq2aligned = ''.join(seq2a)
-        self.seq1indexed = seq1aindex
-        self.seq2indexed = seq2aindex
-
-        # free the memory for the 2D scores array
-        for cnt in range(seq1len + 1):
-            free(scores[cnt]);
-        free(scores);
-        
-        # free the memory for the 2D traceback array
-        for cnt in range(seq1len + 1):
-            free(tracebk[cnt]);
-        free(tracebk);
+        # The traceback matrix (which does not need row 0) and the score rows
+        # (starting with row 0 of the score matrix) share one buffer.
+        cdef int* startrow = <int*>workspace.getBuffer(
+            BUF_MATRIX, _getFullMatrixSize(seq1len, seq2len)
+        )
+        cdef int* endrow = startrow + rowlen
+        cdef int* work1 = endrow + rowlen
+        cdef int* work2 = work1 + rowlen
+        cdef char* tracebk = <char*>(work2 + rowlen)
 
-        # go through the sequence indexes and mark the gaps with (-nextbaseindex - 1)
-        # so that the index lookups return a more informative value
-        seq1gv = seq2gv = -1
-        for cnt in range(len(self.seq1indexed)):
-            if self.seq1indexed[cnt] == -1:
-                self.seq1indexed[cnt] = seq1gv
-            else:
-                seq1gv -= 1
-            if self.seq2indexed[cnt] == -1:
-                self.seq2indexed[cnt] = seq2gv
+        traceback = _Traceback(data, workspace)
+        with nogil:
+            memset(startrow, 0, rowlen * sizeof(int))
+            _fillRows(
+                seq1codes, seq1len, seq2codes, seq2len, data.subst, gapp,
+                startrow, endrow, work1, work2, 1, seq1len, tracebk
+            )
+            if seq1len > 0:
+                score = endrow[seq2len]
             else:
-                seq2gv -= 1
+                score = 0
+            traceback.trace(tracebk, NULL, rowlen, 1, 0)
+
+        self.score = score
+        traceback.saveAlignment(self)
+
+    def _doCheckpointedAlignment(self, _AlignmentInput data, _Workspace workspace):
+        """
+        Calculates a full alignment in O(m * sqrt(n)) memory by saving the
+        scores for the last row of each block of rows and recalculating the
+        traceback pointers for one block at a time.  See pyalign.py for details.
+        """
+        cdef int seq1len = data.seq1len
+        cdef int seq2len = data.seq2len
+        cdef int blocksize = _getBlockSize(seq1len)
+        cdef int numblocks = _getNumBlocks(seq1len, blocksize)
+        cdef Py_ssize_t rowlen = seq2len + 1
+        cdef int gapp = self.gapp
+        cdef int blocknum, firstrow, lastrow
+        cdef const unsigned char* seq1codes = <const unsigned char*><char*>data.seq1codes
+        cdef const unsigned char* seq2codes = <const unsigned char*><char*>data.seq2codes
+
+        # checkpoints contains the scores for the rows blocknum * blocksize.
+        cdef int* checkpoints = <int*>workspace.getBuffer(
+            BUF_MATRIX, (numblocks + 3) * rowlen * sizeof(int)
+        )
+        cdef char* blockdata = <char*>workspace.getBuffer(
+            BUF_AUX1, blocksize * rowlen * sizeof(char)
+        )
+        cdef int* work1 = checkpoints + (numblocks + 1) * rowlen
+        cdef int* work2 = work1 + rowlen
+
+        traceback = _Traceback(data, workspace)
+        with nogil:
+            memset(checkpoints, 0, rowlen * sizeof(int))
+            for blocknum in range(numblocks):
+                firstrow = blocknum * blocksize + 1
+                lastrow = min(firstrow + blocksize - 1, seq1len)
+                _fillRows(
+                    seq1codes, seq1len, seq2codes, seq2len, data.subst, gapp,
+                    checkpoints + blocknum * rowlen,
+                    checkpoints + (blocknum + 1) * rowlen, work1, work2,
+                    firstrow, lastrow, NULL
+                )
+
+            # Recalculate the traceback pointers for each block and follow them
+            # to the start of the block.
+            for blocknum in range(numblocks - 1, -1, -1):
+                firstrow = blocknum * blocksize + 1
+                lastrow = min(firstrow + blocksize - 1, seq1len)
+                _fillRows(
+                    seq1codes, seq1len, seq2codes, seq2len, data.subst, gapp,
+                    checkpoints + blocknum * rowlen, NULL, work1, work2,
+                    firstrow, lastrow, blockdata
+                )
+                traceback.trace(blockdata, NULL, rowlen, firstrow, firstrow - 1)
+
+            # Finish any leading end gap in row 0.
+            traceback.trace(NULL, NULL, rowlen, 0, 0)
+
+        self.score = checkpoints[numblocks * rowlen + seq2len]
+
+        traceback.saveAlignment(self)
+
+    def _doBandedAlignment(
+        self, _AlignmentInput data, _Workspace workspace, int lo, int hi, int maxscore
+    ):
+        """
+        Calculates an alignment using only the cells of the alignment matrix in
+        the band of diagonals from lo to hi.  Returns a tuple containing a flag
+        that indicates whether the banded alignment is provably optimal and the
+        banded alignment score.  The alignment results are only updated if the
+        banded alignment is optimal.  See pyalign.py for details.
+        """
+        cdef int seq1len = data.seq1len
+        cdef int seq2len = data.seq2len
+        cdef int gapp = self.gapp
+        cdef int i, start, end, bandscore
+        cdef Py_ssize_t tbsize = 0
+        cdef const unsigned char* seq1codes = <const unsigned char*><char*>data.seq1codes
+        cdef const unsigned char* seq2codes = <const unsigned char*><char*>data.seq2codes
+
+        # The best possible score of any path that leaves the band.
+        cdef int bound = banding.getOutsideBandBound(seq1len, seq2len, lo, hi, maxscore)
+
+        # The traceback matrix only covers the band, so the pointer for cell
+        # (i, j) is at rowbase[i] + j.
+        cdef Py_ssize_t* rowbase = <Py_ssize_t*>workspace.getBuffer(
+            BUF_AUX1, (seq1len + 1) * sizeof(Py_ssize_t)
+        )
+        for i in range(1, seq1len + 1):
+            _getBandRow(i, lo, hi, seq1len, seq2len, &start, &end)
+            rowbase[i] = tbsize - start
+            if end >= start:
+                tbsize += end - start + 1
+
+        cdef int* rows = <int*>workspace.getBuffer(BUF_AUX2, 2 * (seq2len + 1) * sizeof(int))
+        cdef char* tracebk = <char*>workspace.getBuffer(BUF_MATRIX, tbsize * sizeof(char))
+
+        traceback = _Traceback(data, workspace)
+        with nogil:
+            bandscore = _fillBand(
+                seq1codes, seq1len, seq2codes, seq2len, data.subst, gapp, lo,
+                hi, maxscore, &bound, rows, rows + seq2len + 1, tracebk, rowbase
+            )
+            if bandscore >= bound:
+                traceback.trace(tracebk, rowbase, 0, 0, 0)
+
+        if bandscore < bound:
+            return (False, bandscore)
 
-        #print self.seq1indexed
+        self.score = bandscore
+        traceback.saveAlignment(self)
 
+        return (True, bandscore)
@@ -0,0 +1,257 @@
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+A NumPy implementation of PairwiseAlignment for systems on which the compiled C
+module is not available.
+
+The alignment matrix is calculated one row at a time with vector operations.
+The diagonal and left subscores of a row only depend on the previous row, so
+they can be calculated for the whole row at once.  The up subscores depend on
+the cells to their left in the same row, but the recurrence
+
+    score[j] = max(a[j], score[j-1] + gapp)
+
+(where a[j] is the larger of the diagonal and left subscores) is equivalent to
+
+    score[j] - j * gapp = max(a[j] - j * gapp, score[j-1] - (j-1) * gapp),
+
+which is a running maximum that NumPy can calculate in a single pass.  Once the
+scores of a row are known, the up subscores follow from them, and the
+directional pointers are chosen with the same tie-breaking order (diagonal, up,
+left) and the same end gap handling as the other implementations, so all
+implementations produce identical alignments.
+"""
+
+import numpy
+
+import pyalign
+import banding
+
+
+# The directional pointers, as byte values.
+_DIAG = ord('d')
+_UP = ord('u')
+_LEFT = ord('l')
+
+
+class PairwiseAlignment(pyalign.PairwiseAlignment):
+    """
+    Calculates pairwise alignments with NumPy vector operations.  This class
+    supports all of the alignment modes of the Python implementation, and the
+    results are identical.
+    """
+    def doAlignment(self):
+        self._encodeSequences()
+        try:
+            pyalign.PairwiseAlignment.doAlignment(self)
+        finally:
+            self.seq1codes = self.profile = self.gapoffsets = None
+
+    def calcAlignmentScore(self, minscore=None):
+        seq1len = len(self.seq1)
+        seq2len = len(self.seq2)
+        maxscore = max(banding.getMaxSubstitutionScore(self.svals), 0)
+
+        self._encodeSequences()
+        try:
+            prevrow = numpy.zeros(seq2len + 1, dtype=numpy.int64)
+            currow = numpy.empty(seq2len + 1, dtype=numpy.int64)
+            for i in range(1, seq1len + 1):
+                self._fillRow(i, 1, seq2len, prevrow, currow)
+                prevrow, currow = currow, prevrow
+                # See pyalign.py.
+                if (minscore is not None) and (self.gapp <= 0):
+                    if prevrow.max() + maxscore * (seq1len - i) < minscore:
+                        return None
+        finally:
+            self.seq1codes = self.profile = self.gapoffsets = None
+
+        score = int(prevrow[seq2len])
+        if (minscore is not None) and (score < minscore):
+            return None
+
+        return score
+
+    def _encodeSequences(self):
+        """
+        Prepares the integer codes of sequence 1 and the "profile" of sequence
+        2: a matrix in which row k contains the substitution scores of the k-th
+        nucleotide code against each base of sequence 2.  Raises a KeyError for
+        invalid nucleotide codes.
+        """
+        codes = sorted(self.svals.keys())
+        subst = numpy.array(
+            [[self.svals[code1][code2] for code2 in codes] for code1 in codes],
+            dtype=numpy.int64
+        )
+
+        if (len(self.seq1) > 0) and (len(self.seq2) > 0):
+            codeindexes = dict([(code, index) for index, code in enumerate(codes)])
+            self.seq1codes = [codeindexes[base] for base in self.seq1]
+            seq2codes = numpy.array(
+                [codeindexes[base] for base in self.seq2], dtype=numpy.intp
+            )
+            self.profile = subst[:, seq2codes]
+        else:
+            # There is nothing to align, so the scores are never used.
+            self.seq1codes = [0] * len(self.seq1)
+            self.profile = numpy.zeros((1, len(self.seq2)), dtype=numpy.int64)
+
+        # The multiples of the gap penalty for the running maximum calculations.
+        self.gapoffsets = numpy.arange(len(self.seq2) + 1, dtype=numpy.int64) * self.gapp
+
+    def _fillRow(self, i, start, end, prevrow, currow):
+        """
+        Calculates the scores in row i of the alignment matrix for the columns
+        from start to end, given the scores for the preceding row, and returns
+        the directional pointers for the row's columns as a string.  Both rows
+        must span the entire width of the matrix.  The cell just before start
+        in currow is the row's boundary: it is 0 if start is 1 (the free leading
+        end gap) and unreachable otherwise.
+        """
+        seq1len = len(self.seq1)
+        seq2len = len(self.seq2)
+        gapp = self.gapp
+        # do not assess a penalty for end gaps
+        if i == seq1len:
+            upgapp = 0
+        else:
+            upgapp = gapp
+
+        if start == 1:
+            currow[0] = 0
+        else:
+            currow[start-1] = banding.UNREACHABLE
+        if end < start:
+            return ''
+
+        sdiag = prevrow[start-1:end] + self.profile[self.seq1codes[i-1], start-1:end]
+        sleft = prevrow[start:end+1] + gapp
+        if end == seq2len:
+            sleft[-1] -= gapp
+
+        # Calculate the scores as a running maximum (see the module docstring).
+        segment = currow[start-1:end+1]
+        numpy.maximum(sdiag, sleft, segment[1:])
+        if upgapp != 0:
+            offsets = self.gapoffsets[:end - start + 2]
+            segment -= offsets
+            numpy.maximum.accumulate(segment, out=segment)
+            segment += offsets
+        else:
+            numpy.maximum.accumulate(segment, out=segment)
+
+        # record the direction of each maximum subscore
+        sup = segment[:-1] + upgapp
+        rowtb = numpy.where(
+            (sdiag >= sup) & (sdiag >= sleft), _DIAG,
+            numpy.where(sup >= sleft, _UP, _LEFT)
+        ).astype(numpy.uint8)
+
+        return rowtb.tostring()
+
+    def _fillRows(self, prevrow, firstrow, lastrow, tracebk):
+        seq2len = len(self.seq2)
+
+        prevrow = numpy.array(prevrow, dtype=numpy.int64)
+        currow = numpy.empty(seq2len + 1, dtype=numpy.int64)
+        for i in range(firstrow, lastrow + 1):
+            rowtb = self._fillRow(i, 1, seq2len, prevrow, currow)
+            if tracebk is not None:
+                # Column 0 is the free leading end gap.
+                tracebk.append('l' + rowtb)
+            prevrow, currow = currow, prevrow
+
+        return prevrow
+
+    def _doFullAlignment(self):
+        seq1len = len(self.seq1)
+        seq2len = len(self.seq2)
+
+        tracebk = []
+        row = self._fillRows(numpy.zeros(seq2len + 1, dtype=numpy.int64), 1, seq1len, tracebk)
+        self.score = int(row[seq2len])
+
+        def direction(i, j):
+            if i == 0:
+                return 'u'
+            else:
+                return tracebk[i - 1][j]
+
+        self._traceback(direction)
+
+    def _doBandedAlignment(self, lo, hi):
+        seq1len = len(self.seq1)
+        seq2len = len(self.seq2)
+        gapp = self.gapp
+        maxscore = banding.getMaxSubstitutionScore(self.svals)
+
+        # The best possible score of any path that leaves the band.
+        bound = banding.getOutsideBandBound(seq1len, seq2len, lo, hi, maxscore)
+
+        # The cells of each row outside of the band are unreachable, except for
+        # row 0, which is the free leading end gap.  The bands of later rows
+        # never end before the band of the row that previously used the same
+        # buffer, so the buffers only have to be cleared once.
+        rowstarts = [0] * (seq1len + 1)
+        tracebk = [''] * (seq1len + 1)
+        prevrow = numpy.zeros(seq2len + 1, dtype=numpy.int64)
+        currow = numpy.empty(seq2len + 1, dtype=numpy.int64)
+        currow.fill(banding.UNREACHABLE)
+        for i in range(1, seq1len + 1):
+            # The last row is searched all the way to the end because of the
+            # free end gaps.
+            start = min(max(1, i + lo), seq2len)
+            if i == seq1len:
+                end = seq2len
+            else:
+                end = min(i + hi, seq2len)
+
+            tracebk[i] = self._fillRow(i, start, end, prevrow, currow)
+            rowstarts[i] = start
+
+            # Update the bound with the paths that leave the band from this row
+            # (see pyalign.py).
+            if i < seq1len:
+                j = i + hi
+                if (j >= start) and (j < seq2len):
+                    bound = max(bound, int(currow[j]) + gapp
+                            + maxscore * min(seq1len - i, seq2len - j - 1))
+                j = i + lo
+                if (j >= start) and (j <= end) and (j < seq2len):
+                    bound = max(bound, int(currow[j]) + gapp
+                            + maxscore * min(seq1len - i - 1, seq2len - j))
+
+            prevrow, currow = currow, prevrow
+            if i == 1:
+                currow.fill(banding.UNREACHABLE)
+
+        score = int(prevrow[seq2len])
+        if score < bound:
+            return (False, score)
+
+        self.score = score
+
+        def direction(i, j):
+            if i == 0:
+                return 'u'
+            elif j == 0:
+                return 'l'
+            else:
+                return tracebk[i][j - rowstarts[i]]
+
+        self._traceback(direction)
+
+        return (True, self.score)
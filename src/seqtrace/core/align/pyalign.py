@@ -14,6 +14,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import banding
+import batch
+
+import math
+from array import array
+
+
 class PairwiseAlignment:
     """
     Provides the ability to calculate an optimal, global, pairwise alignment of two
@@ -28,6 +35,20 @@ class PairwiseAlignment:
     literature) are penalized exactly the same as gaps.  The reasoning is the same:  mismatches in
     the alignment, like gaps, do not represent anything biologically real and are all simply
     sequencing mistakes.  Therefore, they should be weighted the same.
+
+    If a band width is set, the alignment is first calculated using only a band of
+    diagonals around the alignment diagonal estimated from shared k-mers, which is
+    much faster for long, overlapping sequences such as forward and reverse reads.
+    If the banded alignment cannot be proven to be optimal, the full alignment is
+    calculated instead.
+
+    In low-memory mode, full alignments only keep the scores for every k-th row of
+    the alignment matrix (where k is about the square root of the length of the
+    first sequence) and recalculate the traceback pointers for one block of k rows
+    at a time during the traceback.  This reduces the memory required for the
+    alignment matrices from O(nm) to O(m * sqrt(n)), which makes it possible to
+    align reads to long reference sequences, at the cost of calculating the
+    matrices twice.  The results are identical to those of a normal alignment.
     """
     def __init__(self):
         # Define the substitution score matrix.  This matrix includes all IUPAC DNA
@@ -60,6 +81,12 @@ class PairwiseAlignment:
         # The penalty for any gap (except the end gaps) is the same as a base mismatch.
         self.gapp = -6
 
+        # The band width for banded alignments; 0 means "do not use a band".
+        self.bandwidth = 0
+        self.band = None
+
+        self.lowmemory = False
+
         self.seq1 = ''
         self.seq2 = ''
 
@@ -76,6 +103,33 @@ class PairwiseAlignment:
     def getGapPenalty(self):
         return self.gapp
 
+    def setBandWidth(self, bandwidth):
+        """
+        Sets the number of diagonals on either side of the estimated alignment
+        diagonal to search in a banded alignment.  A band width of 0 disables
+        banded alignments.
+        """
+        self.bandwidth = bandwidth
+
+    def getBandWidth(self):
+        return self.bandwidth
+
+    def getAlignmentBand(self):
+        """
+        Returns the band of diagonals, (lo, hi), that was used for the most
+        recent alignment, or None if the full alignment matrix was calculated.
+        """
+        return self.band
+
+    def setLowMemory(self, lowmemory):
+        """
+        Enables or disables low-memory (checkpointed) full alignments.
+        """
+        self.lowmemory = lowmemory
+
+    def getLowMemory(self):
+        return self.lowmemory
+
     def setSequences(self, sequence1, sequence2):
         self.seq1 = sequence1
         self.seq2 = sequence2
@@ -92,7 +146,86 @@ class PairwiseAlignment:
     def getAlignmentScore(self):
         return self.score
 
+    def alignMany(self, pairs, gap_penalty=None, numthreads=1):
+        """
+        Aligns each sequence pair, (sequence1, sequence2), in the list pairs
+        and returns a list that contains the tuple (seq1aligned, seq2aligned,
+        seq1indexed, seq2indexed) for each pair.  The alignments use the
+        settings of this object, except that gap_penalty, if it is not None,
+        replaces the gap penalty.  If numthreads is greater than 1, the pairs
+        are divided among that many worker threads.  The sequences and results
+        of this object are not changed.
+        """
+        return batch.alignMany(self, pairs, gap_penalty, numthreads)
+
+    def calcAlignmentScore(self, minscore=None):
+        """
+        Calculates the score of an optimal alignment of the two sequences
+        without the traceback, which only requires one row of scores at a time.
+        If minscore is not None and the score is less than minscore, None is
+        returned instead.  In that case, the calculation stops as soon as no
+        path through the rest of the alignment matrix can reach minscore, which
+        makes it cheap to rule out alignments that are not good enough.  The
+        aligned sequences and score of this object are not changed.
+        """
+        seq1len = len(self.seq1)
+        seq2len = len(self.seq2)
+        maxscore = max(banding.getMaxSubstitutionScore(self.svals), 0)
+
+        row = [0] * (seq2len + 1)
+        for i in range(1, seq1len + 1):
+            row = self._fillRows(row, i, i, None)
+            # If gaps are not rewarded, the rest of any path can gain at most
+            # maxscore for each remaining row.
+            if (minscore is not None) and (self.gapp <= 0):
+                if max(row) + maxscore * (seq1len - i) < minscore:
+                    return None
+
+        score = int(row[seq2len])
+        if (minscore is not None) and (score < minscore):
+            return None
+
+        return score
+
+    def _newWorker(self, maxseq1len, maxseq2len):
+        """
+        Returns a new alignment object with the same settings as this object
+        for aligning sequences of up to the given lengths in alignMany().
+        """
+        worker = self.__class__()
+        worker.svals = self.svals
+        worker.gapp = self.gapp
+        worker.bandwidth = self.bandwidth
+        worker.lowmemory = self.lowmemory
+
+        return worker
+
     def doAlignment(self):
+        """
+        Calculates an optimal alignment of the two sequences, using a banded
+        alignment if possible.
+        """
+        self.band = None
+
+        # Banded alignments can only be proven optimal if gaps are not rewarded.
+        if self.gapp <= 0:
+            band = banding.getAlignmentBand(self.seq1, self.seq2, self.bandwidth)
+            maxscore = banding.getMaxSubstitutionScore(self.svals)
+            while band is not None:
+                isoptimal, bandscore = self._doBandedAlignment(band[0], band[1])
+                if isoptimal:
+                    self.band = band
+                    return
+                band = banding.getWiderBand(
+                    len(self.seq1), len(self.seq2), band, bandscore, maxscore
+                )
+
+        if self.lowmemory:
+            self._doCheckpointedAlignment()
+        else:
+            self._doFullAlignment()
+
+    def _doFullAlignment(self):
         """ Implements the Needleman-Wunsch pairwise sequence alignment algorithm. """
 
         seq1len = len(self.seq1)
@@ -135,6 +268,206 @@ class PairwiseAlignment:
 
         self.score = scores[seq1len][seq2len]
         
+        self._traceback(lambda i, j: tracebk[i][j])
+
+    def _fillRows(self, prevrow, firstrow, lastrow, tracebk):
+        """
+        Calculates the scores for the rows firstrow to lastrow of the alignment
+        matrix, given the scores for the preceding row, and returns the scores for
+        the last row.  If tracebk is not None, the directional pointers for each
+        row are appended to it as a string.
+        """
+        seq1len = len(self.seq1)
+        seq2len = len(self.seq2)
+        gapp = self.gapp
+
+        for i in range(firstrow, lastrow + 1):
+            # Column 0 is the free leading end gap.
+            currow = [0]
+            rowtb = ['l']
+            for j in range(1, seq2len+1):
+                # calculate the maximum subscores for this position
+                sdiag = prevrow[j-1] + self.svals[self.seq1[i-1]][self.seq2[j-1]]
+                sup = currow[j-1] + gapp
+                sleft = prevrow[j] + gapp
+                # do not assess a penalty for end gaps
+                if j == seq2len:
+                    sleft -= gapp
+                if i == seq1len:
+                    sup -= gapp
+                # record maximum subscore and direction
+                if (sdiag >= sup) and (sdiag >= sleft):
+                    rowtb.append('d')
+                    currow.append(sdiag)
+                elif (sup >= sdiag) and (sup >= sleft):
+                    rowtb.append('u')
+                    currow.append(sup)
+                else:
+                    rowtb.append('l')
+                    currow.append(sleft)
+
+            if tracebk is not None:
+                tracebk.append(''.join(rowtb))
+            prevrow = currow
+
+        return prevrow
+
+    def _doCheckpointedAlignment(self):
+        """
+        Calculates a full alignment in O(m * sqrt(n)) memory.  The first pass
+        through the alignment matrix only saves the scores for the last row of
+        each block of rows.  The traceback pointers for each block are then
+        recalculated, starting from the saved scores of the preceding block, when
+        the traceback reaches the block.
+        """
+        seq1len = len(self.seq1)
+        seq2len = len(self.seq2)
+        blocksize = int(math.sqrt(seq1len)) + 1
+
+        # checkpoints[b] contains the scores for row b * blocksize.
+        row = [0] * (seq2len + 1)
+        checkpoints = [array('i', row)]
+        for firstrow in range(1, seq1len + 1, blocksize):
+            row = self._fillRows(row, firstrow, min(firstrow + blocksize - 1, seq1len), None)
+            checkpoints.append(array('i', row))
+
+        self.score = row[seq2len]
+
+        # The number and directional pointers of the current block.
+        block = [-1, None]
+
+        def direction(i, j):
+            if i == 0:
+                return 'u'
+
+            blocknum = (i - 1) / blocksize
+            if block[0] != blocknum:
+                firstrow = blocknum * blocksize + 1
+                tracebk = []
+                self._fillRows(
+                    checkpoints[blocknum], firstrow,
+                    min(firstrow + blocksize - 1, seq1len), tracebk
+                )
+                block[0] = blocknum
+                block[1] = tracebk
+
+            return block[1][i - 1 - blocknum * blocksize][j]
+
+        self._traceback(direction)
+
+    def _doBandedAlignment(self, lo, hi):
+        """
+        Calculates an alignment using only the cells of the alignment matrix in
+        the band of diagonals from lo to hi (see banding.py).  Returns a tuple
+        containing a flag that indicates whether the banded alignment is provably
+        optimal and the banded alignment score.  The alignment results are only
+        updated if the banded alignment is optimal.
+        """
+        seq1len = len(self.seq1)
+        seq2len = len(self.seq2)
+        gapp = self.gapp
+        maxscore = banding.getMaxSubstitutionScore(self.svals)
+        unreachable = banding.UNREACHABLE
+
+        # The best possible score of any path that leaves the band.
+        bound = banding.getOutsideBandBound(seq1len, seq2len, lo, hi, maxscore)
+
+        # Each row of the traceback matrix only covers the columns from
+        # rowstarts[i] to the end of the row's band.  Each row of scores also
+        # includes the column just before the band.  Row 0 and column 0 are the
+        # free leading end gaps, so they all have a score of 0.
+        rowstarts = [0] * (seq1len + 1)
+        tracebk = [''] * (seq1len + 1)
+        prevrow = [0] * (seq2len + 1)
+        prevstart = 1
+        for i in range(1, seq1len + 1):
+            # The last row is searched all the way to the end because of the
+            # free end gaps.
+            start = min(max(1, i + lo), seq2len)
+            if i == seq1len:
+                end = seq2len
+            else:
+                end = min(i + hi, seq2len)
+
+            if start == 1:
+                currow = [0]
+            else:
+                currow = [unreachable]
+            prevlen = len(prevrow)
+            rowtb = []
+            for j in range(start, end + 1):
+                # calculate the maximum subscores for this position
+                k = j - prevstart
+                if k + 1 < prevlen:
+                    sdiag = prevrow[k] + self.svals[self.seq1[i-1]][self.seq2[j-1]]
+                    sleft = prevrow[k + 1] + gapp
+                elif k < prevlen:
+                    sdiag = prevrow[k] + self.svals[self.seq1[i-1]][self.seq2[j-1]]
+                    sleft = unreachable
+                else:
+                    # Only the end of the last row can be beyond the previous
+                    # row's band.
+                    sdiag = sleft = unreachable
+                sup = currow[-1] + gapp
+                # do not assess a penalty for end gaps
+                if j == seq2len:
+                    sleft -= gapp
+                if i == seq1len:
+                    sup -= gapp
+                # record maximum subscore and direction
+                if (sdiag >= sup) and (sdiag >= sleft):
+                    rowtb.append('d')
+                    currow.append(sdiag)
+                elif (sup >= sdiag) and (sup >= sleft):
+                    rowtb.append('u')
+                    currow.append(sup)
+                else:
+                    rowtb.append('l')
+                    currow.append(sleft)
+
+            # Update the bound with the paths that leave the band from this row
+            # by a gap from either edge of the band.  After leaving, a path can
+            # gain at most maxscore for each remaining pair of bases.
+            if i < seq1len:
+                j = i + hi
+                if (j >= start) and (j < seq2len):
+                    bound = max(bound, currow[j - start + 1] + gapp
+                            + maxscore * min(seq1len - i, seq2len - j - 1))
+                j = i + lo
+                if (j >= start) and (j <= end) and (j < seq2len):
+                    bound = max(bound, currow[j - start + 1] + gapp
+                            + maxscore * min(seq1len - i - 1, seq2len - j))
+
+            rowstarts[i] = start
+            tracebk[i] = ''.join(rowtb)
+            prevrow = currow
+            prevstart = start
+
+        if prevrow[-1] < bound:
+            return (False, prevrow[-1])
+
+        self.score = prevrow[-1]
+
+        def direction(i, j):
+            if i == 0:
+                return 'u'
+            elif j == 0:
+                return 'l'
+            else:
+                return tracebk[i][j - rowstarts[i]]
+
+        self._traceback(direction)
+
+        return (True, self.score)
+
+    def _traceback(self, direction):
+        """
+        Follows the directional pointers in a traceback matrix, given as a
+        function of the matrix indices, to generate an optimal alignment.
+        """
+        seq1len = len(self.seq1)
+        seq2len = len(self.seq2)
+
         # follow the directional pointers in the traceback matrix
         # to generate an optimal alignment
         seq1a = list()
@@ -144,14 +477,15 @@ class PairwiseAlignment:
         i = seq1len
         j = seq2len
         while (i > 0) or (j > 0):
-            if tracebk[i][j] == 'd':
+            dirc = direction(i, j)
+            if dirc == 'd':
                 seq1a.append(self.seq1[i-1])
                 seq2a.append(self.seq2[j-1])
                 seq1aindex.append(i-1)
                 seq2aindex.append(j-1)
                 i -= 1
                 j -= 1
-            elif tracebk[i][j] == 'u':
+            elif dirc == 'u':
                 seq1a.append('-')
                 seq2a.append(self.seq2[j-1])
                 seq1aindex.append(-1)
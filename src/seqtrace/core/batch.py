@@ -0,0 +1,250 @@
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Batch processing of sequencing projects without the GUI.  None of the modules
+used here import Gtk, so batch jobs can run on machines without a display.
+"""
+
+from seqtrace.core import seqwriter
+from seqtrace.core.consens import ConsensSeqSettings
+from seqtrace.core.fwdrev import FwdRevMatchIter, RegexFwdRevMatchIter
+from seqtrace.core.seqgenerator import ConsensusGenerator, GenerationJob
+from seqtrace.core.stproject_io import SeqTraceProjReader, ProjectItemData
+
+import os
+import os.path
+import re
+import time
+
+
+# The file name extensions of the trace files found in trace directories.
+TRACE_FILE_EXTENSIONS = ('.ab1', '.scf', '.ztr')
+
+
+class BatchError(Exception):
+    pass
+
+
+def _newFileItem(name, is_reverse):
+    item = ProjectItemData()
+    item.setName(name)
+    item.setItemType('file')
+    item.setIsReverse(is_reverse)
+
+    return item
+
+def readTraceDirectory(dirpath, fwd_str='_F', rev_str='_R', pattern=None):
+    """
+    Finds the trace files in a directory and pairs matching forward and
+    reverse files, in the same way as a project does when all of its files are
+    associated.  If pattern is provided, it is a regular expression that
+    describes the file naming scheme (see RegexFwdRevMatchIter).  Returns a
+    list of project items (see ProjectItemData), sorted by name, in which each
+    pair of matching files is a forward/reverse group.  File names are
+    relative to dirpath.
+    """
+    try:
+        fnames = sorted(os.listdir(dirpath))
+    except OSError as err:
+        raise BatchError('The directory "' + dirpath + '" could not be read: ' + err.strerror)
+
+    fileitems = []
+    for fname in fnames:
+        if os.path.splitext(fname)[1].lower() not in TRACE_FILE_EXTENSIONS:
+            continue
+        if not(os.path.isfile(os.path.join(dirpath, fname))):
+            continue
+
+        # Files are forward reads unless they match the reverse search string.
+        fileitems.append(_newFileItem(fname, fname.find(rev_str) != -1))
+
+    # The items are matched from last to first, so reverse them to match the
+    # files in order of their names.
+    if pattern is None:
+        matchiter = FwdRevMatchIter(reversed(fileitems), fwd_str, rev_str)
+    else:
+        try:
+            matchiter = RegexFwdRevMatchIter(reversed(fileitems), pattern, fwd_str, rev_str)
+        except (re.error, ValueError) as err:
+            raise BatchError('The file name pattern "' + pattern + '" is not valid: ' + str(err))
+
+    items = []
+    matched = set()
+    for fwditem, revitem, sharedname in matchiter:
+        fwditem.setIsReverse(False)
+        revitem.setIsReverse(True)
+        matched.update((fwditem.getName(), revitem.getName()))
+
+        group = ProjectItemData()
+        group.setName(sharedname)
+        group.setItemType('frwdrev')
+        group.setChildren(fwditem, revitem)
+        items.append(group)
+
+    # Add the files that were not matched.
+    items.extend([item for item in fileitems if item.getName() not in matched])
+    items.sort(key=lambda item: item.getName())
+
+    for index, item in enumerate(items):
+        item.setId(index)
+
+    return items
+
+def readProjectFile(filename):
+    """
+    Reads the items of a project file.  Returns a tuple of the project items
+    (see ProjectItemData), the project's consensus sequence settings, and the
+    absolute path of the project's trace file directory.
+    """
+    reader = SeqTraceProjReader()
+    reader.readFile(filename)
+
+    tracedir = os.path.abspath(
+        os.path.join(os.path.dirname(os.path.abspath(filename)), reader.getProperty('trace_file_dir'))
+    )
+    items = list(reader)
+
+    return (items, reader.getConsensSeqSettings(), tracedir)
+
+
+class BatchPipeline:
+    """
+    Generates the consensus sequences for a list of project items and exports
+    them to a sequence file.  Each item moves through the stages parse (loading
+    the trace files), consensus (aligning the forward and reverse traces and
+    calculating the consensus sequence), and write.  The first two stages run
+    in worker processes (see ConsensusGenerator), which discard the traces as
+    soon as an item is finished, so only the consensus sequences are kept in
+    memory.  The time spent in each stage is recorded for getTimingReport().
+    """
+    def __init__(self, settings=None, tracedir='.', numworkers=None, cachedir=''):
+        if settings is None:
+            settings = ConsensSeqSettings()
+
+        self.settings = settings
+        self.tracedir = tracedir
+        # Only the compact consensus sequences are exported, so the primers
+        # only need to be aligned if they might be trimmed.
+        self.generator = ConsensusGenerator(
+            settings, numworkers, cachedir, cache_traces=False, align_all_primers=False
+        )
+
+        self.errors = []
+        self.seqcnt = 0
+        self.stagetimes = {'parse': 0.0, 'consensus': 0.0, 'write': 0.0}
+        self.walltime = 0.0
+
+    def getErrors(self):
+        """
+        Returns a list of (file path, error message) tuples for the trace files
+        that could not be loaded.  The error message is None if the file could
+        not be opened.
+        """
+        return self.errors
+
+    def getNumSequences(self):
+        return self.seqcnt
+
+    def getStageTimes(self):
+        return self.stagetimes
+
+    def getWallTime(self):
+        return self.walltime
+
+    def _getJobs(self, items):
+        for item in items:
+            if item.isFile():
+                fileitems = (item,)
+            else:
+                fileitems = item.getChildren()
+            if len(fileitems) == 0:
+                continue
+
+            tracefiles = [
+                (os.path.join(self.tracedir, fileitem.getName()), fileitem.getIsReverse())
+                for fileitem in fileitems
+            ]
+            yield GenerationJob(item.getId(), tracefiles)
+
+    def run(self, items, outfile, file_format=seqwriter.FORMAT_FASTA, include_fnames=True):
+        """
+        Generates the consensus sequences for items and writes all sequences
+        that are marked for use to outfile, in the same way as exporting all
+        sequences from the main window.  Items for which a trace file cannot
+        be loaded keep their previous sequences, and their errors are recorded
+        (see getErrors()).
+        """
+        starttime = time.time()
+
+        sw = seqwriter.SequenceWriterFactory.getSequenceWriter(file_format)
+        try:
+            sw.open(outfile)
+        except IOError:
+            raise BatchError('The file "' + outfile + '" could not be opened for writing.')
+
+        itemsbyid = {}
+        for item in items:
+            itemsbyid[item.getId()] = item
+
+        for result in self.generator.generate(self._getJobs(items)):
+            self.stagetimes['parse'] += result.load_time
+            self.stagetimes['consensus'] += result.cons_time
+
+            if result.isError():
+                self.errors.append((result.error_path, result.error_msg))
+            else:
+                item = itemsbyid[result.jobid]
+                item.setConsensusSequence(result.compact_cons, result.full_cons)
+                item.setHasSequence(result.full_cons != '')
+                item.setUseSequence(result.full_cons != '')
+
+        writestart = time.time()
+        for item in items:
+            if item.getUseSequence():
+                if not(include_fnames):
+                    seqfname = ''
+                elif item.isFile():
+                    seqfname = item.getName()
+                else:
+                    children = item.getChildren()
+                    seqfname = children[0].getName() + ', ' + children[1].getName()
+
+                sw.addUnalignedSequence(item.getCompactConsSequence(), seqfname, item.getNotes())
+                self.seqcnt += 1
+
+        try:
+            sw.write()
+        except seqwriter.SequenceWriterError as err:
+            raise BatchError(str(err))
+
+        self.stagetimes['write'] += time.time() - writestart
+        self.walltime = time.time() - starttime
+
+    def getTimingReport(self):
+        """
+        Returns a summary of the wall-clock time and the time spent in each
+        stage.  The parse and consensus times are summed over all workers, so
+        with more than one worker, they can exceed the wall-clock time.
+        """
+        lines = [
+            'Sequences written: {0}'.format(self.seqcnt),
+            'Trace file errors: {0}'.format(len(self.errors)),
+            'Workers: {0}'.format(self.generator.getNumWorkers()),
+            'Wall-clock time: {0:.3f} s'.format(self.walltime)
+        ]
+        for stage in ('parse', 'consensus', 'write'):
+            lines.append('  {0:<10} {1:.3f} s'.format(stage + ':', self.stagetimes[stage]))
+
+        return '\n'.join(lines)
@@ -15,12 +15,63 @@
 
 
 from seqtrace.core.align import PairwiseAlignment
-import seqtrace.core.sequencetrace as sequencetrace
+from seqtrace.core.primerindex import PrimerIndex
+from seqtrace.core import qualmath
+from seqtrace.core.piecetable import PieceTable
 from observable import Observable
 
 import math
 import re
+import array
+import bisect
+import collections
 
+# NumPy is not required, but if it is available, it will be used to calculate
+# Bayesian consensus sequences with array operations.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# The band width to use for aligning forward and reverse traces.  Matching
+# forward and reverse reads overlap along a predictable diagonal of the
+# alignment matrix, so a banded alignment is much faster than a full alignment.
+# If the banded alignment cannot be proven optimal, the band is widened or a
+# full alignment is used, so the band width only affects the running time (and,
+# occasionally, which of several equally good alignments is chosen).
+FWDREV_BAND_WIDTH = 20
+
+
+def _buildBaseCodeTables():
+    """
+    Builds the lookup tables, indexed by character code, that the array-based
+    Bayesian consensus algorithm uses to convert base calls to nucleotide
+    probability distributions.  Returns the tuple (basemasks, calldivs,
+    errordivs, usable).  Row k of basemasks indicates which of the bases in
+    qualmath.DIST_BASES are represented by character k.  The probability of a
+    correct call is divided by calldivs[k] for each base that character k
+    represents and the error probability is divided by errordivs[k] for the
+    other bases (see qualmath.getBaseDist()).  usable[k] is True
+    if character k is a nucleotide code other than 'N'.
+    """
+    basemasks = numpy.zeros((256, 4), dtype=bool)
+    calldivs = numpy.ones(256)
+    errordivs = numpy.ones(256)
+    usable = numpy.zeros(256, dtype=bool)
+    for code, codebases in qualmath.CODE_BASES.iteritems():
+        usable[ord(code)] = True
+        calldivs[ord(code)] = len(codebases)
+        errordivs[ord(code)] = 4 - len(codebases)
+        for base in codebases:
+            basemasks[ord(code), qualmath.DIST_BASES.index(base)] = True
+
+    return (basemasks, calldivs, errordivs, usable)
+
+if numpy is not None:
+    _BASE_MASKS, _CALL_DIVS, _ERROR_DIVS, _USABLE_CODES = _buildBaseCodeTables()
+    _ERROR_PROBS_ARRAY = numpy.array(qualmath.ERROR_PROBS)
+    _BASE_CODES = numpy.frombuffer(''.join(qualmath.DIST_BASES), dtype=numpy.uint8)
 
 
 class ConsensSeqSettingsError(Exception):
@@ -48,6 +99,8 @@ class ConsensSeqSettings(Observable):
         # The primer sequences.
         self.fwdprimer = ''
         self.revprimer = ''
+        # The index of the primer sequences, which is built when it is needed.
+        self.primerindex = None
         # Settings for automatic quality trimming.
         self.do_qualitytrim = True
         self.autotrim_winsize = 10 
@@ -74,6 +127,7 @@ class ConsensSeqSettings(Observable):
         self.primermatch = settings.getPrimerMatchThreshold()
         self.fwdprimer = settings.getForwardPrimer()
         self.revprimer = settings.getReversePrimer()
+        self.primerindex = None
         self.do_qualitytrim = settings.getDoQualityTrim()
         self.autotrim_winsize = settings.getQualityTrimParams()[0]
         self.autotrim_basecnt = settings.getQualityTrimParams()[1]
@@ -202,6 +256,7 @@ class ConsensSeqSettings(Observable):
     def setForwardPrimer(self, primerseq):
         if self.fwdprimer != primerseq:
             self.fwdprimer = primerseq
+            self.primerindex = None
             self.notifyObservers('autotrim_change', ())
             self.notifySettingsChanged()
 
@@ -211,9 +266,21 @@ class ConsensSeqSettings(Observable):
     def setReversePrimer(self, primerseq):
         if self.revprimer != primerseq:
             self.revprimer = primerseq
+            self.primerindex = None
             self.notifyObservers('autotrim_change', ())
             self.notifySettingsChanged()
 
+    def getPrimerIndex(self):
+        """
+        Returns a PrimerIndex of the current primer sequences.  The index is
+        only rebuilt after the primers change, so all consensus sequence
+        builders that use these settings share the same index.
+        """
+        if self.primerindex is None:
+            self.primerindex = PrimerIndex(self.fwdprimer, self.revprimer)
+
+        return self.primerindex
+
 
 
 class ConsensSeqBuilderError(Exception):
@@ -226,6 +293,16 @@ class ConsensSeqBuilder:
     if only one sequence is provided, ConsensSeqBuilder can also perform
     finishing operations on the final sequence, such as automatic end
     quality trimming.
+
+    By default, the primers are always aligned to the trace sequences so that
+    the primer alignments can be displayed.  If align_all_primers is False, as
+    when sequences are generated in batch mode, the primers are only aligned if
+    they are going to be trimmed and a fast, score-only alignment shows that
+    they could match well enough to be trimmed.  The compact consensus sequence
+    is the same either way, but the full consensus sequence is not, because
+    aligning a primer can insert gaps into the trace alignment.  Full consensus
+    sequences that are stored in a project must therefore be built with
+    align_all_primers set to True.
     """
     # Define a few class attributes that will act as constants.
 
@@ -248,8 +325,9 @@ class ConsensSeqBuilder:
     # All valid nucleotide codes.
     allbases = ('A', 'T', 'G', 'C', 'W', 'S', 'M', 'K', 'R', 'Y', 'B', 'D', 'H', 'V', 'N')
 
-    def __init__(self, sequencetraces, settings=None):
+    def __init__(self, sequencetraces, settings=None, align_all_primers=True):
         self.numseqs = len(sequencetraces)
+        self.align_all_primers = align_all_primers
 
         # Define a list for the aligned trace sequences.
         self.alignedseqs = list()
@@ -275,6 +353,15 @@ class ConsensSeqBuilder:
         self.alignedseqs = [None] * self.numseqs
         self.seqindexes = [None] * self.numseqs
 
+        # The cached results of the stages of makeConsensusSequence(), along
+        # with the inputs and settings that each stage depends on.
+        self.readstage = None
+        self.primerstage = None
+        self.consstage = None
+
+        # The index of the consensus sequence for trimming.
+        self.consindex = None
+
         self.makeConsensusSequence()
 
     def getSettings(self):
@@ -288,55 +375,118 @@ class ConsensSeqBuilder:
             raise ConsensSeqBuilderError('The length of the supplied consensus sequence is invalid.')
 
     def makeConsensusSequence(self):
+        """
+        Builds the consensus sequence in four stages: aligning the forward and
+        reverse traces, aligning the primers, calculating the untrimmed
+        consensus sequence, and trimming it.  The results of the first three
+        stages are cached along with the trace sequences and the settings that
+        they depend on, and a stage is only repeated if these have changed
+        since the previous call, so that, for example, changing the minimum
+        confidence score does not repeat any alignments.  Trimming is always
+        repeated.
+        """
         min_confscore = self.settings.getMinConfScore()
+        haveprimers = (self.settings.getForwardPrimer() != '' and self.settings.getReversePrimer() != '')
+        trimprimers = self.settings.getTrimConsensus() and self.settings.getTrimPrimers()
 
         # Get the raw sequences and align the forward/reverse traces if we have both.
-        if self.numseqs == 2:
-            align = PairwiseAlignment()
-            align.setSequences(self.seqtraces[0].getBaseCalls(), self.seqtraces[1].getBaseCalls())
-            align.doAlignment()
-            self.alignedseqs[0], self.alignedseqs[1] = align.getAlignedSequences()
-            self.seqindexes[0], self.seqindexes[1] = align.getAlignedSeqIndexes()
-        else:
-            self.alignedseqs[0] = self.seqtraces[0].getBaseCalls()
-            self.seqindexes[0] = range(0, len(self.alignedseqs[0]))
+        basecalls = tuple([seqtrace.getBaseCalls() for seqtrace in self.seqtraces])
+        if (self.readstage is None) or (self.readstage[0] != basecalls):
+            if self.numseqs == 2:
+                align = PairwiseAlignment()
+                align.setBandWidth(FWDREV_BAND_WIDTH)
+                align.setSequences(basecalls[0], basecalls[1])
+                align.doAlignment()
+                alignedseqs = align.getAlignedSequences()
+                seqindexes = align.getAlignedSeqIndexes()
+            else:
+                alignedseqs = (basecalls[0],)
+                seqindexes = (range(0, len(basecalls[0])),)
+
+            self.readstage = (basecalls, alignedseqs, seqindexes)
+            self.primerstage = None
 
         # If we have primers, align them to the alignment or single sequence.
-        haveprimers = (self.settings.getForwardPrimer() != '' and self.settings.getReversePrimer() != '')
-        if haveprimers:
+        # The primer match threshold only matters if primers might be skipped.
+        doalign = haveprimers and (self.align_all_primers or trimprimers)
+        primerkey = (
+            doalign, self.settings.getForwardPrimer(), self.settings.getReversePrimer(),
+            None if self.align_all_primers else self.settings.getPrimerMatchThreshold()
+        )
+        if (self.primerstage is None) or (self.primerstage[0] != primerkey):
+            # Start from copies of the trace alignment, because aligning the
+            # primers can insert gaps.
+            self.alignedseqs = list(self.readstage[1])
+            self.seqindexes = [list(indexes) for indexes in self.readstage[2]]
+            self.alignedprimers = ''
+            if doalign:
+                if self.numseqs == 1:
+                    self.alignPrimerToSequence()
+                else:
+                    self.alignPrimersToAlignment()
+
+            self.primerstage = (
+                primerkey, list(self.alignedseqs),
+                [list(indexes) for indexes in self.seqindexes], self.alignedprimers
+            )
+            self.consstage = None
+        else:
+            self.alignedseqs = list(self.primerstage[1])
+            self.seqindexes = [list(indexes) for indexes in self.primerstage[2]]
+            self.alignedprimers = self.primerstage[3]
+
+        # Build the consensus sequence.
+        conskey = (min_confscore, self.settings.getConsensusAlgorithm())
+        if (self.consstage is None) or (self.consstage[0] != conskey):
             if self.numseqs == 1:
-                self.alignPrimerToSequence()
+                self.makeSingleConsensus(min_confscore)
             else:
-                self.alignPrimersToAlignment()
+                if self.settings.getConsensusAlgorithm() == 'Bayesian':
+                    self.makeBayesianConsensus(min_confscore)
+                else:
+                    self.makeLegacyConsensus(min_confscore)
 
-        # Build the consensus sequence.
-        if self.numseqs == 1:
-            self.makeSingleConsensus(min_confscore)
+            self.consstage = (conskey, self.consensus, list(self.consconf))
         else:
-            if self.settings.getConsensusAlgorithm() == 'Bayesian':
-                self.makeBayesianConsensus(min_confscore)
-            else:
-                self.makeLegacyConsensus(min_confscore)
+            self.consensus = self.consstage[1]
+            self.consconf = list(self.consstage[2])
 
-        # Do sequence trimming, if requested.
+        # Do sequence trimming, if requested.  Each kind of trimming only
+        # removes bases from the ends of the sequence, so the results are
+        # combined as the range of the consensus sequence to keep, and the
+        # trimmed sequence is only built once.
         if self.settings.getTrimConsensus():
-            if self.settings.getTrimPrimers() and haveprimers:
+            keeprange = (0, len(self.consensus) - 1)
+            if trimprimers and haveprimers:
                 if self.numseqs == 1:
-                    self.trimPrimerFromSequence()
+                    keeprange = self._intersectRanges(keeprange, self._getSequencePrimerTrimRange())
                 else:
-                    self.trimPrimersFromAlignment()
+                    keeprange = self._intersectRanges(keeprange, self._getAlignmentPrimerTrimRange())
 
-            if self.settings.getTrimEndGaps():
-                self.trimEndGaps()
+            if self.settings.getTrimEndGaps() and (self.numseqs == 2):
+                keeprange = self._intersectRanges(keeprange, self._getEndGapTrimRange())
 
             if self.settings.getDoQualityTrim():
                 winsize, basecnt = self.settings.getQualityTrimParams()
-                self.trimConsensus(winsize, basecnt)
+                keeprange = self._getQualityTrimRange(winsize, basecnt, keeprange)
+
+            self._applyTrimRange(keeprange)
 
     def makeBayesianConsensus(self, min_confscore):
         """
         Constructs a consensus sequence using Bayesian inference to assign base
-        probabilities to each position in the alignment.
+        probabilities to each position in the alignment.  If NumPy is
+        available, all alignment columns are processed at once with array
+        operations; otherwise, or if the alignment contains data that the array
+        implementation does not support, the columns are processed one at a
+        time.  Both implementations produce identical results.
+        """
+        if (numpy is None) or not(self._makeBayesianConsensusArrays(min_confscore)):
+            self._makeBayesianConsensusColumns(min_confscore)
+
+    def _makeBayesianConsensusColumns(self, min_confscore):
+        """
+        Implements makeBayesianConsensus() one alignment column at a time.
         """
         cons = list()
         consconf = list()
@@ -370,10 +520,15 @@ class ConsensSeqBuilder:
                 # Both traces have usable data, so calculate the posterior probability
                 # distribution of nucleotides using Bayes' Theorem, then determine the
                 # consensus base.
-                self.calcPosteriorBasePrDist(
-                        base1, self.seqtraces[0].getBaseCallConf(self.seqindexes[0][cnt]),
-                        base2, self.seqtraces[1].getBaseCallConf(self.seqindexes[1][cnt]), nppd)
-                cbase, cscore = self.getMostProbableBase(nppd)
+                score1 = self.seqtraces[0].getBaseCallConf(self.seqindexes[0][cnt])
+                score2 = self.seqtraces[1].getBaseCallConf(self.seqindexes[1][cnt])
+                if (base1 in qualmath.CODE_BASES) and (base2 in qualmath.CODE_BASES):
+                    # The results for each combination of base calls and
+                    # scores are cached, so this is usually a table lookup.
+                    cbase, cscore = qualmath.getConsensusCall(base1, score1, base2, score2)
+                else:
+                    self.calcPosteriorBasePrDist(base1, score1, base2, score2, nppd)
+                    cbase, cscore = self.getMostProbableBase(nppd)
             elif base1 not in ('-', 'N'):
                 # Only the first trace has usable data.
                 cbase = base1
@@ -415,6 +570,154 @@ class ConsensSeqBuilder:
         self.consensus = ''.join(cons)
         self.consconf = consconf
 
+    def _getConfScoreArray(self, seqnum):
+        """
+        Returns the base call confidence scores of trace seqnum as a NumPy
+        array, or None if the scores are not integers in the range of the
+        quality score tables.
+        """
+        confs = self.seqtraces[seqnum].getBaseCallConfs()
+        if len(confs) == 0:
+            return numpy.zeros(0, dtype=numpy.intp)
+
+        if isinstance(confs, array.array) and (confs.typecode in ('b', 'B', 'h', 'H')):
+            # 1-byte scores are always in range, and 2-byte scores only need
+            # to be checked.
+            confs = numpy.frombuffer(confs, dtype=numpy.dtype(confs.typecode))
+            if confs.itemsize == 1:
+                return confs.astype(numpy.intp)
+        else:
+            confs = numpy.array(confs)
+            if confs.dtype.kind not in ('i', 'u'):
+                return None
+
+        if (confs.min() < -qualmath.QUAL_OFFSET) or (confs.max() > qualmath.MAX_TABLE_QUAL):
+            return None
+
+        return confs.astype(numpy.intp)
+
+    def _makeBayesianConsensusArrays(self, min_confscore):
+        """
+        Implements makeBayesianConsensus() with NumPy array operations.  The
+        calculations are the same as those of qualmath.getConsensusCall() and
+        getGapFlankingScore(), done in the same
+        order, so the results are identical to those of the column-by-column
+        implementation.  Returns False, without changing the consensus
+        sequence, if the alignment contains a column that cannot be handled
+        exactly the same way: a character that is not a nucleotide code or a
+        gap, a non-integer or out-of-range confidence score, or a posterior
+        distribution for which the column-by-column calculations raise an
+        exception.
+        """
+        alignlen = len(self.alignedseqs[0])
+        for seq in self.alignedseqs:
+            if not(isinstance(seq, str)):
+                return False
+        codes = [numpy.frombuffer(seq, dtype=numpy.uint8) for seq in self.alignedseqs]
+        usable = [_USABLE_CODES[seqcodes] for seqcodes in codes]
+        gaps = [seqcodes == ord('-') for seqcodes in codes]
+        for seqnum in range(2):
+            if not(numpy.all(usable[seqnum] | gaps[seqnum] | (codes[seqnum] == ord('N')))):
+                return False
+
+        # Gather the confidence scores of the base calls in each alignment
+        # column, using the offset into the table of error probabilities.
+        confs = []
+        indexes = []
+        quals = []
+        for seqnum in range(2):
+            seqconfs = self._getConfScoreArray(seqnum)
+            if seqconfs is None:
+                return False
+            confs.append(seqconfs + qualmath.QUAL_OFFSET)
+            indexes.append(numpy.array(self.seqindexes[seqnum], dtype=numpy.intp))
+            seqquals = numpy.zeros(alignlen, dtype=numpy.intp)
+            seqquals[usable[seqnum]] = confs[seqnum][indexes[seqnum][usable[seqnum]]]
+            quals.append(seqquals)
+
+        both = usable[0] & usable[1]
+        only = [usable[0] & ~usable[1], usable[1] & ~usable[0]]
+        bothgaps = gaps[0] & gaps[1]
+
+        # Calculate the posterior nucleotide probability distributions of the
+        # columns in which both traces have usable data.  The first trace
+        # defines the prior distribution.
+        dists = []
+        for seqnum in range(2):
+            bothcodes = codes[seqnum][both]
+            eprobs = _ERROR_PROBS_ARRAY[quals[seqnum][both]]
+            dists.append(numpy.where(
+                _BASE_MASKS[bothcodes],
+                ((1 - eprobs) / _CALL_DIVS[bothcodes])[:, numpy.newaxis],
+                (eprobs / _ERROR_DIVS[bothcodes])[:, numpy.newaxis]
+            ))
+        joint = dists[1] * dists[0]
+        denom = ((joint[:, 0] + joint[:, 1]) + joint[:, 2]) + joint[:, 3]
+        if numpy.any(denom == 0):
+            return False
+        posterior = joint / denom[:, numpy.newaxis]
+
+        # Find the most probable bases and their Phred-type quality scores (see
+        # getMostProbableBase()).  numpy.argmax() returns the first of several
+        # equal maxima, which matches the tie-breaking order of A, T, G, C.
+        bestbases = numpy.argmax(posterior, axis=1)
+        bestprobs = posterior[numpy.arange(len(bestbases)), bestbases]
+        if numpy.any(bestprobs == 1.0):
+            return False
+        bothscores = numpy.zeros(len(bestprobs))
+        positive = bestprobs > 0
+        bothscores[positive] = -10.0 * numpy.log10(1.0 - bestprobs[positive])
+        bothscores += 0.000001
+
+        # Get the mean scores of the bases flanking the internal gaps in
+        # columns where only one trace has usable data (see
+        # getGapFlankingScore()).
+        positions = numpy.arange(alignlen)
+        internal = (positions >= self.getLeftEndGapStart()) & (positions <= self.getRightEndGapStart())
+        gapflankscores = numpy.empty(alignlen)
+        gapflankscores.fill(-1.0)
+        for seqnum in range(2):
+            other = 1 - seqnum
+            gapcols = only[seqnum] & internal & gaps[other]
+            if numpy.any(gapcols):
+                index1 = (indexes[other][gapcols] + 1) * -1 - 1
+                p1 = _ERROR_PROBS_ARRAY[confs[other][index1]]
+                p2 = _ERROR_PROBS_ARRAY[confs[other][index1 + 1]]
+                gapflankscores[gapcols] = -10 * numpy.log10((p1 + p2) / 2)
+
+        # Assemble the consensus sequence and quality scores.  Columns without
+        # usable data in either trace are 'N' with a score of 1.  The scores
+        # are kept as Python objects so that they have the same types as those
+        # of the column-by-column implementation.
+        cons = numpy.empty(alignlen, dtype=numpy.uint8)
+        cons.fill(ord('N'))
+        scores = numpy.ones(alignlen)
+        consconf = numpy.empty(alignlen, dtype=object)
+        consconf.fill(1)
+
+        cons[bothgaps] = ord(' ')
+        scores[bothgaps] = 0
+        consconf[bothgaps] = 0
+        for seqnum in range(2):
+            cons[only[seqnum]] = codes[seqnum][only[seqnum]]
+            onlyquals = quals[seqnum][only[seqnum]] - qualmath.QUAL_OFFSET
+            scores[only[seqnum]] = onlyquals
+            consconf[only[seqnum]] = onlyquals.tolist()
+        cons[both] = _BASE_CODES[bestbases]
+        scores[both] = bothscores
+        consconf[both] = bothscores.tolist()
+
+        # Replace low-quality bases with 'N', or delete them if they are
+        # spurious gaps.
+        lowqual = (scores < min_confscore) & (cons != ord(' '))
+        cons[lowqual] = ord('N')
+        cons[lowqual & (gapflankscores > min_confscore)] = ord(' ')
+
+        self.consensus = cons.tostring()
+        self.consconf = consconf.tolist()
+
+        return True
+
     def getGapFlankingScore(self, seqnum, pos):
         """
         Returns the log-adjusted mean score of the two bases flanking an
@@ -425,39 +728,17 @@ class ConsensSeqBuilder:
         index2 = index1 + 1
 
         # Calculate the mean quality score of the two flanking bases.
-        p1 = 10.0 ** (self.seqtraces[seqnum].getBaseCallConf(index1) / -10.0)
-        p2 = 10.0 ** (self.seqtraces[seqnum].getBaseCallConf(index2) / -10.0)
-
-        return -10 * math.log10((p1 + p2) / 2)
+        return qualmath.getMeanErrorScore(
+            self.seqtraces[seqnum].getBaseCallConf(index1),
+            self.seqtraces[seqnum].getBaseCallConf(index2)
+        )
 
     def getMostProbableBase(self, nppd):
         """
         This function determines the most probable base and calculates its associated
         Phred-type quality score from a nucleotide posterior probability distribution.
         """
-        # Find the base with the highest probability.
-        cbase = 'A'
-        for base in ('T', 'G', 'C'):
-            if nppd[base] > nppd[cbase]:
-                cbase = base
-
-        # Calculate the Phred-type quality score of the most probable base.
-        if nppd[cbase] > 0:
-            cscore = -10.0 * math.log10(1.0 - nppd[cbase])
-        else:
-            cscore = 0
-
-        # Add a very small quantity is added to the calculated confidence score to
-        # ensure that values very near the minimum confidence score are accepted.
-        # Without this, values that should be exactly equal to the minimum are sometimes
-        # incorrectly rejected due to rounding error.  An example of the problem is
-        # shown in the following line of code, which illustrates the calculations for
-        # an initial quality score of 30.  The expression should evaluate to 30, but
-        # instead equals 29.999999999.
-        #print -10.0 * math.log10(1.0 - (1 - 10.0 ** (30 / -10.0)))
-        cscore += 0.000001
-
-        return (cbase, cscore)
+        return qualmath.getMostProbableBase([nppd[base] for base in qualmath.DIST_BASES])
 
     def defineBasePrDist(self, basecall, score, distdict):
         """
@@ -466,35 +747,13 @@ class ConsensSeqBuilder:
         The argument "distdict" is expected to be a dictionary with elements
         indexed by 'A', 'T', 'G', and 'C'.
         """
-        # Calculate the error probability.
-        eprob = 10.0 ** (score / -10.0)
-
-        # Determine if we have a single base or an ambiguity code and handle
-        # each situation appropriately.
-        if basecall in self.bases:
-            # Fill in the probabilities for each base.
-            distdict[basecall] = 1 - eprob
-            for base in self.bases:
-                if base != basecall:
-                    distdict[base] = eprob / 3.0
-        elif basecall in self.bases2:
-            # We have a 2-base ambiguity code, so split the probability of
-            # a correct call between the two bases represented.
-            # First assign the error probability to all bases.
-            for base in self.bases:
-                distdict[base] = eprob / 2.0
-            # Then assign the correct call probabilities.
-            for base in self.bases2[basecall]:
-                distdict[base] = (1 - eprob) / 2.0
-        elif basecall in self.bases3:
-            # We have a 3-base ambiguity code, so split the probability of
-            # a correct call between the three bases represented.
-            # First assign the error probability to all bases.
-            for base in self.bases:
-                distdict[base] = eprob
-            # Then assign the correct call probabilities.
-            for base in self.bases3[basecall]:
-                distdict[base] = (1 - eprob) / 3.0
+        # The distributions are cached by qualmath, so this is usually a table
+        # lookup.  Base calls without a distribution ('N' and invalid codes)
+        # leave distdict unchanged.
+        dist = qualmath.getBaseDist(basecall, score)
+        if dist is not None:
+            for base, prob in zip(qualmath.DIST_BASES, dist):
+                distdict[base] = prob
 
     def calcPosteriorBasePrDist(self, base1, score1, base2, score2, distdict):
         """
@@ -605,23 +864,11 @@ class ConsensSeqBuilder:
         if self.numseqs == 1:
             return -1
 
-        lgindex = 0
-
-        # Move past any end positions where both trace sequences are gaps.
-        # This can happen when primers are aligned to the ends.
-        while lgindex < len(self.alignedseqs[0]) and self.alignedseqs[0][lgindex] == '-' and self.alignedseqs[1][lgindex] == '-':
-            lgindex += 1
-
-        # Check if both sequences were empty.
-        if lgindex == len(self.alignedseqs[0]):
-            return -1
-
-        if self.alignedseqs[0][lgindex] == '-':
-            while (lgindex < len(self.alignedseqs[0])) and (self.alignedseqs[0][lgindex] == '-'):
-                lgindex += 1
-        elif self.alignedseqs[1][lgindex] == '-':
-            while (lgindex < len(self.alignedseqs[0])) and (self.alignedseqs[1][lgindex] == '-'):
-                lgindex += 1
+        # Any end positions where both trace sequences are gaps (which can
+        # happen when primers are aligned to the ends) are skipped along with
+        # the end gap, so the end gap region ends after the longer of the two
+        # leading gaps.
+        lgindex = max([len(seq) - len(seq.lstrip('-')) for seq in self.alignedseqs])
 
         if lgindex == len(self.alignedseqs[0]):
             return -1
@@ -638,25 +885,10 @@ class ConsensSeqBuilder:
         if self.numseqs == 1:
             return -1
 
-        rgindex = len(self.alignedseqs[0]) - 1
-
-        # Move past any end positions where both trace sequences are gaps.
-        # This can happen when primers are aligned to the ends.
-        while rgindex >= 0 and self.alignedseqs[0][rgindex] == '-' and self.alignedseqs[1][rgindex] == '-':
-            rgindex -= 1
-
-        # Check if both sequences were empty.
-        if rgindex < 0:
-            return rgindex
-
-        if self.alignedseqs[0][rgindex] == '-':
-            while (rgindex >= 0) and (self.alignedseqs[0][rgindex] == '-'):
-                rgindex -= 1
-        elif self.alignedseqs[1][rgindex] == '-':
-            while (rgindex >= 0) and (self.alignedseqs[1][rgindex] == '-'):
-                rgindex -= 1
-
-        return rgindex
+        # As in getLeftEndGapStart(), the end gap region starts before the
+        # longer of the two trailing gaps.  If either sequence is empty, this
+        # is -1.
+        return min([len(seq.rstrip('-')) for seq in self.alignedseqs]) - 1
 
     def alignPrimersToAlignment(self):
         """
@@ -703,65 +935,39 @@ class ConsensSeqBuilder:
         #print leftend
         #print rightend
 
-        # Align the forward primer sequence to the left end gap sequence.  Using
-        # a harsher gap penalty (-9 instead of -6) seems to generally produce
-        # more useful alignments.
-        forward = self.settings.getForwardPrimer()
-        align = PairwiseAlignment()
-        align.setGapPenalty(-9)
-        align.setSequences(forward, leftend)
-        align.doAlignment()
-        fwdaligned, lendaligned = align.getAlignedSequences()
-
-        # Align the reverse complemented reverse primer sequence to the
-        # right end gap sequence.
-        reverse = sequencetrace.reverseCompSequence(self.settings.getReversePrimer())
-        align.setSequences(reverse, rightend)
-        align.doAlignment()
-        #print align.getAlignedSequences()[0]
-        #print align.getAlignedSequences()[1]
-        revaligned, rendaligned = align.getAlignedSequences()
+        # Align the forward primer sequence to the left end gap sequence and
+        # the reverse complemented reverse primer sequence to the right end gap
+        # sequence.  Using a harsher gap penalty (-9 instead of -6) seems to
+        # generally produce more useful alignments.
+        primernames = ('forward', 'reverse_rc')
+        primerindex = self.settings.getPrimerIndex()
+        pairs = [
+            (primerindex.getPrimer(primernames[0]), leftend),
+            (primerindex.getPrimer(primernames[1]), rightend)
+        ]
+        toalign = [
+            index for index in range(2) if self.align_all_primers
+            or self.primerCanMatch(primernames[index], pairs[index][1], -9)
+        ]
+        results = PairwiseAlignment().alignMany([pairs[index] for index in toalign], -9)
 
         # Replace starting and ending gap characters in the aligned primer
-        # sequences with spaces.
-        fwdaligned = self.trimAlignedPrimerEnds(fwdaligned)
-        revaligned = self.trimAlignedPrimerEnds(revaligned)
-
-        # If the primer alignment introduced gaps into the end gap region of the
-        # trace alignment, update the alignment, alignment indices, consensus
-        # sequence, and consensus quality score list to include the extra gaps.
-        for index in range(len(lendaligned)):
-            if lendaligned[index] == '-':
-                # Update the starts of the end gaps to reflect the new gaps
-                # that are added to the left side of the alignment.
-                lgapstart += 1
-                rgapstart += 1
-
-                # Update both aligned sequences and sequence indexes.
-                for seqnum in range(2):
-                    self.alignedseqs[seqnum] = self.alignedseqs[seqnum][0:index] + '-' + self.alignedseqs[seqnum][index:]
-                    sindex = self.seqindexes[seqnum][index]
-                    if sindex > 0:
-                        sindex = (sindex * -1) - 1
-                    self.seqindexes[seqnum].insert(index, sindex)
-
-        # Do the same for the right end region.
-        for index in range(len(rendaligned)):
-            if rendaligned[index] == '-':
-                # Update both aligned sequences and sequence indexes.
-                for seqnum in range(2):
-                    gappos = rgapstart + index + 1
-                    self.alignedseqs[seqnum] = self.alignedseqs[seqnum][0:gappos] + '-' + self.alignedseqs[seqnum][gappos:]
-                    # Check if we're at the end of the alignment.
-                    if gappos != len(self.seqindexes[seqnum]):
-                        sindex = self.seqindexes[seqnum][gappos]
-                        if sindex > 0:
-                            sindex = (sindex * -1) - 1
-                    else:
-                        sindex = self.seqindexes[seqnum][gappos - 1]
-                        if sindex > 0:
-                            sindex = ((sindex + 1) * -1) - 1
-                    self.seqindexes[seqnum].insert(gappos, sindex)
+        # sequences with spaces.  Primers that were not aligned are left out of
+        # the alignment.
+        praligned = [(' ' * len(pair[1]), pair[1]) for pair in pairs]
+        for index, result in zip(toalign, results):
+            praligned[index] = (self.trimAlignedPrimerEnds(result[0]), result[1])
+        fwdaligned, lendaligned = praligned[0]
+        revaligned, rendaligned = praligned[1]
+
+        # If the primer alignment introduced gaps into the end gap regions of the
+        # trace alignment, update the alignment and alignment indices to include
+        # the extra gaps.  Gaps added to the left side of the alignment shift
+        # the starts of both end gap regions.
+        numgaps = self._insertAlignmentGaps(0, lendaligned)
+        lgapstart += numgaps
+        rgapstart += numgaps
+        self._insertAlignmentGaps(rgapstart + 1, rendaligned)
 
         # Save the primer and end gap alignments.
         self.pr_alignments = [[fwdaligned, lendaligned], [revaligned, rendaligned]]
@@ -774,6 +980,58 @@ class ConsensSeqBuilder:
         #print len(self.alignedprimers)
         #print len(self.alignedseqs[0])
 
+    def _insertAlignmentGaps(self, start, alignedregion):
+        """
+        Inserts gaps into both aligned trace sequences and their alignment
+        indices for a region of the trace alignment that was aligned to a
+        primer.  The region begins at index start of the trace alignment, and
+        alignedregion is the aligned version of the region, in which each '-'
+        is a new gap column.  All of the gaps are inserted in a single pass, and
+        the number of gaps inserted is returned.  The alignment index of a new
+        gap is that of the next base, converted to a gap index (see
+        PairwiseAlignment.getAlignedSeqIndexes()); a gap at the end of the
+        alignment gets the gap index of the position after the last base.
+        """
+        numgaps = alignedregion.count('-')
+        if numgaps == 0:
+            return 0
+
+        regionlen = len(alignedregion) - numgaps
+        for seqnum in range(2):
+            seq = self.alignedseqs[seqnum]
+            indexes = self.seqindexes[seqnum]
+
+            newseq = []
+            newindexes = []
+            # The position of the next original column of the region.
+            pos = start
+            for char in alignedregion:
+                if char == '-':
+                    newseq.append('-')
+                    if pos < len(indexes):
+                        sindex = indexes[pos]
+                        if sindex > 0:
+                            sindex = (sindex * -1) - 1
+                    else:
+                        # We're at the end of the alignment.
+                        if len(newindexes) > 0:
+                            sindex = newindexes[-1]
+                        else:
+                            sindex = indexes[pos - 1]
+                        if sindex > 0:
+                            sindex = ((sindex + 1) * -1) - 1
+                    newindexes.append(sindex)
+                else:
+                    newseq.append(seq[pos])
+                    newindexes.append(indexes[pos])
+                    pos += 1
+
+            end = start + regionlen
+            self.alignedseqs[seqnum] = seq[0:start] + ''.join(newseq) + seq[end:]
+            self.seqindexes[seqnum] = indexes[0:start] + newindexes + indexes[end:]
+
+        return numgaps
+
     def alignPrimerToSequence(self):
         """
         Aligns a primer sequence to the base calls of a single trace file.
@@ -789,13 +1047,20 @@ class ConsensSeqBuilder:
         # appropriate primer sequence to search for.
         isreverse = self.seqtraces[0].isReverseComplemented()
         if isreverse:
-            primer = self.settings.getForwardPrimer()
+            primername = 'forward'
         else:
-            primer = sequencetrace.reverseCompSequence(self.settings.getReversePrimer())
+            primername = 'reverse_rc'
+        primer = self.settings.getPrimerIndex().getPrimer(primername)
 
         if primer == '':
             return
 
+        # Leave the primer out of the alignment if it cannot match the trace
+        # sequence well enough to be trimmed (see primerCanMatch()).
+        if not(self.align_all_primers) and not(self.primerCanMatch(primername, self.alignedseqs[0], -12)):
+            self.alignedprimers = ' ' * len(self.alignedseqs[0])
+            return
+
         # Align the primer sequence to the trace sequence.  Using a harsher gap
         # penalty (-12 instead of -6) seems to improve the chances of getting the
         # primer to align in the correct location.
@@ -829,6 +1094,16 @@ class ConsensSeqBuilder:
         if self.numseqs != 2:
             return
 
+        self._applyTrimRange(self._getAlignmentPrimerTrimRange())
+
+    def _getAlignmentPrimerTrimRange(self):
+        """
+        Returns the range of the consensus sequence, (start, end), that
+        trimPrimersFromAlignment() keeps.
+        """
+        start = 0
+        end = len(self.consensus) - 1
+
         # Retrieve the primer and end gap alignments.
         fwdaligned = self.pr_alignments[0][0]
         lendaligned = self.pr_alignments[0][1]
@@ -847,13 +1122,10 @@ class ConsensSeqBuilder:
 
         # If there are enough matches to consider the alignment valid, trim
         # the forward primer from the finished sequence.
-        if float(fwdmatches) / fwdtotallen >= self.settings.getPrimerMatchThreshold():
-            # Find the ending location of the forward primer in the alignment.
-            index = len(fwdaligned) - 1
-            while fwdaligned[index] == ' ':
-                index -= 1
-
-            self.consensus = ' ' * (index + 1) + self.consensus[index + 1:]
+        if (fwdtotallen > 0) and (float(fwdmatches) / fwdtotallen >= self.settings.getPrimerMatchThreshold()):
+            # Trim through the ending location of the forward primer in the
+            # alignment.
+            start = len(fwdaligned.rstrip(' '))
 
         # Determine the percent of reverse primer bases that matched the trace
         # data.  Count all gaps as mismatches.
@@ -867,14 +1139,12 @@ class ConsensSeqBuilder:
 
         # If there are enough matches to consider the alignment valid, trim
         # the reverse primer from the finished sequence.
-        if float(revmatches) / revtotallen >= self.settings.getPrimerMatchThreshold():
-            # Find the starting location of the reverse primer in the alignment.
-            index = 0
-            while revaligned[index] == ' ':
-                index += 1
-            alindex = len(self.consensus) - (len(revaligned) - index)
+        if (revtotallen > 0) and (float(revmatches) / revtotallen >= self.settings.getPrimerMatchThreshold()):
+            # Trim from the starting location of the reverse primer in the
+            # alignment.
+            end = len(self.consensus) - len(revaligned.lstrip(' ')) - 1
 
-            self.consensus = self.consensus[0:alindex] + ' ' * (len(revaligned) - index)
+        return (start, end)
 
     def trimPrimerFromSequence(self):
         """
@@ -886,6 +1156,16 @@ class ConsensSeqBuilder:
         if self.numseqs == 2:
             return
 
+        self._applyTrimRange(self._getSequencePrimerTrimRange())
+
+    def _getSequencePrimerTrimRange(self):
+        """
+        Returns the range of the consensus sequence, (start, end), that
+        trimPrimerFromSequence() keeps.
+        """
+        start = 0
+        end = len(self.consensus) - 1
+
         # Determine the percent of primer bases that matched the trace data.
         # Count all gaps as mismatches.
         praligned = self.alignedprimers
@@ -899,7 +1179,7 @@ class ConsensSeqBuilder:
 
         if prtotallen == 0:
             # There was no primer in the alignment, so do nothing.
-            return
+            return (start, end)
 
         # See if enough primer bases match to consider the alignment valid.
         # If so, trim the sequence.  Forward traces are trimmed from the left
@@ -907,19 +1187,54 @@ class ConsensSeqBuilder:
         # the primer.
         if float(prmatches) / prtotallen >= self.settings.getPrimerMatchThreshold():
             if self.seqtraces[0].isReverseComplemented():
-                # Find the starting location of the primer in the alignment.
-                index = len(praligned) - 1
-                while praligned[index] == ' ':
-                    index -= 1
-
-                self.consensus = ' ' * (index + 1) + self.consensus[index + 1:]
+                # Trim through the ending location of the primer.
+                start = len(praligned.rstrip(' '))
             else:
-                # Find the starting location of the primer in the alignment.
-                index = 0
-                while praligned[index] == ' ':
-                    index += 1
+                # Trim from the starting location of the primer.
+                end = len(praligned) - len(praligned.lstrip(' ')) - 1
+
+        return (start, end)
+
+    def primerCanMatch(self, primername, sequence, gap_penalty):
+        """
+        Checks whether an alignment of a primer (identified by its name in the
+        primer index) to a sequence could pass the primer match threshold.  The
+        primer index is checked first (see PrimerIndex.canMatch()); if that does
+        not rule out a match, a score-only alignment is used.  The match
+        fraction that the trimming methods calculate counts each aligned primer
+        position, including gaps inside of the primer, as a match only if the
+        primer and sequence characters are the same.  Each match scores at
+        least smin (the lowest score of an identical pair of primer bases), and
+        every other position scores at least w (the lowest substitution score
+        or the gap penalty).  So, if the match fraction of an alignment with T
+        aligned positions is at least t, its score is at least
+        T * (t * smin + (1 - t) * w), where T is between the primer length and
+        the primer length plus the sequence length.  If the optimal alignment
+        score is lower than that, the primer cannot pass the threshold.
+        """
+        threshold = self.settings.getPrimerMatchThreshold()
+        primerindex = self.settings.getPrimerIndex()
+        if not(primerindex.canMatch(primername, sequence, threshold)):
+            return False
+
+        primer = primerindex.getPrimer(primername)
+        align = PairwiseAlignment()
+        align.setGapPenalty(gap_penalty)
+        align.setSequences(primer, sequence)
+
+        smin = min([align.svals[base][base] for base in primer])
+        w = min(min([min(row.values()) for row in align.svals.values()]), gap_penalty)
+        if smin >= w:
+            coef = threshold * smin + (1 - threshold) * w
+        else:
+            coef = smin
+        if coef >= 0:
+            minscore = coef * len(primer)
+        else:
+            minscore = coef * (len(primer) + len(sequence))
 
-                self.consensus = self.consensus[0:index] + ' ' * (len(self.alignedseqs[0]) - index)
+        # Allow for rounding errors in the bound; a lower bound is always safe.
+        return align.calcAlignmentScore(int(math.ceil(minscore - 1e-6))) is not None
 
     def trimAlignedPrimerEnds(self, alignedp):
         """
@@ -943,20 +1258,17 @@ class ConsensSeqBuilder:
         if self.numseqs == 1:
             return
 
-        # Get the index of the start of the left end gap.
-        lgindex = self.getLeftEndGapStart()
-
-        # Get the index of the start of the right end gap.
-        rgindex = self.getRightEndGapStart()
-
-        # See if we encountered an empty sequence (this should never happen with real data)
-        # and adjust the index values to result in a blank string of appropriate length.
-        if rgindex == -1:
-            lgindex = 0
+        self._applyTrimRange(self._getEndGapTrimRange())
 
-        # Construct the consensus sequence without the end gap portions.
-        self.consensus = ((' ' * lgindex) + self.consensus[lgindex:rgindex + 1]
-                + (' ' * (len(self.consensus) - rgindex - 1)))
+    def _getEndGapTrimRange(self):
+        """
+        Returns the range of the consensus sequence, (start, end), that is not
+        part of the end gap regions of the alignment.  If the traces do not
+        overlap, the range is empty.
+        """
+        # An empty sequence (which should never happen with real data) gives
+        # an end index of -1 and, therefore, an empty range.
+        return (max(self.getLeftEndGapStart(), 0), self.getRightEndGapStart())
 
     def trimConsensus(self, winsize, basecnt):
         """
@@ -964,80 +1276,102 @@ class ConsensSeqBuilder:
         run of winsize bases meet the minimum quality threshold.  Any spaces in
         the sequence are ignored and not counted in the window size.
         """
-        # Build a dictionary for all valid nucleotide codes that will be
-        # used for counting the number of good bases in a window.
-        base_to_int = {}
-        for base in self.allbases:
-            base_to_int[base] = 1
-        base_to_int['N'] = 0
+        self._applyTrimRange(self._getQualityTrimRange(
+            winsize, basecnt, (0, len(self.consensus) - 1)
+        ))
 
-        # First, eliminate spaces from the consensus sequence.
-        compcons = self.consensus.replace(' ', '')
+    def _getConsensusIndex(self):
+        """
+        Returns the tuple (fullindexes, goodcounts) for the current consensus
+        sequence.  fullindexes maps each position in the consensus sequence
+        without spaces (the compact consensus) to its position in the full
+        consensus sequence, and goodcounts[i] is the number of correctly-called
+        (i.e., not 'N') bases in the first i positions of the compact
+        consensus.  The result is cached until the consensus sequence changes.
+        """
+        if (self.consindex is None) or (self.consindex[0] != self.consensus):
+            # Build a dictionary for all valid nucleotide codes that will be
+            # used for counting the number of good bases in a window.
+            base_to_int = {}
+            for base in self.allbases:
+                base_to_int[base] = 1
+            base_to_int['N'] = 0
+
+            compcons = self.consensus.replace(' ', '')
+            for base in set(compcons):
+                if base not in base_to_int:
+                    raise ConsensSeqBuilderError('Invalid base in the consensus sequence: ' + base)
+
+            if (numpy is not None) and isinstance(self.consensus, str):
+                codes = numpy.frombuffer(self.consensus, dtype=numpy.uint8)
+                fullindexes = numpy.flatnonzero(codes != ord(' ')).tolist()
+                goodcounts = numpy.zeros(len(compcons) + 1, dtype=numpy.intp)
+                numpy.cumsum(codes[fullindexes] != ord('N'), out=goodcounts[1:])
+                goodcounts = goodcounts.tolist()
+            else:
+                fullindexes = [index for index, base in enumerate(self.consensus) if base != ' ']
+                goodcounts = [0] * (len(compcons) + 1)
+                num_good = 0
+                for index, base in enumerate(compcons):
+                    num_good += base_to_int[base]
+                    goodcounts[index + 1] = num_good
 
-        # Make sure there are enough bases to actually do the analysis.
-        if len(compcons) < winsize:
-            return
+            self.consindex = (self.consensus, fullindexes, goodcounts)
 
-        # Build a list mapping the consensus sequence to simple integer values.  Correctly-called
-        # bases get assigned a 1, incorrectly-called bases get assigned a 0.
-        consvals = [base_to_int[base] for base in compcons]
+        return self.consindex[1:]
 
-        # Analyze the left end (5') of the sequence first.
-        index = 0
+    def _getQualityTrimRange(self, winsize, basecnt, keeprange):
+        """
+        Returns the range of the consensus sequence, (start, end), that
+        trimConsensus() keeps when it is applied to the part of the consensus
+        sequence in keeprange, with the rest of the sequence already trimmed.
+        The number of good bases in any window is the difference of two
+        prefix counts, so the windows can be moved without summing them.
+        """
+        start, end = keeprange
+        fullindexes, goodcounts = self._getConsensusIndex()
 
-        # Initialize the count of good bases.
-        num_good = sum(consvals[0:winsize])
+        # Get the range of the compact consensus sequence within keeprange.
+        cstart = bisect.bisect_left(fullindexes, start)
+        cend = bisect.bisect_right(fullindexes, end) - 1
 
-        # Slide the window along the sequence until it contains enough correct base calls.
-        while (num_good < basecnt) and ((index + winsize) < len(compcons)):
-            num_good += consvals[index + winsize]
-            num_good -= consvals[index]
+        # Make sure there are enough bases to actually do the analysis.
+        if (cend - cstart + 1) < winsize:
+            return keeprange
 
+        # Analyze the left end (5') of the sequence first.  Slide the window
+        # along the sequence until it contains enough correct base calls.
+        index = cstart
+        while ((goodcounts[index + winsize] - goodcounts[index]) < basecnt) and (index + winsize <= cend):
             index += 1
-            #print index, num_good
-
-        # Find the correct index in the consensus after accounting for any ignored spaces.
-        index_left = skipcnt = -1
-        while skipcnt != index:
-            index_left += 1
-            if self.consensus[index_left] != ' ':
-                skipcnt += 1
-        #print 'index_left:', index_left, 'num_good:', num_good
-
-        # Now analyze the right end (3') of the sequence.
-        indexold = index
-        index = len(compcons) - 1
-
-        # Initialize the count of good bases.
-        num_good = sum(consvals[len(consvals) - winsize:len(consvals)])
-
-        # Slide the window along the sequence until it contains enough correct base calls.
-        while (num_good < basecnt) and ((index - winsize) >= indexold):
-            num_good += consvals[index - winsize]
-            num_good -= consvals[index]
+        index_left = index
 
+        # Now analyze the right end (3') of the sequence.  The window does not
+        # move past the start of the window found for the left end.
+        index = cend
+        while ((goodcounts[index + 1] - goodcounts[index + 1 - winsize]) < basecnt) and ((index - winsize) >= index_left):
             index -= 1
-        #print index, num_good
-
-        # Find the correct index in the consensus after accounting for any ignored spaces.
-        index_right = skipcnt = -1
-        while skipcnt != index:
-            index_right += 1
-            if self.consensus[index_right] != ' ':
-                skipcnt += 1
-        #print 'index:', index
-        #print 'index_right:', index_right, 'num_good:', num_good
-
-        if num_good < basecnt:
-            # If we failed to find a sufficient number of quality bases anywhere in the sequence,
-            # simply trim the entire string.
-            new_consensus = ' ' * len(self.consensus)
+
+        if (goodcounts[index + 1] - goodcounts[index + 1 - winsize]) < basecnt:
+            # If we failed to find a sufficient number of quality bases
+            # anywhere in the sequence, simply trim the entire string.
+            return (0, -1)
         else:
-            # Build the trimmed consensus sequence.
-            new_consensus = ((' ' * index_left) + self.consensus[index_left:index_right + 1]
-                    + (' ' * (len(self.consensus) - index_right - 1)))
+            return (fullindexes[index_left], fullindexes[index])
+
+    def _intersectRanges(self, range1, range2):
+        return (max(range1[0], range2[0]), min(range1[1], range2[1]))
 
-        self.consensus = new_consensus
+    def _applyTrimRange(self, keeprange):
+        """
+        Replaces all bases outside of keeprange, (start, end), with spaces.
+        """
+        start, end = keeprange
+        if end < start:
+            self.consensus = ' ' * len(self.consensus)
+        elif (start > 0) or (end < len(self.consensus) - 1):
+            self.consensus = ((' ' * start) + self.consensus[start:end + 1]
+                    + (' ' * (len(self.consensus) - end - 1)))
 
     def getNumSeqs(self):
         return self.numseqs
@@ -1070,20 +1404,115 @@ class ConsensSeqBuilder:
         return self.seqindexes[sequence_num][alignment_index]
 
 
+# The default maximum number of characters that ModifiableConsensSeqBuilder
+# keeps in its undo and redo history.
+MAX_UNDO_SIZE = 1000000
+
+
 class ModifiableConsensSeqBuilder(ConsensSeqBuilder, Observable):
     """
     Extends ConsensSeqBuilder to allow for user editing of the consensus
-    sequence with support for unlimited undo/redo functinality.
+    sequence with support for undo/redo functionality.  The consensus sequence
+    is stored in a PieceTable, so edits do not copy the whole sequence.  Each
+    undo record only contains the part of the sequence that changed, the
+    records of adjacent edits of the same kind are merged, and the oldest
+    records are discarded when the history contains more than max_undo_size
+    characters (the most recent change can always be undone).
     """
-    def __init__(self, sequencetraces, settings=None):
+    def __init__(self, sequencetraces, settings=None, max_undo_size=MAX_UNDO_SIZE, coalesce_edits=True):
+        self.consbuffer = PieceTable()
+
         ConsensSeqBuilder.__init__(self, sequencetraces, settings)
 
-        self.undo_stack = list()
-        self.redo_stack = list()
+        self.max_undo_size = max_undo_size
+        self.coalesce_edits = coalesce_edits
+
+        # Each undo or redo record is a dictionary with the start index of the
+        # change, the text that was replaced ('old'), the text that replaced
+        # it ('new'), and the kind of change.
+        self.undo_stack = collections.deque()
+        self.redo_stack = collections.deque()
+        self.undo_size = 0
+        # Whether the next edit can be merged with the last undo record.
+        self.can_coalesce = False
 
         # initialize observable events
         self.defineObservableEvents(['consensus_changed', 'undo_state_changed', 'redo_state_changed'])
 
+    def _getConsensusText(self):
+        return self.consbuffer.getText()
+
+    def _setConsensusText(self, consensus):
+        self.consbuffer = PieceTable(consensus)
+        # Edits to the new sequence should not be merged with earlier edits.
+        self.can_coalesce = False
+
+    consensus = property(_getConsensusText, _setConsensusText)
+
+    def getConsensus(self, startindex=0, endindex=-1):
+        if endindex == -1:
+            endindex = len(self.consbuffer) - 1
+
+        # Convert negative and out-of-range indexes the same way as slicing a
+        # string, as ConsensSeqBuilder.getConsensus() does.
+        start, end, step = slice(startindex, endindex + 1).indices(len(self.consbuffer))
+
+        return self.consbuffer.getText(start, max(start, end))
+
+    def _replaceBases(self, start, oldlen, newdata):
+        """
+        Replaces oldlen bases starting at index start with newdata and
+        notifies observers of the change.
+        """
+        self.consbuffer.replace(start, start + oldlen, newdata)
+        if oldlen == len(newdata):
+            self.notifyObservers('consensus_changed', (start, start + oldlen - 1))
+        else:
+            self.notifyObservers('consensus_changed', (start, len(self.consbuffer) - 1))
+
+    def _addUndoRecord(self, start, olddata, newdata, kind):
+        """
+        Adds a record of a change to the undo history, merging it with the
+        previous record if both are edits of the same kind to adjacent parts
+        of the sequence.  Adding a record clears the redo history.
+        """
+        if len(self.redo_stack) > 0:
+            for record in self.redo_stack:
+                self.undo_size -= len(record['old']) + len(record['new'])
+            self.redo_stack.clear()
+            self.notifyObservers('redo_state_changed', (False,))
+
+        top = self.undo_stack[-1] if len(self.undo_stack) > 0 else None
+        if (
+            self.coalesce_edits and self.can_coalesce and (top is not None)
+            and (top['kind'] == kind) and (len(olddata) == len(newdata))
+        ):
+            if start == top['start'] + len(top['new']):
+                top['old'] += olddata
+                top['new'] += newdata
+                self.undo_size += len(olddata) + len(newdata)
+                self._limitUndoHistory()
+                return
+            elif start + len(newdata) == top['start']:
+                top['start'] = start
+                top['old'] = olddata + top['old']
+                top['new'] = newdata + top['new']
+                self.undo_size += len(olddata) + len(newdata)
+                self._limitUndoHistory()
+                return
+
+        self.undo_stack.append({'start': start, 'old': olddata, 'new': newdata, 'kind': kind})
+        self.undo_size += len(olddata) + len(newdata)
+        self._limitUndoHistory()
+
+        if len(self.undo_stack) == 1:
+            self.notifyObservers('undo_state_changed', (True,))
+
+    def _limitUndoHistory(self):
+        while (self.undo_size > self.max_undo_size) and (len(self.undo_stack) > 1):
+            record = self.undo_stack.popleft()
+            self.undo_size -= len(record['old']) + len(record['new'])
+
     def deleteBases(self, start_index, end_index):
         # swap the start and end points, if necessary
         if start_index > end_index:
@@ -1091,15 +1520,14 @@ class ModifiableConsensSeqBuilder(ConsensSeqBuilder, Observable):
             start_index = end_index
             end_index = tmp
 
-        # add the undo information
-        self.undo_stack.append({'start': start_index, 'end': end_index, 'data': self.consensus[start_index:end_index+1]})
-
         # delete the bases
-        self.consensus = self.consensus[0:start_index] + ' '*(end_index-start_index+1) + self.consensus[end_index+1:]
+        olddata = self.getConsensus(start_index, end_index)
+        newdata = ' ' * len(olddata)
+        self._replaceBases(start_index, len(olddata), newdata)
 
-        self.notifyObservers('consensus_changed', (start_index, end_index))
-        if len(self.undo_stack) == 1:
-            self.notifyObservers('undo_state_changed', (True,))
+        # add the undo information
+        self._addUndoRecord(start_index, olddata, newdata, 'delete')
+        self.can_coalesce = True
 
     def modifyBases(self, start_index, end_index, newseq):
         """
@@ -1122,41 +1550,47 @@ class ModifiableConsensSeqBuilder(ConsensSeqBuilder, Observable):
         if match.end() - match.start() != len(newseq):
             raise ConsensSeqBuilderError('The replacement sequence contains invalid characters.')
 
-        # add the undo information
-        self.undo_stack.append({'start': start_index, 'end': end_index, 'data': self.consensus[start_index:end_index+1]})
-
         # insert the new bases
-        self.consensus = self.consensus[0:start_index] + newseq + self.consensus[end_index+1:]
+        olddata = self.getConsensus(start_index, end_index)
+        self._replaceBases(start_index, len(olddata), newseq)
 
-        self.notifyObservers('consensus_changed', (start_index, end_index))
-        if len(self.undo_stack) == 1:
-            self.notifyObservers('undo_state_changed', (True,))
+        # add the undo information
+        self._addUndoRecord(start_index, olddata, newseq, 'modify')
+        self.can_coalesce = True
 
     def recalcConsensusSequence(self):
         oldcons = self.consensus
         self.makeConsensusSequence()
+        newcons = self.consensus
 
         # Any time the consensus sequence is recalculated, trigger a change event.
-        self.notifyObservers('consensus_changed', (0, len(self.consensus) - 1))
-
-        if oldcons != self.consensus:
-            self.undo_stack.append({'start': 0, 'end': len(self.consensus) - 1, 'data': oldcons})
-
-            if len(self.undo_stack) == 1:
-                self.notifyObservers('undo_state_changed', (True,))
+        self.notifyObservers('consensus_changed', (0, len(newcons) - 1))
+
+        if oldcons != newcons:
+            # Only save the part of the sequence that changed.
+            prefixlen = 0
+            maxlen = min(len(oldcons), len(newcons))
+            while (prefixlen < maxlen) and (oldcons[prefixlen] == newcons[prefixlen]):
+                prefixlen += 1
+            suffixlen = 0
+            while (suffixlen < maxlen - prefixlen) and (oldcons[-suffixlen - 1] == newcons[-suffixlen - 1]):
+                suffixlen += 1
+
+            self._addUndoRecord(
+                prefixlen, oldcons[prefixlen:len(oldcons) - suffixlen],
+                newcons[prefixlen:len(newcons) - suffixlen], 'recalc'
+            )
+            self.can_coalesce = False
 
     def undo(self):
         if len(self.undo_stack) > 0:
-            u = self.undo_stack.pop()
-            start = u['start']
-            end = u['end']
+            record = self.undo_stack.pop()
+            self._replaceBases(record['start'], len(record['new']), record['old'])
 
             # save the redo information
-            self.redo_stack.append({'start': start, 'end': end, 'data': self.consensus[start:end+1]})
-
-            self.consensus = self.consensus[0:start] + u['data'] + self.consensus[end+1:]
+            self.redo_stack.append(record)
+            self.can_coalesce = False
 
-            self.notifyObservers('consensus_changed', (start, end))
             if len(self.redo_stack) == 1:
                 self.notifyObservers('redo_state_changed', (True,))
             if len(self.undo_stack) == 0:
@@ -1164,19 +1598,15 @@ class ModifiableConsensSeqBuilder(ConsensSeqBuilder, Observable):
 
     def redo(self):
         if len(self.redo_stack) > 0:
-            r = self.redo_stack.pop()
-            start = r['start']
-            end = r['end']
+            record = self.redo_stack.pop()
+            self._replaceBases(record['start'], len(record['old']), record['new'])
 
             # save the undo information
-            self.undo_stack.append({'start': start, 'end': end, 'data': self.consensus[start:end+1]})
+            self.undo_stack.append(record)
+            self.can_coalesce = False
 
-            self.consensus = self.consensus[0:start] + r['data'] + self.consensus[end+1:]
-
-            self.notifyObservers('consensus_changed', (start, end))
             if len(self.undo_stack) == 1:
                 self.notifyObservers('undo_state_changed', (True,))
             if len(self.redo_stack) == 0:
                 self.notifyObservers('redo_state_changed', (False,))
 
-
@@ -0,0 +1,159 @@
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from collections import deque
+import re
+
+
+class FwdRevMatchIter:
+    """
+    Finds pairs of matching forward and reverse trace files.  items is a
+    sequence of objects with a getName() method, such as project items, and
+    two names match if replacing fwd_str with rev_str in the forward name gives
+    the reverse name.  If a search string occurs more than once in a name, each
+    occurrence is tried in turn, from left to right.
+
+    The items are matched from the last to the first, and each item is paired
+    with the first unmatched item that has the opposite name.  All of the
+    names are indexed when the iterator is created, so finding each pair only
+    requires a few dictionary lookups.
+    """
+    def __init__(self, items, fwd_str, rev_str):
+        self.fwd_str = fwd_str
+        self.rev_str = rev_str
+
+        self.items = list(items)
+
+        # Maps each name to a deque of the unmatched items with that name, in
+        # the same order as the items.
+        self.itemsbyname = {}
+        for item in self.items:
+            name = item.getName()
+            if name not in self.itemsbyname:
+                self.itemsbyname[name] = deque()
+            self.itemsbyname[name].append(item)
+
+        # The IDs of the items that were matched before they were reached.
+        self.matched = set()
+        self.numleft = len(self.items)
+
+    def __iter__(self):
+        return self
+
+    # returns a 3-tuple containing one matching pair plus their shared name: (forward file, reverse file, shared name)
+    def next(self):
+        while self.numleft > 1:
+            item1 = self.items.pop()
+            if id(item1) in self.matched:
+                continue
+            self.numleft -= 1
+
+            # Items are always taken from the end of the list, so item1 is the
+            # last unmatched item with its name.
+            item1file = item1.getName()
+            self.itemsbyname[item1file].pop()
+
+            for is_fwd, matchfile, sharedname in self.getCandidates(item1file):
+                matchitems = self.itemsbyname.get(matchfile)
+                if matchitems:
+                    item2 = matchitems.popleft()
+                    self.matched.add(id(item2))
+                    self.numleft -= 1
+
+                    # return the matching pair
+                    if is_fwd:
+                        return (item1, item2, sharedname)
+                    else:
+                        return (item2, item1, sharedname)
+
+        raise StopIteration
+
+    def getCandidates(self, name):
+        """
+        A generator that yields the possible matches for name, in the order in
+        which they should be tried.  Each match is a 3-tuple: (True if name is
+        a forward file, the name of the matching file, the shared name).
+        """
+        for match in self.getSubstitutions(name, self.fwd_str, self.rev_str):
+            yield (True,) + match
+
+        for match in self.getSubstitutions(name, self.rev_str, self.fwd_str):
+            yield (False,) + match
+
+    def getSubstitutions(self, name, key1, key2):
+        """
+        A generator that yields a pair of the "opposite" name and the shared
+        name for each occurrence of key1 in name, where the opposite name has
+        key2 substituted for that occurrence of key1.
+        """
+        # find all matches of key1 in the name
+        split = name.split(key1)
+
+        for cnt in range(1, len(split)):
+            before = key1.join(split[:cnt])
+            after = key1.join(split[cnt:])
+
+            yield (before + key2 + after, before + after)
+
+
+def templateToPattern(template, fwd_str, rev_str):
+    """
+    Converts a file name template to a regular expression for
+    RegexFwdRevMatchIter.  In the template, "{dir}" stands for the entire
+    forward or reverse search string, including any separator that is part of
+    the search string, "*" matches any text, and all other characters match
+    themselves.  For example, with the search strings "_F" and "_R", the
+    template "*{dir}.ab1" matches "CO1_F.ab1" and "CO1_R.ab1", but not
+    "CO1_F_2.ab1".
+    """
+    dirpattern = '(?P<dir>' + re.escape(fwd_str) + '|' + re.escape(rev_str) + ')'
+    anypattern = '.*'
+
+    pattern = ''
+    for cnt, part in enumerate(template.split('{dir}')):
+        if cnt > 0:
+            pattern += dirpattern
+        pattern += anypattern.join([re.escape(text) for text in part.split('*')])
+
+    return pattern
+
+
+class RegexFwdRevMatchIter(FwdRevMatchIter):
+    """
+    A FwdRevMatchIter for naming schemes that are described by a regular
+    expression.  The expression must match an entire name and have a group
+    called "dir" that matches the forward or reverse search string; only the
+    occurrence of the search string that is matched by this group is used for
+    pairing.  Names that do not match the expression are not paired.
+    """
+    def __init__(self, items, pattern, fwd_str, rev_str):
+        FwdRevMatchIter.__init__(self, items, fwd_str, rev_str)
+
+        self.regex = re.compile(pattern)
+        if 'dir' not in self.regex.groupindex:
+            raise ValueError('The expression "' + pattern + '" does not have a group called "dir".')
+
+    def getCandidates(self, name):
+        match = self.regex.match(name)
+        if (match is None) or (match.end() != len(name)) or (match.start('dir') == -1):
+            return
+
+        before = name[:match.start('dir')]
+        after = name[match.end('dir'):]
+        if match.group('dir') == self.fwd_str:
+            yield (True, before + self.rev_str + after, before + after)
+        elif match.group('dir') == self.rev_str:
+            yield (False, before + self.fwd_str + after, before + after)
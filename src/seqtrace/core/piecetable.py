@@ -0,0 +1,101 @@
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# The maximum number of pieces in a PieceTable.  When an edit would exceed
+# this, the pieces are merged into a single string.
+MAX_PIECES = 64
+
+
+class PieceTable(object):
+    """
+    A text buffer that supports replacing ranges of text without copying the
+    rest of the text.  The text is stored as a list of pieces, (string, offset,
+    length), that refer to substrings of the original text and of the strings
+    that replaced parts of it, so each edit only changes the list of pieces.
+    The full text is built and cached when it is requested, and the cache is
+    kept until the next edit.
+    """
+    def __init__(self, text=''):
+        self.pieces = []
+        if len(text) > 0:
+            self.pieces.append((text, 0, len(text)))
+        self.length = len(text)
+        self.text = text
+
+    def __len__(self):
+        return self.length
+
+    def getText(self, start=0, end=None):
+        """
+        Returns the text from index start up to, but not including, index end.
+        If end is None, the text through the end of the buffer is returned.
+        """
+        if end is None:
+            end = self.length
+
+        if self.text is None:
+            if (start <= 0) and (end >= self.length):
+                self.text = ''.join([buf[offset:offset + length] for buf, offset, length in self.pieces])
+            else:
+                return ''.join([
+                    buf[offset:offset + length] for buf, offset, length in self._getPieces(start, end)
+                ])
+
+        return self.text[start:end]
+
+    def _getPieces(self, start, end):
+        """
+        Returns the list of pieces that contain the text from index start up
+        to, but not including, index end.
+        """
+        start = max(start, 0)
+        end = min(end, self.length)
+
+        result = []
+        pos = 0
+        for buf, offset, length in self.pieces:
+            if pos >= end:
+                break
+            if pos + length > start:
+                # Clip the piece to the requested range.
+                pstart = max(start - pos, 0)
+                pend = min(end - pos, length)
+                result.append((buf, offset + pstart, pend - pstart))
+            pos += length
+
+        return result
+
+    def replace(self, start, end, newtext):
+        """
+        Replaces the text from index start up to, but not including, index end
+        with newtext, which does not need to be the same length.
+        """
+        if (start < 0) or (end > self.length) or (start > end):
+            raise IndexError('Invalid text range: [' + str(start) + ', ' + str(end) + ').')
+
+        pieces = self._getPieces(0, start)
+        if len(newtext) > 0:
+            pieces.append((newtext, 0, len(newtext)))
+        pieces += self._getPieces(end, self.length)
+
+        self.length += len(newtext) - (end - start)
+        self.pieces = pieces
+        self.text = None
+
+        # Limit the number of pieces so that lookups stay fast.
+        if len(self.pieces) > MAX_PIECES:
+            text = self.getText()
+            self.pieces = [(text, 0, len(text))]
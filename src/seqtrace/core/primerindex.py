@@ -0,0 +1,101 @@
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core.sequencetrace import reverseCompSequence
+
+import math
+
+
+# The k-mer size used to index the primers.
+PRIMER_KMER_SIZE = 6
+
+
+class PrimerIndex:
+    """
+    Indexes the k-mers of a pair of PCR primers and of their reverse
+    complements so that trace sequences in which a primer cannot possibly be
+    found can be ruled out with hash lookups instead of alignments.  The four
+    primer sequences are identified by the names 'forward', 'reverse',
+    'forward_rc', and 'reverse_rc'.
+
+    A PrimerIndex does not change after it is built, so a single index can be
+    shared by all of the consensus sequence builders that use the same
+    settings (see ConsensSeqSettings.getPrimerIndex()).
+    """
+    def __init__(self, fwdprimer, revprimer, ksize=PRIMER_KMER_SIZE):
+        self.fwdprimer = fwdprimer
+        self.revprimer = revprimer
+        self.ksize = ksize
+
+        self.primers = {
+            'forward': fwdprimer,
+            'reverse': revprimer,
+            'forward_rc': reverseCompSequence(fwdprimer),
+            'reverse_rc': reverseCompSequence(revprimer)
+        }
+
+        # For each primer, the set of k-mers that divide the primer into
+        # non-overlapping blocks.
+        self.blocks = {}
+        for name, primer in self.primers.iteritems():
+            self.blocks[name] = set([
+                primer.upper()[pos:pos+ksize]
+                for pos in range(0, len(primer) - ksize + 1, ksize)
+            ])
+
+    def getPrimers(self):
+        """
+        Returns the forward and reverse primers that were indexed.
+        """
+        return (self.fwdprimer, self.revprimer)
+
+    def getPrimer(self, name):
+        return self.primers[name]
+
+    def getKmerSize(self):
+        return self.ksize
+
+    def canMatch(self, name, sequence, threshold):
+        """
+        Returns False if it is certain that no alignment of a primer to a
+        sequence can reach the given match threshold, and True otherwise.  The
+        match fraction of an alignment is the number of primer positions that
+        match the sequence exactly, divided by the number of aligned positions
+        from the start to the end of the primer, including gaps (see
+        ConsensSeqBuilder).  Because at most all primer bases match, an
+        alignment that reaches the threshold t has at most (1 - t) * p / t
+        mismatches and gaps, where p is the primer length.  Each mismatch or
+        gap changes at most one of the non-overlapping k-mer blocks of the
+        primer, so if there are more blocks than that, at least one block must
+        occur in the sequence exactly.
+        """
+        primer = self.primers[name]
+        numblocks = len(primer) / self.ksize
+        if threshold <= 0:
+            return True
+        # Allow for rounding errors; overestimating is always safe.
+        maxerrors = int(math.floor((1 - threshold) * len(primer) / threshold + 1e-6))
+        if numblocks <= maxerrors:
+            return True
+
+        blocks = self.blocks[name]
+        ksize = self.ksize
+        sequence = sequence.upper()
+        for seqpos in range(len(sequence) - ksize + 1):
+            if sequence[seqpos:seqpos+ksize] in blocks:
+                return True
+
+        return False
@@ -0,0 +1,197 @@
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Phred-type quality score calculations that are shared by the trace file
+readers and the consensus sequence code.  Confidence scores are small integers,
+so the probabilities that correspond to them are precomputed, and the results
+of the more expensive calculations are cached the first time they are needed.
+All values are calculated with exactly the same floating-point operations as
+the direct calculations, so using the tables never changes any results.
+"""
+
+import math
+
+
+# The offset of quality score 0 in the probability tables.  The tables cover
+# the ranges of both signed and unsigned 1-byte confidence scores.
+QUAL_OFFSET = 128
+MAX_TABLE_QUAL = 255
+
+# The error probability of each quality score.
+ERROR_PROBS = tuple([10.0 ** (score / -10.0) for score in range(-QUAL_OFFSET, MAX_TABLE_QUAL + 1)])
+
+# The probability that a base call is correct for each quality score.
+CORRECT_PROBS = tuple([1.0 - eprob for eprob in ERROR_PROBS])
+
+# The order of the bases in nucleotide probability distributions.
+DIST_BASES = ('A', 'T', 'G', 'C')
+
+# The bases represented by each of the nucleotide codes that have probability
+# distributions, that is, all IUPAC codes except 'N'.
+CODE_BASES = {
+    'A': ('A',), 'T': ('T',), 'G': ('G',), 'C': ('C',),
+    'W': ('A', 'T'), 'S': ('C', 'G'), 'M': ('A', 'C'),
+    'K': ('G', 'T'), 'R': ('A', 'G'), 'Y': ('C', 'T'),
+    'B': ('C', 'G', 'T'), 'D': ('A', 'G', 'T'),
+    'H': ('A', 'C', 'T'), 'V': ('A', 'C', 'G')
+}
+
+# The maximum number of entries in each of the result caches.  A cache that
+# grows beyond this size is cleared, which can only happen with unusual
+# confidence score data.
+MAX_CACHE_SIZE = 100000
+
+_distcache = {}
+_callcache = {}
+
+
+def _isTableQual(score):
+    return isinstance(score, (int, long)) and (-QUAL_OFFSET <= score <= MAX_TABLE_QUAL)
+
+def errorProb(score):
+    """
+    Returns the probability that a base call with the Phred-type quality score
+    "score" is incorrect.
+    """
+    if _isTableQual(score):
+        return ERROR_PROBS[score + QUAL_OFFSET]
+    else:
+        return 10.0 ** (score / -10.0)
+
+def correctProb(score):
+    """
+    Returns the probability that a base call with the Phred-type quality score
+    "score" is correct.
+    """
+    if _isTableQual(score):
+        return CORRECT_PROBS[score + QUAL_OFFSET]
+    else:
+        return 1.0 - (10.0 ** (score / -10.0))
+
+def phredScore(eprob):
+    """
+    Returns the Phred-type quality score for the error probability eprob.
+    """
+    return -10.0 * math.log10(eprob)
+
+def getBaseDist(basecall, score):
+    """
+    Returns the nucleotide probability distribution for a base call and its
+    Phred-type quality score as a tuple of the probabilities of the bases in
+    DIST_BASES.  The probability of a correct call is divided evenly among the
+    bases represented by the nucleotide code; the error probability is divided
+    evenly among the other bases for unambiguous and 2-base codes and assigned
+    to the remaining base for 3-base codes.  Returns None if basecall is 'N'
+    or is not a valid nucleotide code.
+    """
+    key = (basecall, score)
+    dist = _distcache.get(key)
+    if dist is not None:
+        return dist
+
+    if basecall not in CODE_BASES:
+        return None
+
+    eprob = errorProb(score)
+    codebases = CODE_BASES[basecall]
+    if len(codebases) == 1:
+        callprob = 1 - eprob
+        otherprob = eprob / 3.0
+    elif len(codebases) == 2:
+        callprob = (1 - eprob) / 2.0
+        otherprob = eprob / 2.0
+    else:
+        callprob = (1 - eprob) / 3.0
+        otherprob = eprob
+
+    dist = tuple([
+        callprob if base in codebases else otherprob for base in DIST_BASES
+    ])
+
+    if len(_distcache) >= MAX_CACHE_SIZE:
+        _distcache.clear()
+    _distcache[key] = dist
+
+    return dist
+
+def getPosteriorDist(base1, score1, base2, score2):
+    """
+    Uses Bayes' theorem to calculate the posterior nucleotide probability
+    distribution for two base calls of the same position, using the
+    distribution of the first call as the prior.  The result is a tuple of the
+    probabilities of the bases in DIST_BASES.  Neither base call can be 'N'.
+    """
+    prior = getBaseDist(base1, score1)
+    conds = getBaseDist(base2, score2)
+
+    # Calculate the shared denominator for Bayes' theorem, which is the total
+    # probability of observing the 2nd base call.
+    denom = 0.0
+    for index in range(4):
+        denom += conds[index] * prior[index]
+
+    return tuple([(conds[index] * prior[index]) / denom for index in range(4)])
+
+def getMostProbableBase(dist):
+    """
+    Returns the most probable base in a nucleotide probability distribution
+    (a tuple ordered as DIST_BASES) and its Phred-type quality score.  Ties are
+    resolved in the order of DIST_BASES.
+    """
+    bestindex = 0
+    for index in range(1, 4):
+        if dist[index] > dist[bestindex]:
+            bestindex = index
+
+    if dist[bestindex] > 0:
+        cscore = phredScore(1.0 - dist[bestindex])
+    else:
+        cscore = 0
+
+    # Add a very small quantity to the calculated confidence score to ensure
+    # that values very near the minimum confidence score are accepted.
+    # Without this, values that should be exactly equal to the minimum are
+    # sometimes incorrectly rejected due to rounding error.  For example, for
+    # an initial quality score of 30, the following expression should evaluate
+    # to 30, but instead equals 29.999999999.
+    #print -10.0 * math.log10(1.0 - (1 - 10.0 ** (30 / -10.0)))
+    cscore += 0.000001
+
+    return (DIST_BASES[bestindex], cscore)
+
+def getConsensusCall(base1, score1, base2, score2):
+    """
+    Returns the most probable base and its Phred-type quality score for two
+    base calls of the same position (see getPosteriorDist() and
+    getMostProbableBase()).  The results are cached, so the Bayesian
+    calculations are only done once for each combination of base calls and
+    quality scores.  Neither base call can be 'N'.
+    """
+    key = (base1, score1, base2, score2)
+    result = _callcache.get(key)
+    if result is None:
+        result = getMostProbableBase(getPosteriorDist(base1, score1, base2, score2))
+        if len(_callcache) >= MAX_CACHE_SIZE:
+            _callcache.clear()
+        _callcache[key] = result
+
+    return result
+
+def getMeanErrorScore(score1, score2):
+    """
+    Returns the Phred-type quality score of the mean of the error
+    probabilities of two quality scores.
+    """
+    return -10 * math.log10((errorProb(score1) + errorProb(score2)) / 2)
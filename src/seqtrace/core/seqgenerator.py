@@ -0,0 +1,283 @@
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core import sequencetrace
+from seqtrace.core import tracecache
+from seqtrace.core.sequencetrace import SequenceTraceFactory
+from seqtrace.core.consens import ConsensSeqBuilder, ConsensSeqSettings
+
+import multiprocessing
+import time
+
+
+# How long to wait for a worker result, in seconds, before calling the idle
+# function again.
+POLL_INTERVAL = 0.05
+
+
+def getDefaultNumWorkers():
+    """
+    Returns the default number of worker processes, which is the number of
+    CPUs, or 1 if the number of CPUs cannot be determined.
+    """
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def getSettingsValues(settings):
+    """
+    Returns the values of a ConsensSeqSettings object as a tuple of arguments
+    for ConsensSeqSettings.setAll().  Settings objects can have observers, so
+    only these values are sent to the worker processes.
+    """
+    return (
+        settings.getMinConfScore(), settings.getConsensusAlgorithm(),
+        settings.getTrimConsensus(), settings.getTrimEndGaps(),
+        settings.getTrimPrimers(), settings.getPrimerMatchThreshold(),
+        settings.getForwardPrimer(), settings.getReversePrimer(),
+        settings.getDoQualityTrim(), settings.getQualityTrimParams()
+    )
+
+
+class GenerationJob:
+    """
+    The trace files for one consensus sequence.  tracefiles is a list of
+    (file path, is reverse) pairs, and jobid is any picklable value that
+    identifies the job, such as the ID of a project item.
+    """
+    def __init__(self, jobid, tracefiles):
+        self.jobid = jobid
+        self.tracefiles = tracefiles
+
+
+class GenerationResult:
+    """
+    The consensus sequence for a GenerationJob.  If a trace file could not be
+    loaded, compact_cons and full_cons are None, error_path is the path of the
+    file, and error_msg is the description of the trace file error, or None if
+    the file could not be opened.  load_time and cons_time are the times, in
+    seconds, spent loading the trace files and calculating the consensus
+    sequence.
+    """
+    def __init__(self, jobid, compact_cons=None, full_cons=None, error_path=None, error_msg=None):
+        self.jobid = jobid
+        self.compact_cons = compact_cons
+        self.full_cons = full_cons
+        self.error_path = error_path
+        self.error_msg = error_msg
+        self.load_time = 0.0
+        self.cons_time = 0.0
+
+    def isError(self):
+        return self.error_path is not None
+
+
+# The consensus settings, trace caching options, and primer alignment option
+# used by the jobs run in the current process.
+_worker_settings = None
+_worker_diskcache = None
+_worker_cache_traces = False
+_worker_align_all_primers = True
+
+def _initWorker(settingsvals, cachedir, cache_traces, align_all_primers):
+    global _worker_settings, _worker_diskcache, _worker_cache_traces, _worker_align_all_primers
+
+    _worker_settings = ConsensSeqSettings()
+    _worker_settings.setAll(*settingsvals)
+
+    if cachedir != '':
+        _worker_diskcache = tracecache.DiskTraceCache(cachedir)
+    else:
+        _worker_diskcache = None
+
+    _worker_cache_traces = cache_traces
+    _worker_align_all_primers = align_all_primers
+
+def _loadTrace(filepath, reverse):
+    if _worker_cache_traces:
+        return tracecache.getTraceCache().getTrace(filepath, reverse, _worker_diskcache)
+
+    # The traces are only read by the consensus sequence builder, so reverse
+    # reads do not need to be transformed.
+    seqt = SequenceTraceFactory.loadTraceFile(filepath, sequencetrace.TS_ARRAY, _worker_diskcache)
+    if reverse:
+        seqt.reverseComplement(lazy=True)
+
+    return seqt
+
+def _isJobCached(job):
+    """
+    Returns True if all of the traces for a job are in the process-wide trace
+    cache, so the job can be run without parsing any trace files.
+    """
+    cache = tracecache.getTraceCache()
+    for filepath, reverse in job.tracefiles:
+        if not(cache.hasTrace(filepath)):
+            return False
+
+    return True
+
+def _runJob(job):
+    """
+    Loads the trace files for a job and calculates its consensus sequence.
+    """
+    starttime = time.time()
+    seqtraces = []
+    for filepath, reverse in job.tracefiles:
+        try:
+            seqtraces.append(_loadTrace(filepath, reverse))
+        except IOError:
+            result = GenerationResult(job.jobid, error_path=filepath)
+            result.load_time = time.time() - starttime
+            return result
+        except sequencetrace.TraceFileError as err:
+            result = GenerationResult(job.jobid, error_path=filepath, error_msg=str(err))
+            result.load_time = time.time() - starttime
+            return result
+    loadtime = time.time()
+
+    csb = ConsensSeqBuilder(seqtraces, _worker_settings, align_all_primers=_worker_align_all_primers)
+
+    result = GenerationResult(job.jobid, csb.getCompactConsensus(), csb.getConsensus())
+    result.load_time = loadtime - starttime
+    result.cons_time = time.time() - loadtime
+
+    return result
+
+
+class ConsensusGenerator:
+    """
+    Calculates the consensus sequences for a list of GenerationJobs, using a
+    pool of worker processes to load the trace files and build the consensus
+    sequences in parallel.  Only the consensus sequences are sent back from the
+    workers, and the results are returned in the same order as the jobs, so
+    they are identical to the results of calculating the sequences one at a
+    time.  If only one worker is requested, or there is only one job, all of
+    the work is done in the calling process.
+    """
+    def __init__(self, settings, numworkers=None, cachedir='', cache_traces=True,
+            align_all_primers=True):
+        """
+        settings is a ConsensSeqSettings object, numworkers is the number of
+        worker processes (the number of CPUs, by default), and cachedir is the
+        on-disk trace cache directory, or '' to not use an on-disk cache.
+
+        If cache_traces is True, the jobs run in the calling process load
+        their traces through the process-wide trace cache, which keeps the
+        traces for later runs.  Jobs whose traces are all in that cache are
+        always run in the calling process, so unchanged trace files are not
+        parsed again.  The worker processes are stopped when generation is
+        done, so they never keep their traces in memory; use cachedir to
+        avoid parsing the files that were loaded by the workers again.
+
+        align_all_primers is passed to ConsensSeqBuilder.  It must be True if
+        the full consensus sequences will be stored in a project, because
+        skipping the primer alignments can change the full consensus sequence.
+        """
+        self.settingsvals = getSettingsValues(settings)
+        self.cachedir = cachedir
+        self.cache_traces = cache_traces
+        self.align_all_primers = align_all_primers
+
+        if numworkers is None:
+            numworkers = getDefaultNumWorkers()
+        if numworkers < 1:
+            raise ValueError('The number of worker processes must be at least 1.')
+        self.numworkers = numworkers
+
+        self.pool = None
+        self.is_canceled = False
+
+    def getNumWorkers(self):
+        return self.numworkers
+
+    def cancel(self):
+        """
+        Stops the generation of consensus sequences.  No more results are
+        returned by generate(), and any running workers are stopped.
+        """
+        self.is_canceled = True
+
+    def isCanceled(self):
+        return self.is_canceled
+
+    def generate(self, jobs, idle_func=None):
+        """
+        A generator that yields a GenerationResult for each job in jobs, in
+        the same order as the jobs.  While waiting for results from the
+        workers, idle_func (if provided) is called repeatedly with no
+        arguments, which allows a GUI to process events, and cancel(), while
+        the work is being done.
+        """
+        self.is_canceled = False
+        jobs = list(jobs)
+
+        _initWorker(self.settingsvals, self.cachedir, self.cache_traces, self.align_all_primers)
+
+        # Decide which jobs are sent to the worker processes.
+        if (self.numworkers == 1) or (len(jobs) < 2):
+            pooljobs = []
+        elif self.cache_traces:
+            pooljobs = [job for job in jobs if not(_isJobCached(job))]
+        else:
+            pooljobs = jobs
+        if len(pooljobs) < 2:
+            pooljobs = []
+        poolids = set(id(job) for job in pooljobs)
+
+        if len(pooljobs) > 0:
+            self.pool = multiprocessing.Pool(
+                min(self.numworkers, len(pooljobs)), _initWorker,
+                (self.settingsvals, self.cachedir, False, self.align_all_primers)
+            )
+        try:
+            if self.pool is not None:
+                results = self.pool.imap(_runJob, pooljobs)
+
+            for job in jobs:
+                if self.is_canceled:
+                    break
+
+                if id(job) not in poolids:
+                    yield _runJob(job)
+                    continue
+
+                result = None
+                while (result is None) and not(self.is_canceled):
+                    try:
+                        result = results.next(POLL_INTERVAL)
+                    except multiprocessing.TimeoutError:
+                        if idle_func is not None:
+                            idle_func()
+
+                if self.is_canceled:
+                    break
+                yield result
+
+            if self.pool is not None:
+                if self.is_canceled:
+                    self.pool.terminate()
+                else:
+                    self.pool.close()
+                self.pool.join()
+        finally:
+            # Make sure the workers are stopped if the caller stops iterating
+            # early or an error occurred.
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool = None
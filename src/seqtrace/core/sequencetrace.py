@@ -15,12 +15,25 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from struct import unpack, pack
+from seqtrace.core import qualmath
+
+from struct import unpack, unpack_from, pack
 import struct
 import zlib
 import os.path
 from datetime import datetime
-import math
+import sys
+import string
+import array
+import mmap
+
+# NumPy is not required, but if it is available, it will be used to speed up
+# decoding of trace data and to provide zero-copy views of memory-mapped trace
+# samples.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class TraceFileError(Exception):
@@ -37,6 +50,21 @@ ST_ZTR = 1
 ST_ABI = 2
 ST_SCF = 3
 
+# Constants for the trace sample storage backends.  TS_LIST stores the samples
+# for each channel as a list of Python integers.  TS_ARRAY stores each channel
+# as a compact typed array ('H' or 'h').  TS_MMAP memory-maps the trace file, if
+# possible, and exposes each channel as a read-only NumPy view of the file data
+# so that raw samples are never copied; if NumPy is not available, TS_MMAP
+# falls back to TS_ARRAY.
+TS_LIST = 0
+TS_ARRAY = 1
+TS_MMAP = 2
+
+# The array type code for base call confidence scores.  Depending on the trace
+# format, the scores are signed or unsigned bytes, so 2-byte signed integers
+# are used for all formats.
+CONF_TYPECODE = 'h'
+
 class SequenceTraceFactory:
     @staticmethod
     def getTraceFileType(filename):
@@ -60,23 +88,38 @@ class SequenceTraceFactory:
             return ST_UNKNOWN
 
     @staticmethod
-    def loadTraceFile(filepath):
+    def loadTraceFile(filepath, sampstorage=TS_LIST, diskcache=None):
+        """
+        Loads a sequence trace file of any supported type.  If diskcache is
+        provided, it should be an on-disk trace cache (see
+        seqtrace.core.tracecache.DiskTraceCache).  If the cache holds a valid
+        copy of the trace, the trace is loaded from the cache instead of
+        parsing the file; otherwise, the parsed trace is added to the cache.
+        """
+        if diskcache is not None:
+            seqt = diskcache.loadTrace(filepath, sampstorage)
+            if seqt is not None:
+                return seqt
+
         try:
             ftype = SequenceTraceFactory.getTraceFileType(filepath)
         except:
             raise
 
         if ftype == ST_ZTR:
-            seqt = ZTRSequenceTrace()
+            seqt = ZTRSequenceTrace(sampstorage)
         elif ftype == ST_ABI:
-            seqt = ABISequenceTrace()
+            seqt = ABISequenceTrace(sampstorage)
         elif ftype == ST_SCF:
-            seqt = SCFSequenceTrace()
+            seqt = SCFSequenceTrace(sampstorage)
         elif ftype == ST_UNKNOWN:
             raise UnknownFileTypeError
 
         seqt.loadFile(filepath)
 
+        if diskcache is not None:
+            diskcache.storeTrace(filepath, seqt)
+
         return seqt
 
 
@@ -89,29 +132,130 @@ rclookup = {
     'W': 'W', 'S': 'S', 'M': 'K', 'K': 'M', 'R': 'Y', 'Y': 'R',
     'B': 'V', 'D': 'H', 'H': 'D', 'V': 'B', 'N': 'N'}
 
+# The same table in the form used by str.translate().
+rctable = string.maketrans(''.join(rclookup.keys()), ''.join(rclookup.values()))
+rcchars = ''.join(rclookup.keys())
+
 def reverseCompSequence(sequence):
     """
     Defines a generic method for reverse complementing a sequence of nucleotide
-    codes.  This method fully supports all of the IUPAC ambiguity codes.
+    codes.  This method fully supports all of the IUPAC ambiguity codes.  As
+    with a lookup in rclookup, a KeyError is raised if the sequence contains
+    any characters that are not valid nucleotide codes.
     """
-    tmp = list()
-    for cnt in reversed(range(len(sequence))):
-        tmp.append(rclookup[sequence[cnt]])
+    if isinstance(sequence, unicode):
+        try:
+            sequence = sequence.encode('ascii')
+        except UnicodeError:
+            raise KeyError(sequence)
 
-    return ''.join(tmp)
+    # Translation passes unknown characters through unchanged, so check for
+    # them separately.
+    invalid = sequence.translate(None, rcchars)
+    if invalid != '':
+        raise KeyError(invalid[0])
 
+    return sequence[::-1].translate(rctable)
 
-class SequenceTrace:
+def _reversePositions(positions, endpos):
+    """
+    Reverses a sequence of trace sample positions and transforms each position,
+    pos, to endpos - pos.  Arrays of positions are returned as arrays of the
+    same type, unless a position is past endpos, in which case the negative
+    result does not fit in an unsigned array; these positions, and any other
+    sequence, are returned as a list.
+    """
+    if isinstance(positions, array.array):
+        if (numpy is not None) and (positions.typecode in ('i', 'I')):
+            dtype = numpy.dtype(positions.typecode)
+            vals = numpy.frombuffer(positions, dtype=dtype)[::-1]
+            vals = endpos - vals.astype(numpy.int64)
+            if (len(vals) == 0) or (vals.min() >= numpy.iinfo(dtype).min):
+                return array.array(positions.typecode, vals.astype(dtype).tostring())
+
+        try:
+            return array.array(positions.typecode, [endpos - pos for pos in reversed(positions)])
+        except OverflowError:
+            pass
+
+    return [endpos - pos for pos in reversed(positions)]
+
+
+class _ReversedSequence(object):
+    """
+    A read-only view of a sequence (such as a list or array) in reverse order,
+    which is used to access trace samples without copying them.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[cnt] for cnt in xrange(*index.indices(len(self.data)))]
+
+        if index < 0:
+            index += len(self.data)
+        if (index < 0) or (index >= len(self.data)):
+            raise IndexError('index out of range')
+
+        return self.data[len(self.data) - 1 - index]
+
+    def __iter__(self):
+        return reversed(self.data)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not(self == other)
+
+
+class SequenceTrace(object):
     """
     Parent for all format-specific sequence trace classes.  This class defines
     the methods that are common to all sequence traces.
+
+    To keep the memory footprint of each trace small, sequence traces use
+    __slots__ rather than an instance dictionary, and the base call positions
+    and confidence scores are stored as typed arrays.  Subclasses must also
+    define __slots__ for any additional attributes they use.
+
+    A trace can be reverse complemented either by transforming all of its
+    data or, in "view" mode, by only recording that it is reverse
+    complemented and flipping indices as the data are accessed.  All of the
+    get*() methods return the same results in either case.
     """
-    def __init__(self):
+    __slots__ = (
+        'isreverse_comped', 'rcview', 'fname', 'tracesamps', 'max_traceval',
+        'comments', 'sampstorage', 'basecalls', 'basepos', 'bcconf'
+    )
+
+    # Maps each base to the base on the complementary trace channel.
+    COMP_BASES = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
+
+    def __init__(self, sampstorage=TS_LIST):
+        """
+        sampstorage: The backend to use for storing the trace samples (one of
+            TS_LIST, TS_ARRAY, or TS_MMAP).
+        """
         self.isreverse_comped = False
+        self.rcview = False
         self.fname = ''
         self.tracesamps = {}
         self.max_traceval = -1
         self.comments = {}
+        self.basecalls = ''
+        self.basepos = array.array('I')
+        self.bcconf = array.array(CONF_TYPECODE)
+
+        if sampstorage not in (TS_LIST, TS_ARRAY, TS_MMAP):
+            raise ValueError('Invalid trace sample storage type: ' + str(sampstorage))
+        self.sampstorage = sampstorage
 
     def loadFile(self, filename):
         pass
@@ -122,72 +266,167 @@ class SequenceTrace:
     def getMaxTraceVal(self):
         return self.max_traceval
 
-    def reverseComplement(self):
+    def copy(self):
+        """
+        Returns a shallow copy of this trace.  The copy shares the trace data
+        (which can be large) with this trace.  This is safe because the trace
+        data are never modified in place; reverseComplement() replaces them
+        instead.
+        """
+        newtrace = self.__class__.__new__(self.__class__)
+        for cls in self.__class__.__mro__:
+            for attrname in getattr(cls, '__slots__', ()):
+                if hasattr(self, attrname):
+                    setattr(newtrace, attrname, getattr(self, attrname))
+
+        newtrace.tracesamps = dict(self.tracesamps)
+        newtrace.comments = dict(self.comments)
+
+        return newtrace
+
+    def reverseComplement(self, lazy=False):
         """
         Reverse complements the trace data, including the actual sequencing
-        traces, the base calls, and the quality scores.
+        traces, the base calls, and the quality scores.  If lazy is True, no
+        data are copied or modified; instead, the trace is switched to (or
+        from) a reverse-complemented view of its data.  The data structures
+        holding the trace data are replaced rather than modified in place, so
+        they can safely be shared with other traces.
         """
+        if lazy:
+            self.rcview = not(self.rcview)
+            self.isreverse_comped = not(self.isreverse_comped)
+            return
+
         # reverse the DNA sequence
         self.basecalls = reverseCompSequence(self.basecalls)
 
-        # reverse and transpose the trace samples
+        # Reverse and transpose the trace samples.  Slicing works for all of
+        # the sample storage types, including read-only NumPy views of
+        # memory-mapped data (for which the reversed slice is also a view).
+        revsamps = {}
         for base in self.tracesamps:
-            self.tracesamps[base].reverse()
-        tmp = self.tracesamps['A']
-        self.tracesamps['A'] = self.tracesamps['T']
-        self.tracesamps['T'] = tmp
-        tmp = self.tracesamps['G']
-        self.tracesamps['G'] = self.tracesamps['C']
-        self.tracesamps['C'] = tmp
+            revsamps[self.COMP_BASES[base]] = self.tracesamps[base][::-1]
+        self.tracesamps = revsamps
 
         # reverse the confidence scores
-        self.bcconf.reverse()
+        self.bcconf = self.bcconf[::-1]
 
         # reverse and shift the base call positions
-        self.basepos.reverse()
-        endsamp = len(self.tracesamps['A']) - 1
-        for cnt in range(len(self.basepos)):
-            self.basepos[cnt] = endsamp - self.basepos[cnt]
+        self.basepos = _reversePositions(self.basepos, self._getRawTraceLength() - 1)
 
         self.isreverse_comped = not(self.isreverse_comped)
 
     def isReverseComplemented(self):
         return self.isreverse_comped
 
+    def _getRawTraceLength(self):
+        if 'A' in self.tracesamps:
+            return len(self.tracesamps['A'])
+        else:
+            return 0
+
     def getTraceSamples(self, base):
         """
-        Returns the actual trace data for a particular base.
+        Returns the actual trace data for a particular base.  For a trace in
+        reverse-complemented view mode, the samples are returned as a read-only
+        view of the underlying data.
         """
-        return self.tracesamps[base.upper()]
+        base = base.upper()
+        if self.rcview:
+            samps = self.tracesamps[self.COMP_BASES[base]]
+            if (numpy is not None) and isinstance(samps, numpy.ndarray):
+                return samps[::-1]
+            else:
+                return _ReversedSequence(samps)
+        else:
+            return self.tracesamps[base]
 
     def getTraceSample(self, base, index):
         """
         Return the magnitude of the trace data at the location in the trace
         specified by index.
         """
-        return self.tracesamps[base.upper()][index]
+        base = base.upper()
+        if self.rcview:
+            if index < 0:
+                index += self._getRawTraceLength()
+            return int(self.tracesamps[self.COMP_BASES[base]][self._getRawTraceLength() - 1 - index])
+        else:
+            return int(self.tracesamps[base][index])
 
     def getTraceLength(self):
         return len(self.tracesamps['A'])
 
     def getBaseCalls(self):
-        return self.basecalls
+        if self.rcview:
+            return reverseCompSequence(self.basecalls)
+        else:
+            return self.basecalls
 
     def getBaseCall(self, index):
-        return self.basecalls[index]
+        if self.rcview:
+            return rclookup[self.basecalls[self._flipBaseIndex(index)]]
+        else:
+            return self.basecalls[index]
 
     def getNumBaseCalls(self):
         return len(self.basecalls)
 
+    def _flipBaseIndex(self, index):
+        """
+        Converts a base call index in reverse-complemented view mode to the
+        index of the same base call in the stored data.
+        """
+        if index < 0:
+            index += len(self.basecalls)
+
+        return len(self.basecalls) - 1 - index
+
     def getBaseCallPos(self, index):
-        return self.basepos[index]
+        if self.rcview:
+            return self._getRawTraceLength() - 1 - self.basepos[self._flipBaseIndex(index)]
+        else:
+            return self.basepos[index]
 
     def getBaseCallConf(self, index):
-        return self.bcconf[index]
+        if self.rcview:
+            return self.bcconf[self._flipBaseIndex(index)]
+        else:
+            return self.bcconf[index]
+
+    def getBaseCallConfs(self):
+        """
+        Returns all of the base call confidence scores in the same order as
+        the sequence returned by getBaseCalls().
+        """
+        if self.rcview:
+            return self.bcconf[::-1]
+        else:
+            return self.bcconf
 
     # If sampnum < the first base call location, returns the first base call
     # location.
     def getPrevBaseCallIndex(self, sampnum):
+        if self.rcview:
+            # In view mode, the base call located at or immediately before
+            # sampnum is the stored base call located at or immediately after
+            # the flipped sample number.
+            endsamp = self._getRawTraceLength() - 1
+            return self._flipBaseIndex(self._findNextBaseCallIndex(endsamp - sampnum))
+        else:
+            return self._findPrevBaseCallIndex(sampnum)
+
+    # If sampnum > the last base call location, returns the last base call
+    # location.
+    def getNextBaseCallIndex(self, sampnum):
+        if self.rcview:
+            endsamp = self._getRawTraceLength() - 1
+            return self._flipBaseIndex(self._findPrevBaseCallIndex(endsamp - sampnum))
+        else:
+            return self._findNextBaseCallIndex(sampnum)
+
+    def _findPrevBaseCallIndex(self, sampnum):
         # Do a binary search for the index of the base call located at, or
         # immediately before, sampnum.
         minv = 0
@@ -208,9 +447,7 @@ class SequenceTrace:
         else:
             return minv
 
-    # If sampnum > the last base call location, returns the last base call
-    # location.
-    def getNextBaseCallIndex(self, sampnum):
+    def _findNextBaseCallIndex(self, sampnum):
         # Do a binary search for the index of the base call located at, or
         # immediately after, sampnum.
         minv = 0
@@ -231,6 +468,41 @@ class SequenceTrace:
         else:
             return maxv
 
+    def _makeSampleArray(self, data, offset, count, signed=False):
+        """
+        Converts count big-endian, 2-byte integers starting at offset in the
+        buffer data to a trace samples sequence of the type specified by this
+        trace's sample storage setting.  With TS_MMAP (and NumPy), the result
+        is a read-only view of data, so data must not be modified afterwards.
+        """
+        if (offset + count * 2) > len(data):
+            raise TraceFileError('The trace sample data are incomplete.  The file appears to be damaged.')
+
+        if signed:
+            typecode = 'h'
+        else:
+            typecode = 'H'
+
+        if self.sampstorage == TS_LIST:
+            return list(unpack_from('>' + str(count) + typecode, data, offset))
+        elif (self.sampstorage == TS_MMAP) and (numpy is not None):
+            if signed:
+                dtype = '>i2'
+            else:
+                dtype = '>u2'
+            return numpy.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        else:
+            samps = array.array(typecode, data[offset:offset + count * 2])
+            if _little_endian:
+                samps.byteswap()
+            return samps
+
+    def _getMaxSampleVal(self, samps):
+        if (numpy is not None) and isinstance(samps, numpy.ndarray):
+            return int(samps.max())
+        else:
+            return max(samps)
+
     def getComment(self, key):
         if key in self.comments:
             return self.comments[key]
@@ -241,6 +513,71 @@ class SequenceTrace:
         return self.comments
 
 
+# Native byte order flag used when converting big-endian file data to arrays.
+_little_endian = (sys.byteorder == 'little')
+
+def _bigEndianArray(typecode, data):
+    """
+    Converts a buffer of big-endian integers to an array with the given
+    typecode.
+    """
+    vals = array.array(typecode, data)
+    if _little_endian and vals.itemsize > 1:
+        vals.byteswap()
+
+    return vals
+
+def _reverseDeltaFilter(data, typecode, levels):
+    """
+    Reverses a ZTR-style delta filter applied to a buffer of big-endian,
+    unsigned integers of the size given by the array typecode ('B', 'H', or
+    'I').  Each level of the filter is reversed by a cumulative sum that wraps
+    around on integer overflow.  Returns the decoded values as a big-endian
+    byte string.
+    """
+    if numpy is not None:
+        nptype = '>u' + str(array.array(typecode).itemsize)
+        vals = numpy.frombuffer(data, dtype=nptype).astype(nptype[1:])
+        for clev in range(levels):
+            # Unsigned cumulative sums wrap on overflow, exactly as required.
+            vals = numpy.cumsum(vals, dtype=vals.dtype)
+
+        return vals.astype(nptype).tostring()
+
+    vals = array.array(typecode, data)
+    if _little_endian and vals.itemsize > 1:
+        vals.byteswap()
+
+    mask = (1 << (8 * vals.itemsize)) - 1
+    udata = vals.tolist()
+    for clev in range(levels):
+        prev = 0
+        for cnt in xrange(len(udata)):
+            prev = (prev + udata[cnt]) & mask
+            udata[cnt] = prev
+
+    vals = array.array(typecode, udata)
+    if _little_endian and vals.itemsize > 1:
+        vals.byteswap()
+
+    return vals.tostring()
+
+def _expandSignedBytes(data, typecode):
+    """
+    Converts a buffer of signed bytes to a big-endian byte string of signed
+    integers of the size given by the array typecode ('h' or 'i').
+    """
+    if numpy is not None:
+        nptype = '>i' + str(array.array(typecode).itemsize)
+        return numpy.frombuffer(data, dtype=numpy.int8).astype(nptype).tostring()
+
+    vals = array.array(typecode, array.array('b', data))
+    if _little_endian:
+        vals.byteswap()
+
+    return vals.tostring()
+
+
 class ZTRError(TraceFileError):
     pass
 
@@ -269,6 +606,8 @@ class ZTRMissingDataError(ZTRError):
 
 
 class ZTRSequenceTrace(SequenceTrace):
+    __slots__ = ('magicnum', 'ver_major', 'ver_minor')
+
     def loadFile(self, filename):
         self.fname = filename
 
@@ -307,15 +646,15 @@ class ZTRSequenceTrace(SequenceTrace):
                 self.basecalls = chunk[2][1:].upper()
             elif chunk[0] == 'BPOS':
                 # positions of base calls relative to trace samples
-                self.basepos = list()
-                # skip 4 leading null bytes
-                for cnt in range(4, len(chunk[2]), 4):
-                    self.basepos.append(unpack('>I', chunk[2][cnt:cnt+4])[0])
+                # (skipping 4 leading null bytes)
+                self.basepos = _bigEndianArray('I', chunk[2][4:])
             elif chunk[0] == 'CNF4':
                 # confidence scores; this is required to come after a BASE chunk
-                self.bcconf = list()
-                for cnt in range(1, self.getNumBaseCalls()+1):
-                    self.bcconf.append(unpack('b', chunk[2][cnt])[0])
+                if len(chunk[2]) <= self.getNumBaseCalls():
+                    raise ZTRError('The ZTR confidence score data are incomplete.  The file appears to be damaged.')
+                self.bcconf = array.array(
+                    CONF_TYPECODE, array.array('b', chunk[2][1:self.getNumBaseCalls()+1])
+                )
             elif chunk[0] == 'TEXT':
                 # get the comment key/value strings, ignoring leading/trailing null characters
                 keyvals = chunk[2][1:-2].split('\0')
@@ -332,13 +671,10 @@ class ZTRSequenceTrace(SequenceTrace):
         offset = 2
         basenum = 0
         for base in ['A','C','G','T']:
-            thisbase = list()
             start = basenum*tracelen + offset
-            for cnt in range(0, tracelen, 2):
-                val = unpack('>H', chunkdata[start+cnt:start+cnt+2])[0]
-                thisbase.append(val)
+            thisbase = self._makeSampleArray(chunkdata, start, (tracelen + 1) / 2)
 
-            tmpmax = max(thisbase)
+            tmpmax = self._getMaxSampleVal(thisbase)
             if tmpmax > self.max_traceval:
                 self.max_traceval = tmpmax
             self.tracesamps[base] = thisbase
@@ -369,177 +705,127 @@ class ZTRSequenceTrace(SequenceTrace):
         # cause this to fail on an x86 machine).
         udatalen = unpack('I', cdata[:4])[0]
         guard = cdata[4]
-        #print unpack_from('=bIb', data[:6])
         #print 'guard byte:', guard
-    
+
+        # Rather than examining the data one byte at a time, jump from one
+        # guard byte to the next and copy each intervening run of literal
+        # bytes in a single slice operation.
         cnt = 5
+        datalen = len(cdata)
         udata = list()
-        while cnt < len(cdata):
-            if cdata[cnt] == guard:
-                runlen = unpack('B', cdata[cnt+1])[0]
-                #print 'run length:', runlen
-                if runlen == 0:
-                    udata.append(guard)
-                    cnt += 2
-                else:
-                    runchar = cdata[cnt+2]
-                    udata.extend(runlen*list(runchar))
-                    cnt += 3
+        while cnt < datalen:
+            gpos = cdata.find(guard, cnt)
+            if gpos == -1:
+                udata.append(cdata[cnt:])
+                break
+
+            udata.append(cdata[cnt:gpos])
+            if gpos + 1 >= datalen:
+                raise ZTRError('RLE decompression failed.  The compressed data ended unexpectedly.')
+
+            runlen = ord(cdata[gpos + 1])
+            #print 'run length:', runlen
+            if runlen == 0:
+                udata.append(guard)
+                cnt = gpos + 2
             else:
-                udata.append(cdata[cnt])
-                cnt += 1
-    
+                if gpos + 2 >= datalen:
+                    raise ZTRError('RLE decompression failed.  The compressed data ended unexpectedly.')
+                udata.append(cdata[gpos + 2] * runlen)
+                cnt = gpos + 3
+
+        udata = ''.join(udata)
+
         #print 'expected uncompressed data length:', udatalen
         #print 'actual uncompressed data length:', len(udata)
         if udatalen != len(udata):
             raise ZTRError('RLE decompression failed.  The expected data length did not match the actual data length.')
     
-        return ''.join(udata)
+        return udata
     
     def followDecode(self, cdata):
-        # read the decode table
-        table = unpack('256B', cdata[:256])
+        # Read the decode table.
+        table = bytearray(cdata[:256])
         #print table
-    
-        udata = list()
-        prev = unpack('B', cdata[256])[0]
-        udata.append(cdata[256])
-        for cnt in xrange(257, len(cdata)):
-            diff = unpack('b', cdata[cnt])[0]
-            actual = table[prev] - diff
-
-            # simulate 1-byte unsigned overflow/underflow, if needed
-            if actual < 0:
-                actual += 256
-            elif actual > 255:
-                #print actual,(actual-256), table[prev], diff
-                actual -= 256
-
-            prev = actual
-            #print actual
-            udata.append(pack('B', actual))
-        
-        return ''.join(udata)
+
+        # Each decoded byte depends on the previous decoded byte, so this
+        # filter cannot be reversed in bulk.  Working directly on a bytearray,
+        # however, avoids unpacking and repacking every value.  The masking
+        # operation simulates 1-byte unsigned overflow/underflow; note that
+        # subtracting the signed difference is equivalent, modulo 256, to
+        # subtracting the raw byte value.
+        diffs = bytearray(cdata[256:])
+        if len(diffs) == 0:
+            return ''
+
+        udata = bytearray(len(diffs))
+        prev = diffs[0]
+        udata[0] = prev
+        for cnt in xrange(1, len(diffs)):
+            prev = (table[prev] - diffs[cnt]) & 0xff
+            udata[cnt] = prev
+
+        return str(udata)
     
     def decode16To8(self, cdata):
-        cnt = 0
-        udata = list()
-        while cnt < len(cdata):
-            val = unpack('b', cdata[cnt])[0]
-            if (val > -128) and (val < 128):
-                udata.append(pack('>h', val))
-                cnt += 1
-            elif val == -128:
-                #print unpack('b', cdata[cnt+1])[0]
-                #print unpack('b', cdata[cnt+2])[0]
-                udata.extend(cdata[cnt+1:cnt+3])
-                cnt += 3
-            else:
-                raise ZTRError('Invalid value encountered while attempting to read 16- to 8-bit encoded ZTR data.')
-    
-        return ''.join(udata)
+        return self._decodeToNBit(cdata, 'h', 2)
     
     def decode32To8(self, cdata):
+        return self._decodeToNBit(cdata, 'i', 4)
+
+    def _decodeToNBit(self, cdata, typecode, valsize):
+        """
+        Reverses the ZTR 16- to 8-bit and 32- to 8-bit conversions.  Each
+        signed byte expands to a single big-endian value of valsize bytes,
+        except for the escape byte (-128), which is followed by a value that
+        was stored in full.  The runs of bytes between escape codes are
+        converted in bulk.
+        """
         cnt = 0
+        datalen = len(cdata)
         udata = list()
-        while cnt < len(cdata):
-            val = unpack('b', cdata[cnt])[0]
-            if (val > -128) and (val < 128):
-                udata.append(pack('>i', val))
-                cnt += 1
-            elif val == -128:
-                #print unpack('b', cdata[cnt+1])[0]
-                #print unpack('b', cdata[cnt+2])[0]
-                udata.extend(cdata[cnt+1:cnt+5])
-                cnt += 5
+        while cnt < datalen:
+            epos = cdata.find('\x80', cnt)
+            if epos == -1:
+                epos = datalen
+
+            if epos > cnt:
+                udata.append(_expandSignedBytes(cdata[cnt:epos], typecode))
+
+            if epos < datalen:
+                udata.append(cdata[epos + 1:epos + valsize + 1])
+                cnt = epos + valsize + 1
             else:
-                raise ZTRError('Invalid value encountered while attempting to read 32- to 8-bit encoded ZTR data.')
+                cnt = epos
     
         return ''.join(udata)
     
     def decode8BitDelta(self, cdata):
         levels = unpack('b', cdata[0])[0]
         #print 'levels:', levels
-    
-        # first, unpack the 1-byte values
-        udata = list()
-        for cnt in xrange(1, len(cdata)):
-            val = unpack('B', cdata[cnt])[0]
-            udata.append(val)
 
-        # now apply the reverse delta filtering
-        for clev in range(levels):
-            prev = 0
-            for cnt in xrange(0, len(udata)):
-                actual = udata[cnt] + prev
-                if actual > 255:
-                    # simulate 1-byte integer overflow
-                    actual -= 256
-                prev = actual
-                udata[cnt] = actual
-    
-        # repack the data
-        tmpdata = list()
-        for val in udata:
-            tmpdata.append(pack('B', val))
-    
-        return ''.join(tmpdata)
+        return _reverseDeltaFilter(cdata[1:], 'B', levels)
     
     def decode16BitDelta(self, cdata):
         levels = unpack('b', cdata[0])[0]
         #print 'levels:', levels
     
-        # first, unpack the 2-byte values
-        udata = list()
-        for cnt in xrange(1, len(cdata), 2):
-            val = unpack('>H', cdata[cnt:cnt+2])[0]
-            udata.append(val)
+        data = cdata[1:]
+        if (len(data) % 2) != 0:
+            raise ZTRError('Invalid data length encountered while attempting to read 16-bit delta encoded ZTR data.')
 
-        # now apply the reverse delta filtering
-        for clev in range(levels):
-            prev = 0
-            for cnt in xrange(0, len(udata)):
-                actual = udata[cnt] + prev
-                if actual > 65535:
-                    # simulate 2-byte integer overflow
-                    actual -= 65536
-                prev = actual
-                udata[cnt] = actual
-    
-        # repack the data
-        tmpdata = list()
-        for val in udata:
-            tmpdata.append(pack('>H', val))
-    
-        return ''.join(tmpdata)
+        return _reverseDeltaFilter(data, 'H', levels)
     
     def decode32BitDelta(self, cdata):
         levels = unpack('b', cdata[0])[0]
         #print 'levels:', levels
     
-        # first, unpack the 4-byte values (skipping the 2 padding bytes)
-        udata = list()
-        for cnt in xrange(3, len(cdata), 4):
-            val = unpack('>I', cdata[cnt:cnt+4])[0]
-            udata.append(val)
+        # Skip the 2 padding bytes that follow the level count.
+        data = cdata[3:]
+        if (len(data) % 4) != 0:
+            raise ZTRError('Invalid data length encountered while attempting to read 32-bit delta encoded ZTR data.')
 
-        # now apply the reverse delta filtering
-        for clev in range(levels):
-            prev = 0
-            for cnt in xrange(0, len(udata)):
-                actual = udata[cnt] + prev
-                if actual > 4294967295:
-                    # simulate 1-byte integer overflow
-                    actual -= 4294967296
-                prev = actual
-                udata[cnt] = actual
-    
-        # repack the data
-        tmpdata = list()
-        for val in udata:
-            tmpdata.append(pack('>I', val))
-    
-        return ''.join(tmpdata)
+        return _reverseDeltaFilter(data, 'I', levels)
     
     def readChunk(self, fp):
         # get the chunk descriptor
@@ -637,100 +923,130 @@ class ABIDataError(ABIError):
 
 
 class ABISequenceTrace(SequenceTrace):
+    __slots__ = (
+        'filedata', 'abiindex', 'abiindex_map', 'abiindex_byid',
+        'num_index_entries', 'index_offset'
+    )
+
+    # The layout of a single ABI file index (directory) entry: the data ID,
+    # ID number, data format, format size, data count, total data length,
+    # data offset, and the unused "data handle" field.
+    index_entry_format = '4sIHHIII4x'
+    index_entry_size = struct.calcsize('>' + index_entry_format)
+    index_entry_keys = ('did', 'idv', 'dformat', 'fsize', 'dcnt', 'dlen', 'offset')
+
     def loadFile(self, filename):
         self.fname = filename
 
         try:
-            self.tf = open(filename, 'rb')
+            tf = open(filename, 'rb')
         except IOError:
             raise
 
-        self.abiindex = list()
+        # ABI files are small enough that it is much faster to read the entire
+        # file with a single call and then decode the data from memory than
+        # to make many small reads from the file.  If the trace samples are to
+        # be memory mapped, map the file instead so that the processed trace
+        # data can be used without copying them.
+        try:
+            self.filedata = None
+            if (self.sampstorage == TS_MMAP) and (numpy is not None):
+                try:
+                    self.filedata = mmap.mmap(tf.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, EnvironmentError):
+                    # Empty files cannot be mapped, and some file systems do
+                    # not support memory mapping.
+                    pass
+            if self.filedata is None:
+                self.filedata = tf.read()
+        finally:
+            tf.close()
+
+        self.readHeader()
+        self.readABIIndex()
+        
+        self.readBaseCalls()
+        self.readConfScores()
+        self.readTraceData()
+        self.readBaseLocations()
+        self.readComments()
+
+        # The raw file data and the file index are only needed while the file
+        # is being parsed, so free the memory they use.
+        del self.filedata
+        del self.abiindex, self.abiindex_map, self.abiindex_byid
 
+    def readHeader(self):
         # read the ABI magic number
-        abinum = self.tf.read(4)
+        abinum = self.filedata[:4]
         #print abinum
         if abinum != 'ABIF':
             raise ABIError('The ABI file header is invalid.  The file appears to be damaged.')
 
         # check the major version number
         try:
-            version = unpack('>H', self.tf.read(2))[0]
+            version = unpack_from('>H', self.filedata, 4)[0]
         except struct.error:
             raise ABIError('The ABI file header is invalid.  The file appears to be damaged.')
         #print version
         if (version / 100) != 1:
             raise ABIVersionError(version / 100, version % 100)
         
-        # skip the next 10 bytes
-        self.tf.read(10)
-        
-        # get the file index information
+        # get the file index information (after skipping the next 10 bytes)
         try:
-            index_entry_len = unpack('>h', self.tf.read(2))[0]
-            self.num_index_entries = unpack('>i', self.tf.read(4))[0]
-            total_index_size = unpack('>i', self.tf.read(4))[0]
-            self.index_offset = unpack ('>i', self.tf.read(4))[0]
+            (index_entry_len, self.num_index_entries, total_index_size,
+                self.index_offset) = unpack_from('>hiii', self.filedata, 16)
         except struct.error:
             raise ABIError('The ABI file header is invalid.  The file appears to be damaged.')
         
         #print index_entry_len, self.num_index_entries, total_index_size, self.index_offset
 
-        self.readABIIndex()
-        
-        self.readBaseCalls()
-        self.readConfScores()
-        self.readTraceData()
-        self.readBaseLocations()
-        self.readComments()
-        
     def readABIIndex(self):
-        # read the ABI index block
-        self.tf.seek(self.index_offset, 0)
-
-        for cnt in range(self.num_index_entries):
-            try:
-                self.abiindex.append(dict(did=0, idv=0, dformat=0, fsize=0, dcnt=0, dlen=0, offset=0))
-                self.abiindex[cnt]['did'] = self.tf.read(4)
-                self.abiindex[cnt]['idv'] = unpack('>I', self.tf.read(4))[0]
-                self.abiindex[cnt]['dformat'] = unpack('>H', self.tf.read(2))[0]
-                self.abiindex[cnt]['fsize'] = unpack('>H', self.tf.read(2))[0]
-                self.abiindex[cnt]['dcnt'] = unpack('>I', self.tf.read(4))[0]
-                self.abiindex[cnt]['dlen'] = unpack('>I', self.tf.read(4))[0]
-                self.abiindex[cnt]['offset'] = unpack('>I', self.tf.read(4))[0]
-                # skip 4 bytes (the unused "data handle" field)
-                self.tf.read(4)
-            except struct.error:
-                raise ABIIndexError(cnt, self.num_index_entries)
+        # Make sure the entire index block is present in the file.
+        if self.num_index_entries < 0 or self.index_offset < 0:
+            raise ABIIndexError(0, self.num_index_entries)
+        availsize = len(self.filedata) - self.index_offset
+        if availsize < (self.num_index_entries * self.index_entry_size):
+            raise ABIIndexError(
+                max(availsize, 0) / self.index_entry_size, self.num_index_entries
+            )
+
+        # Decode the entire ABI index block in one operation.
+        vals = unpack_from(
+            '>' + self.index_entry_format * self.num_index_entries,
+            self.filedata, self.index_offset
+        )
+        numkeys = len(self.index_entry_keys)
+        self.abiindex = [
+            dict(zip(self.index_entry_keys, vals[cnt:cnt+numkeys]))
+            for cnt in range(0, len(vals), numkeys)
+        ]
+
+        # Build lookup tables for the index entries.  If the same entry
+        # appears more than once, the first occurrence is used.
+        self.abiindex_map = {}
+        self.abiindex_byid = {}
+        for entry in self.abiindex:
+            self.abiindex_map.setdefault((entry['did'], entry['idv']), entry)
+            self.abiindex_byid.setdefault(entry['did'], []).append(entry)
         
         #self.printABIIndex('CMNT')
 
     def printABIIndex(self, data_id):
-        for entry in self.abiindex:
-            if entry['did'] == data_id:
-                print 'entry ID:', entry['did']
-                print 'idv:', entry['idv']
-                print 'data format:', entry['dformat']
-                print 'format size:', entry['fsize']
-                print 'data count:', entry['dcnt']
-                print 'total data length:', entry['dlen']
-                print 'data offset:', entry['offset']
+        for entry in self.getIndexEntriesById(data_id):
+            print 'entry ID:', entry['did']
+            print 'idv:', entry['idv']
+            print 'data format:', entry['dformat']
+            print 'format size:', entry['fsize']
+            print 'data count:', entry['dcnt']
+            print 'total data length:', entry['dlen']
+            print 'data offset:', entry['offset']
 
     def getIndexEntry(self, data_id, number):
-        for row in self.abiindex:
-            if (row['did'] == data_id) and (row['idv'] == number):
-                return row
-    
-        return None
+        return self.abiindex_map.get((data_id, number))
     
     def getIndexEntriesById(self, data_id):
-        entries = list()
-    
-        for row in self.abiindex:
-            if row['did'] == data_id:
-                entries.append(row)
-    
-        return entries
+        return list(self.abiindex_byid.get(data_id, ()))
     
     def readComments(self):
         """
@@ -895,8 +1211,7 @@ class ABISequenceTrace(SequenceTrace):
             strval = ''.join(lst)
         else:
             # get the data from the file
-            self.tf.seek(indexrow['offset'], 0)
-            strval = self.tf.read(indexrow['dcnt'])
+            strval = self.filedata[indexrow['offset']:indexrow['offset'] + indexrow['dcnt']]
     
         if indexrow['dlen'] != len(strval):
             raise ABIDataError(indexrow['dlen'], len(strval))
@@ -911,6 +1226,21 @@ class ABISequenceTrace(SequenceTrace):
 
         return strval
     
+    def readData(self, indexrow, itemformat, itemsize):
+        """
+        Reads all of the data values for an index entry from the file data,
+        using a single unpack operation.  Raises ABIDataError if the file does
+        not contain all of the data.
+        """
+        start = indexrow['offset']
+        end = start + indexrow['dcnt'] * itemsize
+        if end > len(self.filedata):
+            raise ABIDataError(indexrow['dlen'], max(len(self.filedata) - start, 0))
+
+        return list(unpack_from(
+            '>' + str(indexrow['dcnt']) + itemformat, self.filedata, start
+        ))
+
     def read1ByteInts(self, indexrow):
         if indexrow['fsize'] != 1:
             raise ABIError('Index entry contains an invalid format size for 1-byte integers.')
@@ -938,9 +1268,7 @@ class ABISequenceTrace(SequenceTrace):
                 lst.append(val)
         else:
             # get the data from the file
-            self.tf.seek(indexrow['offset'], 0)
-            for cnt in range(0, indexrow['dcnt']):
-                lst.append(unpack(formatstr, self.tf.read(1))[0])
+            lst = self.readData(indexrow, formatstr, 1)
     
         if indexrow['dlen'] != len(lst):
             raise ABIDataError(indexrow['dlen'], len(lst))
@@ -953,9 +1281,9 @@ class ABISequenceTrace(SequenceTrace):
 
         # see if the data format is signed or unsigned
         if indexrow['dformat'] == 3:
-            formatstr = '>H'
+            formatstr = 'H'
         elif indexrow['dformat'] == 4:
-            formatstr = '>h'
+            formatstr = 'h'
         else:
             raise ABIError('Index entry contains an invalid data type ID for 2-byte integers.')
     
@@ -970,13 +1298,11 @@ class ABISequenceTrace(SequenceTrace):
             # integers (shift operations would only return positive values).
             data = pack('>I', indexrow['offset'])
             for cnt in range(0, indexrow['dcnt']):
-                val = unpack(formatstr, data[cnt*2:cnt*2+2])[0]
+                val = unpack('>' + formatstr, data[cnt*2:cnt*2+2])[0]
                 lst.append(val)
         else:
             # get the data from the file
-            self.tf.seek(indexrow['offset'], 0)
-            for cnt in range(0, indexrow['dcnt']):
-                lst.append(unpack(formatstr, self.tf.read(2))[0])
+            lst = self.readData(indexrow, formatstr, 2)
     
         if indexrow['dlen'] != (len(lst) * 2):
             raise ABIDataError(indexrow['dlen'], (len(lst) * 2))
@@ -1001,9 +1327,7 @@ class ABISequenceTrace(SequenceTrace):
             lst.append(val)
         else:
             # get the data from the file
-            self.tf.seek(indexrow['offset'], 0)
-            for cnt in range(0, indexrow['dcnt']):
-                lst.append(unpack('>i', self.tf.read(4))[0])
+            lst = self.readData(indexrow, 'i', 4)
     
         if indexrow['dlen'] != (len(lst) * 4):
             raise ABIDataError(indexrow['dlen'], (len(lst) * 4))
@@ -1024,9 +1348,7 @@ class ABISequenceTrace(SequenceTrace):
             lst.append(unpack('>f', data)[0])
         else:
             # get the data from the file
-            self.tf.seek(indexrow['offset'], 0)
-            for cnt in range(0, indexrow['dcnt']):
-                lst.append(unpack('>f', self.tf.read(4))[0])
+            lst = self.readData(indexrow, 'f', 4)
     
         if indexrow['dlen'] != (len(lst) * 4):
             raise ABIDataError(indexrow['dlen'], (len(lst) * 4))
@@ -1076,7 +1398,7 @@ class ABISequenceTrace(SequenceTrace):
             raise ABIError('No confidence score data were found in the ABI file.  SeqTrace requires confidence scores for all base calls.')
     
         # read the base call confidence scores from the file
-        self.bcconf = self.read1ByteInts(row)
+        self.bcconf = array.array(CONF_TYPECODE, self.read1ByteInts(row))
     
         return True
     
@@ -1094,8 +1416,12 @@ class ABISequenceTrace(SequenceTrace):
         if row is None:
             raise ABIError('No base location data were found in the ABI file.  The file might be damaged.')
     
-        # Read the base call locations from the file.
-        self.basepos = self.read2ByteInts(row)
+        # Read the base call locations from the file.  Signed locations might
+        # be negative, so they cannot be stored as unsigned integers.
+        if row['dformat'] == 4:
+            self.basepos = array.array('i', self.read2ByteInts(row))
+        else:
+            self.basepos = array.array('I', self.read2ByteInts(row))
 
         return True
 
@@ -1121,6 +1447,32 @@ class ABISequenceTrace(SequenceTrace):
     
         return base_order
     
+    def readTraceSamples(self, indexrow):
+        """
+        Reads the trace samples for a single channel using the sample storage
+        backend for this trace.
+        """
+        if (self.sampstorage == TS_LIST) or (indexrow['dlen'] <= 4):
+            lst = self.read2ByteInts(indexrow)
+            if self.sampstorage != TS_LIST:
+                lst = array.array('h' if indexrow['dformat'] == 4 else 'H', lst)
+            return lst
+
+        if indexrow['fsize'] != 2:
+            raise ABIError('Index entry contains an invalid format size for 2-byte integers.')
+        if indexrow['dformat'] not in (3, 4):
+            raise ABIError('Index entry contains an invalid data type ID for 2-byte integers.')
+        if indexrow['dlen'] != (indexrow['dcnt'] * 2):
+            raise ABIDataError(indexrow['dlen'], (indexrow['dcnt'] * 2))
+
+        start = indexrow['offset']
+        if (start + indexrow['dlen']) > len(self.filedata):
+            raise ABIDataError(indexrow['dlen'], max(len(self.filedata) - start, 0))
+
+        return self._makeSampleArray(
+            self.filedata, start, indexrow['dcnt'], indexrow['dformat'] == 4
+        )
+
     def readTraceData(self):
         base_order = self.getBaseDataOrder()
         maxval = 0
@@ -1139,8 +1491,8 @@ class ABISequenceTrace(SequenceTrace):
                 raise ABIError('Could not find trace data index entries for all bases.  The file might be damaged.')
     
             # read the trace data from the file
-            lst = self.read2ByteInts(row)
-            tmpmax = max(lst)
+            lst = self.readTraceSamples(row)
+            tmpmax = self._getMaxSampleVal(lst)
             if tmpmax > maxval:
                 maxval = tmpmax
             self.tracesamps[base_order[cnt]] = lst
@@ -1171,6 +1523,8 @@ class SCFDataError(SCFError):
 
 
 class SCFSequenceTrace(SequenceTrace):
+    __slots__ = ('tf',)
+
     # Define the supported versions.
     VERSIONS = ('3.00', '3.10')
 
@@ -1235,34 +1589,31 @@ class SCFSequenceTrace(SequenceTrace):
         self.readComments(commentslen, commentsstart)
 
     def readBasesData(self, numbases, basesstart):
-        self.basepos = list()
-        probs = {'A': list(), 'C': list(), 'G': list(), 'T': list()}
-        self.bcconf = list()
-
         self.tf.seek(basesstart, 0)
 
-        try:
-            # get the base locations
-            for cnt in range(0, numbases):
-                index = unpack('>I', self.tf.read(4))[0]
-                self.basepos.append(index)
-            #print self.basepos
-
-            # get the base call probabilities for all bases
-            for base in ('A', 'C', 'G', 'T'):
-                for cnt in range(0, numbases):
-                    prob = unpack('B', self.tf.read(1))[0]
-                    probs[base].append(prob)
-        except struct.error:
+        # Read the base locations and the base call probabilities for all
+        # bases at once.
+        basesdata = self.tf.read(numbases * 8)
+        if len(basesdata) != (numbases * 8):
             raise SCFError('Error while reading base call locations and probabilities from the SCF file.  The file appears to be damaged.')
 
+        # get the base locations
+        self.basepos = _bigEndianArray('I', basesdata[:numbases * 4])
+        #print self.basepos
+
+        # get the base call probabilities for all bases
+        probs = {}
+        for basenum, base in enumerate(('A', 'C', 'G', 'T')):
+            start = numbases * (4 + basenum)
+            probs[base] = array.array('B', basesdata[start:start + numbases])
+
         # get the base calls
         self.basecalls = self.tf.read(numbases).upper()
         #print self.basecalls
         if numbases != len(self.basecalls):
             raise SCFDataError(numbases, len(self.basecalls))
 
-        self.bcconf = self._buildConfScoresList(self.basecalls, probs)
+        self.bcconf = array.array(CONF_TYPECODE, self._buildConfScoresList(self.basecalls, probs))
         #print self.bcconf
 
     def _buildConfScoresList(self, basecalls, scfbaseprobs):
@@ -1323,10 +1674,10 @@ class SCFSequenceTrace(SequenceTrace):
                 # to an error probability and a final phred-type score.
                 probsum = 0.0
                 for sbase in codes_to_sum[base]:
-                    probsum += 1.0 - (10.0 ** (scfbaseprobs[sbase][cnt] / -10.0))
+                    probsum += qualmath.correctProb(scfbaseprobs[sbase][cnt])
                 # Convert the sum back to an error probability and a phred
                 # score.
-                qscore = int(round(-10 * math.log10(1.0 - probsum), 0))
+                qscore = int(round(qualmath.phredScore(1.0 - probsum), 0))
                 cscores.append(qscore)
             else:
                 raise SCFError('Unrecognized base call code in SCF file: ' + base)
@@ -1334,67 +1685,40 @@ class SCFSequenceTrace(SequenceTrace):
         return cscores
 
     def readTraceData(self, numsamps, sampstart, sampsize):
-        if sampsize == 1:
-            formatstr = 'B'
-        else:
-            formatstr = '>H'
-
         self.tf.seek(sampstart, 0)
 
-        maxval = 0
+        # Read the raw sample data for all four channels at once.
+        chansize = numsamps * sampsize
+        sampdata = self.tf.read(chansize * 4)
 
-        for base in ('A', 'C', 'G', 'T'):
-            samps = list()
+        maxval = 0
 
-            try:
-                # read the raw sample data
-                for cnt in range(0, numsamps):
-                    val = unpack(formatstr, self.tf.read(sampsize))[0]
-                    samps.append(val)
-            except struct.error:
-                raise SCFDataError((numsamps * sampsize), (len(samps) * sampsize))
+        for basenum, base in enumerate(('A', 'C', 'G', 'T')):
+            start = basenum * chansize
+            rawsamps = sampdata[start:start + chansize]
+            if len(rawsamps) != chansize:
+                raise SCFDataError(chansize, (len(rawsamps) / sampsize) * sampsize)
 
             # Sample values are double-delta encoded (i.e., two successive
             # rounds of differences).
             if sampsize == 1:
-                self.decode8BitDoubleDelta(samps)
+                # Expand the decoded 1-byte samples to 2-byte integers so that
+                # all samples can be stored the same way.
+                decoded = array.array('H', array.array('B', _reverseDeltaFilter(rawsamps, 'B', 2)))
+                if _little_endian:
+                    decoded.byteswap()
+                decoded = decoded.tostring()
             else:
-                self.decode16BitDoubleDelta(samps)
+                decoded = _reverseDeltaFilter(rawsamps, 'H', 2)
 
-            self.tracesamps[base] = samps
-            tmpmax = max(self.tracesamps[base])
+            self.tracesamps[base] = self._makeSampleArray(decoded, 0, numsamps)
+            tmpmax = self._getMaxSampleVal(self.tracesamps[base])
             if tmpmax > maxval:
                 maxval = tmpmax
 
         self.max_traceval = maxval
         #print self.tracesamps['A']
 
-    def decode8BitDoubleDelta(self, data):
-        for clev in range(0, 2):
-            prev = 0
-            for cnt in range(0, len(data)):
-                actual = data[cnt] + prev
-
-                # simulate 1-byte integer overflow, if needed
-                if actual > 255:
-                    actual -= 256
-
-                prev = actual
-                data[cnt] = actual
-    
-    def decode16BitDoubleDelta(self, data):
-        for clev in range(0, 2):
-            prev = 0
-            for cnt in range(0, len(data)):
-                actual = data[cnt] + prev
-
-                # simulate 2-byte integer overflow, if needed
-                if actual > 65535:
-                    actual -= 65536
-
-                prev = actual
-                data[cnt] = actual
-
     def readComments(self, commentslen, commentsstart):
         """
         Reads the comments section of an SCF file.  There is some variation in
@@ -15,9 +15,6 @@
 
 
 from datetime import datetime
-import gi
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk
 
 
 
@@ -252,74 +249,3 @@ class NEXUSSeqWriter(SequenceWriter):
             self.fh.write(sequence['seq'] + '\n')
 
         self.fh.write('    ;\nEND;')
-
-
-class SeqWriterFileDialog(Gtk.FileChooserDialog):
-    """
-    A file save/save as dialog that is aware of the various sequence formats
-    supported by this module.  It can also display additional options to the
-    user.  Finally, it can ensure that all file names returned have an
-    appropriate extension.
-    """
-    formats = {
-            'FASTA (*.fasta)': [FORMAT_FASTA, '.fasta'],
-            'NEXUS (*.nex)': [FORMAT_NEXUS, '.nex'],
-            'plain text (*.txt)': [FORMAT_PLAINTEXT, '.txt']
-            }
-
-    def __init__(self, parent=None, title=None):
-        Gtk.FileChooserDialog.__init__(
-            self, title, parent, Gtk.FileChooserAction.SAVE,
-            (Gtk.STOCK_SAVE, Gtk.ResponseType.OK, Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL)
-        )
-
-        self.set_do_overwrite_confirmation(True)
-
-        self.check_extension = True
-        self.show_options = False
-
-        # Add file filters for the supported sequence formats.
-        for name, details in self.formats.items():
-            ff = Gtk.FileFilter()
-            ff.set_name(name)
-            ff.add_pattern('*' + details[1])
-            self.add_filter(ff)
-
-        # Add a checkbox to allow the user to choose whether or not to include
-        # file names.
-        self.fnames_toggle = Gtk.CheckButton(
-            "include trace file names in exported file"
-        )
-        self.fnames_toggle.set_active(True)
-        self.set_extra_widget(self.fnames_toggle)
-        self.fnames_toggle.set_visible(self.show_options)
-
-    def setCheckExtension(self, newval):
-        self.check_extension = newval
-
-    def setShowOptions(self, newval):
-        self.show_options = newval
-        self.fnames_toggle.set_visible(self.show_options)
-
-    def getFileFormat(self):
-        ff = self.get_filter()
-
-        return self.formats[ff.get_name()][0]
-
-    def getIncludeFileNames(self):
-        return self.fnames_toggle.get_active()
-
-    def get_filename(self):
-        name = Gtk.FileChooserDialog.get_filename(self)
-
-        if name and self.check_extension:
-            ff = self.get_filter()
-            extension = self.formats[ff.get_name()][1]
-
-            # Make sure the file name has the proper extension for the chosen
-            # file type.
-            if not(name.endswith(extension)):
-                name += extension
-
-        return name
-
@@ -16,239 +16,239 @@
 
 from collections import deque
 
-import gi
-gi.require_version('Gtk', '3.0')
-gi.require_version('Pango', '1.0')
-from gi.repository import Gtk
-from gi.repository import Pango
-
+import locale
 import os.path
 
 from seqtrace.core.consens import ConsensSeqSettings
+from seqtrace.core.fwdrev import FwdRevMatchIter
 from seqtrace.core.observable import Observable
 from seqtrace.core.stproject_io import SeqTraceProjReader, SeqTraceProjWriter
-from seqtrace.gui import getDefaultFont
 
 
-class TreeStoreProjectItem:
-    def __init__(self, tsiter, project):
-        self.tsiter = tsiter
-        self.proj = project
-        self.ts = project.getTreeStore()
+# Constants for the item properties.  These are also the column numbers of the
+# properties in the GUI's view of a project (see
+# seqtrace.gui.projviewer.ProjectTreeStore).
+#
+# 0: file name/node name
+# 1: node type (either 'file' or 'frwdrev')
+# 2: node ID number
+# 3: True if consensus sequence has been approved for this node
+# 4: compact consensus sequence for this node
+# 5: full consensus sequence for this node (with spaces)
+# 6: True if this node has a consensus sequence
+# 7: notes/description for an item
+# 8: whether or not this is a reverse sequencing read
+FILE_NAME = 0
+NODE_TYPE = 1
+NODE_ID = 2
+USE_CONS = 3
+COMPACT_CONS = 4
+FULL_CONS = 5
+HAS_CONS = 6
+NOTES = 7
+IS_REVERSE = 8
 
-    def getTsiter(self):
-        return self.tsiter
+# Constants for the sort order of project items.  These have the same values as
+# Gtk.SortType.
+SORT_ASCENDING = 0
+SORT_DESCENDING = 1
+
+
+class ProjectItem(object):
+    """
+    A single project item, which is either a trace file or a forward/reverse
+    group of two trace files.  All changes to an item are reported to its
+    project so that the project's indexes and any views of the project can be
+    kept up to date.
+    """
+    __slots__ = (
+        'proj', 'name', 'itemtype', 'node_id', 'use_cons', 'compact_cons',
+        'full_cons', 'has_cons', 'notes', 'is_reverse', 'parent', 'children'
+    )
+
+    def __init__(self, project, name, itemtype, node_id, use_cons=False, compact_cons='',
+            full_cons='', has_cons=False, notes='', is_reverse=False):
+        self.proj = project
+        self.name = name
+        self.itemtype = itemtype
+        self.node_id = node_id
+        self.use_cons = use_cons
+        self.compact_cons = compact_cons
+        self.full_cons = full_cons
+        self.has_cons = has_cons
+        self.notes = notes
+        self.is_reverse = is_reverse
+        self.parent = None
+        self.children = ()
+
+    def getRowData(self):
+        """
+        Returns a tuple of the item's properties, in the order of the property
+        constants.
+        """
+        return (
+            self.name, self.itemtype, self.node_id, self.use_cons,
+            self.compact_cons, self.full_cons, self.has_cons, self.notes,
+            self.is_reverse
+        )
 
     def isValid(self):
-        return self.ts.iter_is_valid(self.tsiter)
+        return self.proj.getItemById(self.node_id) is self
 
     def getName(self):
-        return self.ts.get_value(self.tsiter, FILE_NAME)
+        return self.name
 
     def setName(self, newname):
-        oldname = self.ts.get_value(self.tsiter, FILE_NAME)
-
-        self.ts.set_value(self.tsiter, FILE_NAME, newname)
-
-        if oldname != newname:
-            self.proj.setSaveState(False)
+        if self.name != newname:
+            oldname = self.name
+            self.name = newname
+            self.proj.itemChanged(self, oldname)
 
     def getFileNames(self):
-        if self.ts.get_value(self.tsiter, NODE_TYPE) == 'file':
-            return (self.ts.get_value(self.tsiter, FILE_NAME),)
-        elif self.ts.get_value(self.tsiter, NODE_TYPE) == 'frwdrev':
-            f1 = self.ts.iter_children(self.tsiter)
-            f2 = self.ts.iter_next(f1)
-            return (self.ts.get_value(f1, FILE_NAME), self.ts.get_value(f2, FILE_NAME))
+        if self.itemtype == 'file':
+            return (self.name,)
+        elif self.itemtype == 'frwdrev':
+            return (self.children[0].name, self.children[1].name)
 
     def isFile(self):
-        return self.ts.get_value(self.tsiter, NODE_TYPE) == 'file'
+        return self.itemtype == 'file'
 
     def getItemType(self):
-        return self.ts.get_value(self.tsiter, NODE_TYPE)
+        return self.itemtype
 
     def setItemType(self, newtype):
-        oldval = self.ts.get_value(self.tsiter, NODE_TYPE)
-
-        self.ts.set_value(self.tsiter, NODE_TYPE, newtype)
-
-        if oldval != newtype:
-            self.proj.setSaveState(False)
+        if self.itemtype != newtype:
+            # Remove the item from the file index before changing its type.
+            self.proj._unindexFile(self)
+            self.itemtype = newtype
+            self.proj._indexFile(self)
+            self.proj.itemChanged(self)
 
     def hasSequence(self):
-        return self.ts.get_value(self.tsiter, HAS_CONS)
+        return self.has_cons
 
     def getUseSequence(self):
-        return self.ts.get_value(self.tsiter, USE_CONS)
+        return self.use_cons
 
     def setUseSequence(self, use_sequence):
-        oldval = self.ts.get_value(self.tsiter, USE_CONS)
-
-        self.ts.set_value(self.tsiter, USE_CONS, use_sequence)
-
-        if oldval != use_sequence:
-            self.proj.setSaveState(False)
+        if self.use_cons != use_sequence:
+            self.use_cons = use_sequence
+            self.proj.itemChanged(self)
 
     def toggleUseSequence(self):
-        oldval = self.ts.get_value(self.tsiter, USE_CONS)
-        self.ts.set_value(self.tsiter, USE_CONS, not(oldval))
-        self.proj.setSaveState(False)
+        self.use_cons = not(self.use_cons)
+        self.proj.itemChanged(self)
 
     def setConsensusSequence(self, compact_consens, full_consens):
-        oldcons = self.ts.get_value(self.tsiter, FULL_CONS)
+        oldcons = self.full_cons
 
-        self.ts.set_value(self.tsiter, COMPACT_CONS, compact_consens)
-        self.ts.set_value(self.tsiter, FULL_CONS, full_consens)
+        self.compact_cons = compact_consens
+        self.full_cons = full_consens
 
         if full_consens != '':
-            self.ts.set_value(self.tsiter, HAS_CONS, True)
+            self.has_cons = True
         else:
-            self.ts.set_value(self.tsiter, HAS_CONS, False)
-            self.ts.set_value(self.tsiter, USE_CONS, False)
+            self.has_cons = False
+            self.use_cons = False
 
-        if oldcons != full_consens:
-            self.proj.setSaveState(False)
+        self.proj.itemChanged(self, save=(oldcons != full_consens))
 
     def deleteConsensusSequence(self):
         self.setConsensusSequence('', '')
 
     def getCompactConsSequence(self):
-        return self.ts.get_value(self.tsiter, COMPACT_CONS)
+        return self.compact_cons
 
     def getFullConsSequence(self):
-        return self.ts.get_value(self.tsiter, FULL_CONS)
+        return self.full_cons
 
     def getIsReverse(self):
-        return self.ts.get_value(self.tsiter, IS_REVERSE)
+        return self.is_reverse
 
     def setIsReverse(self, is_reverse):
-        oldval = self.ts.get_value(self.tsiter, IS_REVERSE)
-
-        self.ts.set_value(self.tsiter, IS_REVERSE, is_reverse)
-
-        if oldval != is_reverse:
-            self.proj.setSaveState(False)
+        if self.is_reverse != is_reverse:
+            self.is_reverse = is_reverse
+            self.proj.itemChanged(self)
 
     def toggleIsReverse(self):
-        oldval = self.ts.get_value(self.tsiter, IS_REVERSE)
-        self.ts.set_value(self.tsiter, IS_REVERSE, not(oldval))
-        self.proj.setSaveState(False)
+        self.is_reverse = not(self.is_reverse)
+        self.proj.itemChanged(self)
 
     def getNotes(self):
-        return self.ts.get_value(self.tsiter, NOTES)
+        return self.notes
 
     def setNotes(self, newnotes):
-        oldnotes = self.ts.get_value(self.tsiter, NOTES)
-
-        self.ts.set_value(self.tsiter, NOTES, newnotes)
-
-        if oldnotes != newnotes:
-            self.proj.setSaveState(False)
+        if self.notes != newnotes:
+            self.notes = newnotes
+            self.proj.itemChanged(self)
 
     def getId(self):
-        return self.ts.get_value(self.tsiter, NODE_ID)
+        return self.node_id
 
     def hasParent(self):
-        parent = self.ts.iter_parent(self.tsiter)
-        if parent == None:
-            return False
-        else:
-            return True
+        return self.parent is not None
 
     def getParent(self):
-        if self.hasParent():
-            return TreeStoreProjectItem(self.ts.iter_parent(self.tsiter), self.proj)
-        else:
-            return None
+        return self.parent
 
     def getChildren(self):
-        if self.ts.get_value(self.tsiter, NODE_TYPE) == 'frwdrev':
-            ch1iter = self.ts.iter_children(self.tsiter)
-            child1 = TreeStoreProjectItem(ch1iter, self.proj)
-            child2 = TreeStoreProjectItem(self.ts.iter_next(ch1iter), self.proj)
-            return (child1, child2)
+        if self.itemtype == 'frwdrev':
+            return self.children
         else:
             return ()
 
 
-# An iterator to traverse all root-level items in a project.
+# An iterator to traverse all root-level items in a project, in the project's
+# sort order.
 class ProjectIter:
     def __init__(self, project):
-        self.project = project
-        self.ts = project.getTreeStore()
-        self.length = self.ts.iter_n_children(None)
-        
-        self.tsiter = self.ts.get_iter_first()
+        self.items = project.getSortedItems()
+        self.index = 0
 
     def __iter__(self):
         return self
 
     def __len__(self):
-        return self.length
+        return len(self.items)
 
     def next(self):
-        if self.tsiter != None:
-            item = self.project.getItemByTsiter(self.tsiter)
-            self.tsiter = self.ts.iter_next(self.tsiter)
-            return item
+        if self.index < len(self.items):
+            self.index += 1
+            return self.items[self.index - 1]
         else:
             raise StopIteration
 
 
-# Constants that specify which values are held by each column in a project's
-# TreeStore.
-#
-# 0: file name/node name
-# 1: node type (either 'file' or 'frwdrev')
-# 2: node ID number
-# 3: True if consensus sequence has been approved for this node
-# 4: compact consensus sequence for this node
-# 5: full consensus sequence for this node (with spaces)
-# 6: True if this node has a consensus sequence
-# 7: notes/description for an item
-# 8: whether or not this is a reverse sequencing read
-FILE_NAME = 0
-NODE_TYPE = 1
-NODE_ID = 2
-USE_CONS = 3
-COMPACT_CONS = 4
-FULL_CONS = 5
-HAS_CONS = 6
-NOTES = 7
-IS_REVERSE = 8
-
 class SequenceTraceProject(Observable):
+    """
+    A SeqTrace project.  The project items are plain Python objects (see
+    ProjectItem) that are indexed by ID and by trace file name, so looking up
+    items does not depend on the number of items in the project.  The project
+    does not use Gtk; the GUI keeps its view of the project up to date by
+    observing the events "items_reset", "items_added", "items_removed", and
+    "item_changed".
+    """
     def __init__(self):
-        self.ts = Gtk.TreeStore(str, str, int, bool, str, str, bool, str, bool)
-
-        # Make sure the TreeStore supports persistant iterators
-        # since a few of the project methods require this feature.
-        if (self.ts.get_flags() & Gtk.TreeModelFlags.ITERS_PERSIST) == 0:
-            raise Exception
-
-        self.numcols = 9
         self.save_state = True
 
+        # initialize observable events
+        self.defineObservableEvents([
+            'save_state_change', 'project_filename_change', 'files_added',
+            'files_removed', 'file_loaded', 'project_cleared', 'items_reset',
+            'items_added', 'items_removed', 'item_changed'
+        ])
+
         self.setConsensSeqSettings(ConsensSeqSettings())
 
         # initialize a blank project
         self.clearProject(False)
 
         # sort by file names by default
-        self.setSortBy(FILE_NAME, Gtk.SortType.ASCENDING)
-
-        # initialize observable events
-        self.defineObservableEvents([
-            'save_state_change', 'project_filename_change', 'files_added',
-            'files_removed', 'file_loaded', 'project_cleared'
-        ])
+        self.setSortBy(FILE_NAME, SORT_ASCENDING)
 
     def __iter__(self):
         return ProjectIter(self)
 
-    def getTreeStore(self):
-        return self.ts
-
     def clearProject(self, notify=True):
         # start numbering for node IDs at 0 by default
         self.idnum = 0
@@ -258,7 +258,10 @@ class SequenceTraceProject(Observable):
         self.fwd_trace_searchstr = '_F'
         self.rev_trace_searchstr = '_R'
 
-        self.default_font = getDefaultFont()
+        self.use_trace_cache = False
+
+        # The font description string, or None for the GUI's default font.
+        self.font_str = None
 
         # Copy default consensus sequence settings rather than change
         # references to a new settings object in case there are any active
@@ -266,15 +269,112 @@ class SequenceTraceProject(Observable):
         settings = ConsensSeqSettings()
         self.consseqsettings.copyFrom(settings)
 
-        self.ts.clear()
-        self.num_files = 0
+        self._clearItems()
 
         self.setSaveState(True)
+        self.notifyObservers('items_reset', ())
         if notify:
            self.notifyObservers('project_cleared', ())
 
+    def _clearItems(self):
+        # The root-level items, in the order they were added.
+        self.rootitems = []
+        # The root-level items in sort order, or None if they must be sorted.
+        self.sorteditems = None
+        # Maps item IDs to all items, including child items.
+        self.itemsbyid = {}
+        # Maps file names (paths relative to the trace file folder) to the
+        # IDs of the file items with that name.
+        self.filesbyname = {}
+        self.num_files = 0
+
     def isProjectEmpty(self):
-        return self.ts.get_iter_first() == None
+        return len(self.rootitems) == 0
+
+    def _addItem(self, item, parent=None):
+        """
+        Adds an item and its children to the project's indexes.  If parent is
+        None, the item is added at the root level.
+        """
+        item.parent = parent
+        if parent is None:
+            self.rootitems.append(item)
+            self.sorteditems = None
+
+        self.itemsbyid[item.getId()] = item
+        self._indexFile(item)
+
+        for child in item.children:
+            self._addItem(child, item)
+
+    def _removeItem(self, item):
+        """
+        Removes an item and its children from the project's indexes.  The item
+        keeps its children.
+        """
+        if item.parent is None:
+            self.rootitems.remove(item)
+            self.sorteditems = None
+
+        del self.itemsbyid[item.getId()]
+        self._unindexFile(item)
+
+        for child in item.children:
+            self._removeItem(child)
+
+    def _indexFile(self, item):
+        if item.isFile():
+            self.filesbyname.setdefault(item.getName(), set()).add(item.getId())
+            self.num_files += 1
+
+    def _unindexFile(self, item, name=None):
+        if item.isFile():
+            if name is None:
+                name = item.getName()
+            ids = self.filesbyname[name]
+            ids.discard(item.getId())
+            if len(ids) == 0:
+                del self.filesbyname[name]
+            self.num_files -= 1
+
+    def _newItemId(self):
+        self.idnum += 1
+        return self.idnum - 1
+
+    def itemChanged(self, item, oldname=None, save=True):
+        """
+        Called by project items whenever any of their properties change.
+        oldname should be provided if the item's name changed, and if save is
+        False, the change does not affect the project's save state.
+        """
+        if oldname is not None:
+            self._unindexFile(item, oldname)
+            self._indexFile(item)
+
+        if item.parent is None:
+            self.sorteditems = None
+
+        self.notifyObservers('item_changed', (item,))
+        if save:
+            self.setSaveState(False)
+
+    def getSortedItems(self):
+        """
+        Returns a list of the root-level items in the project's sort order.
+        """
+        if self.sorteditems is None:
+            if self.sort_property in (FILE_NAME, NOTES):
+                # Sort strings the same way as the GUI's view of the project.
+                keyfunc = lambda item: locale.strxfrm(item.getRowData()[self.sort_property])
+            else:
+                keyfunc = lambda item: item.getRowData()[self.sort_property]
+
+            self.sorteditems = sorted(
+                self.rootitems, key=keyfunc,
+                reverse=(self.sort_order == SORT_DESCENDING)
+            )
+
+        return self.sorteditems
 
     def loadProjectFile(self, filename):
         reader = SeqTraceProjReader()
@@ -287,57 +387,47 @@ class SequenceTraceProject(Observable):
         self.setTraceFileDir(reader.getProperty('trace_file_dir'))
         self.setFwdTraceSearchStr(reader.getProperty('fwd_trace_searchstr'))
         self.setRevTraceSearchStr(reader.getProperty('rev_trace_searchstr'))
+        self.setUseTraceCache(reader.getProperty('use_trace_cache', False))
 
-        # Load the font from the string description.  One might think that this
-        # could crash if a required font is not installed on a user's system,
-        # but it turns out that Pango handles these situations quite
-        # gracefully.  For example, if the font string is "fake font 12", Pango
-        # will use a default font face and still preserve the preferred size
-        # (12, in this case).
-        fontstr = reader.getProperty('default_font')
-        fontdesc = Pango.FontDescription.from_string(fontstr)
-        self.setFont(fontdesc)
+        # Project files from before version 1.0.0 do not specify a font, which
+        # means that the default font is used.
+        self.setFontString(reader.getProperty('default_font'))
 
         self.consseqsettings.copyFrom(reader.getConsensSeqSettings())
 
-        # Load the data into the TreeStore.
-        for item in reader:
-            row = self.ts.append(
-                None, (
-                    item.getName(), item.getItemType(), self.idnum,
-                    item.getUseSequence(), item.getCompactConsSequence(),
-                    item.getFullConsSequence(), item.hasSequence(),
-                    item.getNotes(), item.getIsReverse()
-                )
-            )
-            self.idnum += 1
-            if item.isFile():
-                self.num_files += 1
-
-            for child in item.getChildren():
-                self.ts.append(
-                    row, (
-                        child.getName(), child.getItemType(), self.idnum,
-                        child.getUseSequence(), child.getCompactConsSequence(),
-                        child.getFullConsSequence(), child.hasSequence(),
-                        child.getNotes(), child.getIsReverse()
-                    )
-                )
-                self.idnum += 1
-                self.num_files += 1
+        # Build the project items.
+        for itemdata in reader:
+            item = self._newItemFromData(itemdata)
+            children = [self._newItemFromData(child) for child in itemdata.getChildren()]
+            if len(children) == 2:
+                item.children = tuple(children)
+            self._addItem(item)
 
         # store the full, normalized path for the project file
         self.project_file = os.path.abspath(filename)
         self.setSaveState(True)
+        self.notifyObservers('items_reset', ())
         self.notifyObservers('file_loaded', ())
 
+    def _newItemFromData(self, itemdata):
+        return ProjectItem(
+            self, itemdata.getName(), itemdata.getItemType(), self._newItemId(),
+            itemdata.getUseSequence(), itemdata.getCompactConsSequence(),
+            itemdata.getFullConsSequence(), itemdata.hasSequence(),
+            itemdata.getNotes(), itemdata.getIsReverse()
+        )
+
     def saveProjectFile(self, filename=''):
         writer = SeqTraceProjWriter()
 
         writer.addProperty('trace_file_dir', self.trace_file_dir)
         writer.addProperty('fwd_trace_searchstr', self.fwd_trace_searchstr)
         writer.addProperty('rev_trace_searchstr', self.rev_trace_searchstr)
-        writer.addProperty('default_font', self.getFont().to_string())
+        writer.addProperty('use_trace_cache', self.use_trace_cache)
+        # The font is only saved if it was set, so a project that uses the
+        # default font keeps using the GUI's default font.
+        if self.font_str is not None:
+            writer.addProperty('default_font', self.font_str)
         writer.setConsensSeqSettings(self.consseqsettings)
 
         # get each item from the project
@@ -355,34 +445,37 @@ class SequenceTraceProject(Observable):
         self.setSaveState(True)
 
     def addFiles(self, filepaths):
+        """
+        Adds a list of trace files to the project.  Observers are notified
+        once, after all of the files have been added.
+        """
+        tracedir = self.getAbsTraceFileDir()
+        rev_str = self.getRevTraceSearchStr()
+
+        newitems = []
         for fpath in filepaths:
-            rel_fpath = os.path.relpath(fpath, self.getAbsTraceFileDir())
+            rel_fpath = os.path.relpath(fpath, tracedir)
 
             # Consider newly-added trace files to be forward reads by default...
             is_rev = False
             # unless they match the reverse search string.
-            if os.path.basename(rel_fpath).find(self.getRevTraceSearchStr()) != -1:
+            if os.path.basename(rel_fpath).find(rev_str) != -1:
                 is_rev = True
 
             # add the new trace file
-            self.ts.append(None, (rel_fpath, 'file', self.idnum, False, '', '', False, '', is_rev))
-            self.idnum += 1
-            self.num_files += 1
+            item = ProjectItem(self, rel_fpath, 'file', self._newItemId(), is_reverse=is_rev)
+            self._addItem(item)
+            newitems.append(item)
 
+        self.notifyObservers('items_added', (newitems,))
         self.setSaveState(False)
         self.notifyObservers('files_added', ())
 
-    # rev_index specifies which one of the items should be treated as a reverse sequencing read.  If
-    # index < 0 or index > 1, neither item will be marked as a reverse read.
     def associateItems(self, items, node_name):
         # verify we only got two rows
         if len(items) != 2:
             raise Exception()
 
-        # get treestore references to the selected rows
-        f1 = items[0].getTsiter()
-        f2 = items[1].getTsiter()
-
         # make sure they are both files
         if not(items[0].isFile()) or not(items[1].isFile()):
             raise Exception()
@@ -391,19 +484,29 @@ class SequenceTraceProject(Observable):
         if (items[0].hasParent()) or (items[1].hasParent()):
             raise Exception()
 
-        # create a new associative node and add the selected nodes as children
-        parent = self.ts.insert_before(None, f1, (node_name, 'frwdrev', self.idnum, False, '', '', False, '', False))
-        self.idnum += 1
+        for item in items:
+            self._removeItem(item)
+        self.notifyObservers('items_removed', (items,))
 
-        self.moveRowToParent(f1, parent)
-        self.moveRowToParent(f2, parent)
+        # create a new associative node with the selected items as children
+        parent = ProjectItem(self, node_name, 'frwdrev', self._newItemId())
+        parent.children = (items[0], items[1])
+        self._addItem(parent)
+        self.notifyObservers('items_added', ((parent,),))
 
         self.setSaveState(False)
 
-        return TreeStoreProjectItem(parent, self)
+        return parent
 
     def setSortBy(self, item_property, order):
-        self.ts.set_sort_column_id(item_property, order)
+        """
+        Sets the order of the project's items.  item_property is one of the
+        property constants (e.g., FILE_NAME), and order is either
+        SORT_ASCENDING or SORT_DESCENDING.
+        """
+        self.sort_property = item_property
+        self.sort_order = order
+        self.sorteditems = None
 
     def getFwdTraceSearchStr(self):
         return self.fwd_trace_searchstr
@@ -421,6 +524,25 @@ class SequenceTraceProject(Observable):
             self.rev_trace_searchstr = new_str
             self.setSaveState(False)
 
+    def getUseTraceCache(self):
+        return self.use_trace_cache
+
+    def setUseTraceCache(self, use_trace_cache):
+        if self.use_trace_cache != use_trace_cache:
+            self.use_trace_cache = use_trace_cache
+            self.setSaveState(False)
+
+    def getTraceCacheDir(self):
+        """
+        Returns the location of the on-disk trace cache for this project, which
+        is a folder next to the project file.  If the project has not been
+        saved, returns an empty string.
+        """
+        if self.project_file == '':
+            return ''
+
+        return os.path.splitext(self.project_file)[0] + '_tracecache'
+
     def getConsensSeqSettings(self):
         return self.consseqsettings
 
@@ -428,13 +550,39 @@ class SequenceTraceProject(Observable):
         self.consseqsettings = settings
         self.consseqsettings.registerObserver('settings_change', (lambda: self.setSaveState(False)))
 
+    def getFontString(self):
+        """
+        Returns the project's font as a Pango font description string, or None
+        if the project uses the GUI's default font.
+        """
+        return self.font_str
+
+    def setFontString(self, fontstr):
+        if self.font_str != fontstr:
+            self.font_str = fontstr
+            self.setSaveState(False)
+
     def getFont(self):
-        return self.default_font
+        """
+        Returns the project's font as a Pango.FontDescription.  This method
+        (and setFont()) requires Gtk, so it should only be used by the GUI.
+        """
+        from seqtrace.gui import getDefaultFont
+        from gi.repository import Pango
+
+        if self.font_str is None:
+            return getDefaultFont()
+        else:
+            # One might think that this could crash if a required font is not
+            # installed on a user's system, but it turns out that Pango handles
+            # these situations quite gracefully.  For example, if the font
+            # string is "fake font 12", Pango will use a default font face and
+            # still preserve the preferred size (12, in this case).
+            return Pango.FontDescription.from_string(self.font_str)
 
     def setFont(self, fontdesc):
-        if self.default_font.to_string() != fontdesc.to_string():
-            self.default_font = fontdesc
-            self.setSaveState(False)
+        if self.getFont().to_string() != fontdesc.to_string():
+            self.setFontString(fontdesc.to_string())
 
     def getSaveState(self):
         return self.save_state
@@ -471,7 +619,7 @@ class SequenceTraceProject(Observable):
         if self.trace_file_dir != trace_file_dir:
             self.trace_file_dir = trace_file_dir
             self.setSaveState(False)
-    
+
     def getAbsTraceFileDir(self):
         return os.path.abspath(os.path.join(self.getProjectDir(), self.getTraceFileDir()))
 
@@ -482,66 +630,45 @@ class SequenceTraceProject(Observable):
         """
         rel_fpath = os.path.relpath(fpath, self.getAbsTraceFileDir())
 
-        # Search for the file name in the treestore.  This algorithm avoids
-        # recursive calls but assumes that the tree is no more than two levels
-        # deep.
-        for row in self.ts:
-            if (row[NODE_TYPE] == 'file') and (row[FILE_NAME] == rel_fpath):
-                return True
-            for childrow in row.iterchildren():
-                if (childrow[NODE_TYPE] == 'file') and (childrow[FILE_NAME] == rel_fpath):
-                    return True
-        return False
+        return rel_fpath in self.filesbyname
+
+    def getFilesInProject(self, filepaths):
+        """
+        Returns a list of the files in filepaths that are already in the
+        project, in the same order as filepaths.  As with isFileInProject(),
+        the paths should be absolute paths.
+        """
+        tracedir = self.getAbsTraceFileDir()
+
+        return [
+            fpath for fpath in filepaths
+            if os.path.relpath(fpath, tracedir) in self.filesbyname
+        ]
 
     def getNumItems(self):
-        return self.ts.iter_n_children(None)
+        return len(self.rootitems)
 
     def getNumFiles(self):
         return self.num_files
 
     def getItemById(self, idnum):
-        # search for the specified row ID in the treestore
-        # this algorithm avoids recursive calls but assumes that the tree
-        # is no more than two levels deep
-        for row in self.ts:
-            if row[NODE_ID] == idnum:
-                return TreeStoreProjectItem(row.iter, self)
-            for childrow in row.iterchildren():
-                if childrow[NODE_ID] == idnum:
-                    return TreeStoreProjectItem(childrow.iter, self)
-
-        return None
-
-    def getItemByPath(self, path):
-        tsiter = self.ts.get_iter(path)
-        return TreeStoreProjectItem(tsiter, self)
-
-    def getItemsByPaths(self, pathlist):
-        items = list()
-        for path in pathlist:
-            items.append(self.getItemByPath(path))
-
-        return items
-
-    def getItemByTsiter(self, tsiter):
-        return TreeStoreProjectItem(tsiter, self)
+        return self.itemsbyid.get(idnum)
 
     def removeAssociativeItem(self, item):
         # make sure it is a file association row
         if item.isFile():
             raise Exception()
 
-        # get a treestore reference to the item
-        f1 = item.getTsiter()
-
-        # move the child nodes to the root level
-        citer = self.ts.iter_children(f1)
-        while citer != None:
-            self.moveRowToParent(citer, None)
-            citer = self.ts.iter_children(f1)
+        # delete the associative node and move the child nodes to the root
+        # level
+        children = item.getChildren()
+        self._removeItem(item)
+        self.notifyObservers('items_removed', ((item,),))
 
-        # delete the associative node
-        self.ts.remove(f1)
+        item.children = ()
+        for child in children:
+            self._addItem(child)
+        self.notifyObservers('items_added', (children,))
 
         self.setSaveState(False)
 
@@ -549,32 +676,35 @@ class SequenceTraceProject(Observable):
         parent_items = list()
 
         # delete the items that are actually files
+        removed = []
         for item in itemlist:
-            if item.isFile():
+            if item.isFile() and item.isValid():
                 # if this node was a child of an associative node, save a reference to the parent
                 if item.hasParent():
-                    parent_items.append(item.getParent())
-                self.ts.remove(item.getTsiter())
-                self.num_files -= 1
+                    parent = item.getParent()
+                    if parent not in parent_items:
+                        parent_items.append(parent)
+                    parent.children = tuple([child for child in parent.children if child is not item])
+
+                self._removeItem(item)
+                removed.append(item)
+        self.notifyObservers('items_removed', (removed,))
 
         # clean up parent items that have one or no children left
         for parent in parent_items:
             if parent.isValid():
-                child = self.ts.iter_children(parent.getTsiter())
-                if child != None:
-                    data = self.ts.get(child, *range(self.numcols))
-                    self.ts.remove(child)
-                    self.ts.insert_before(None, parent.getTsiter(), data)
-                self.ts.remove(parent.getTsiter())
+                children = parent.children
+                self._removeItem(parent)
+                self.notifyObservers('items_removed', ((parent,),))
+
+                parent.children = ()
+                for child in children:
+                    self._addItem(child)
+                self.notifyObservers('items_added', (children,))
 
         self.setSaveState(False)
         self.notifyObservers('files_removed', ())
 
-    def moveRowToParent(self, row, parent):
-        data = self.ts.get(row, *range(self.numcols))
-        self.ts.remove(row)
-        self.ts.append(parent, data)
-
     def getFwdRevMatchIter(self, itemlist=None):
         items = deque()
 
@@ -589,73 +719,4 @@ class SequenceTraceProject(Observable):
                 if not(item.hasParent()) and item.isFile():
                     items.appendleft(item)
 
-        return FwdRevMatchIter(items, self)
-
-
-class FwdRevMatchIter:
-    def __init__(self, items, project):
-        self.items = items
-        self.ts = project.getTreeStore()
-        self.fwd_str = project.getFwdTraceSearchStr()
-        self.rev_str = project.getRevTraceSearchStr()
-
-    def __iter__(self):
-        return self
-
-    # returns a 3-tuple containing one matching pair plus their shared name: (forward file, reverse file, shared name)
-    def next(self):
-        while len(self.items) > 1:
-            item1 = self.items.pop()
-            item2 = None
-
-            item1file = item1.getName()
-
-            # see if this is a forward file
-            if item1file.find(self.fwd_str) != -1:
-                item2, sharedname = self.getMatch(item1file, self.fwd_str, self.rev_str)
-                if item2 != None:
-                    # return the matching pair
-                    self.items.remove(item2)
-                    return (item1, item2, sharedname)
-
-            # if the forward match failed, see if it is a reverse file
-            if (item2 == None) and (item1file.find(self.rev_str) != -1):
-                item2, sharedname = self.getMatch(item1file, self.rev_str, self.fwd_str)
-                if item2 != None:
-                    # return the matching pair
-                    self.items.remove(item2)
-                    return (item2, item1, sharedname)
-
-        raise StopIteration
-
-    def getMatch(self, name, key1, key2):
-        """ Searches for key1 in name and checks if any names with key2 substituted for key1 exist
-        in self.items.  If key occurs more than once in name, each match of key1 in name is checked
-        separately.  If a matching item is found, the search is stopped and the matching item is
-        returned with the shared name; otherwise, None and '' are returned. """
-
-        item2 = None
-        sharedname = ''
-
-        # find all matches of key1 in the name
-        split = name.split(key1)
-
-        # Go through each match of key1 in the name, construct the "opposite" name, and
-        # see if it exists in self.items.  Quit as soon as a matching opposite is found.
-        for cnt in range(1, len(split)):
-            # construct the "opposite" name
-            matchfile = key1.join(split[:cnt]) + key2 + key1.join(split[cnt:])
-            # construct the common name shared by the pair
-            sharedname = key1.join(split[:cnt]) + key1.join(split[cnt:])
-
-            # now try to find the other file of the pair
-            for item in self.items:
-                if item.getName() == matchfile:
-                    item2 = item
-                    break
-
-            if item2 != None:
-                break
-
-        return (item2, sharedname)
-
+        return FwdRevMatchIter(items, self.getFwdTraceSearchStr(), self.getRevTraceSearchStr())
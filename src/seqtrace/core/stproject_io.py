@@ -16,7 +16,6 @@
 
 import pickle
 from seqtrace.core.consens import ConsensSeqSettings
-from seqtrace.gui import getDefaultFont
 
 
 # Define the supported file format versions and the current version.
@@ -109,8 +108,13 @@ class SeqTraceProjReader:
                 or ('consseqsettings' not in self.proj_data)):
             raise FileDataError
 
-    def getProperty(self, key):
-        return self.proj_data['properties'][key]
+    def getProperty(self, key, default=None):
+        """
+        Returns the value of a project property, or default if the property
+        is not defined in the project file (e.g., for properties that were
+        added after the project file was created).
+        """
+        return self.proj_data['properties'].get(key, default)
 
     def convertOldProjectFormat(self):
         """
@@ -121,8 +125,9 @@ class SeqTraceProjReader:
             self.proj_data['formatversion'] = '0.9'
 
         if self.proj_data['formatversion'] == '0.9':
-            fontstr = getDefaultFont().to_string()
-            self.proj_data['properties']['default_font'] = fontstr
+            # Older project files have no font setting, which means that the
+            # default font should be used.  The default font can only be
+            # determined by the GUI, so the property is left undefined.
             self.proj_data['formatversion'] = CURRENT_VERSION
 
     def convertSettings8To9(self):
@@ -182,7 +187,7 @@ class SeqTraceProjReader:
 
 class ProjectItemData:
     """
-    This class has nearly the same interface as TreeStoreProjectItem, but it
+    This class has nearly the same interface as stproject.ProjectItem, but it
     does not depend on any of the Gtk tree store components and is therefore
     more suitable for exporting and importing project items from data files.
     """
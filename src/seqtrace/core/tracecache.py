@@ -0,0 +1,517 @@
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core.sequencetrace import (
+    SequenceTraceFactory, ZTRSequenceTrace, ABISequenceTrace, SCFSequenceTrace,
+    ST_ZTR, ST_ABI, ST_SCF, TS_LIST, TS_ARRAY, TS_MMAP, CONF_TYPECODE
+)
+
+import os
+import os.path
+import sys
+import array
+import mmap
+import struct
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# The default memory budget for the trace cache, in bytes.
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# The approximate size of a Python integer object, in bytes.
+_INT_SIZE = sys.getsizeof(1000)
+
+
+def estimateTraceSize(seqtrace):
+    """
+    Returns the approximate number of bytes of memory used by the data of a
+    sequence trace.
+    """
+    size = sys.getsizeof(seqtrace) + sys.getsizeof(seqtrace.basecalls)
+
+    datalists = seqtrace.tracesamps.values() + [seqtrace.basepos, seqtrace.bcconf]
+    for data in datalists:
+        if isinstance(data, array.array):
+            size += sys.getsizeof(data) + len(data) * data.itemsize
+        elif (numpy is not None) and isinstance(data, numpy.ndarray):
+            size += data.nbytes
+        else:
+            size += sys.getsizeof(data) + len(data) * _INT_SIZE
+
+    for key, value in seqtrace.comments.iteritems():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+
+    return size
+
+
+class TraceCache:
+    """
+    An in-memory, least-recently-used cache of parsed sequence traces.  Cache
+    entries are keyed by the absolute path of the trace file and are only
+    used if the file's modification time and size have not changed since it
+    was parsed.  Only forward traces are cached; a reverse-complemented trace
+    is a reverse-complemented view (see SequenceTrace.reverseComplement()) of
+    the cached forward trace, so it costs no extra memory and never requires
+    parsing the file again.  When the total size of the cached traces exceeds
+    the memory budget, the least recently used traces are discarded.
+
+    Each call to getTrace() returns a new SequenceTrace object that shares its
+    data with the cached trace, so callers are free to modify (e.g., reverse
+    complement) the traces they receive.
+    """
+    def __init__(self, maxbytes=DEFAULT_MAX_BYTES, sampstorage=TS_ARRAY):
+        self.maxbytes = maxbytes
+        self.sampstorage = sampstorage
+
+        # Maps each file path to (signature, trace, size).
+        self.entries = OrderedDict()
+        self.totalbytes = 0
+        self.lock = threading.Lock()
+
+        self.hitcnt = 0
+        self.loadcnt = 0
+
+    def getMaxBytes(self):
+        return self.maxbytes
+
+    def setMaxBytes(self, maxbytes):
+        with self.lock:
+            self.maxbytes = maxbytes
+            self._evict()
+
+    def getTotalBytes(self):
+        return self.totalbytes
+
+    def getNumTraces(self):
+        return len(self.entries)
+
+    def getHitCount(self):
+        """
+        Returns the number of requests that were served from the cache.
+        """
+        return self.hitcnt
+
+    def getLoadCount(self):
+        """
+        Returns the number of times a trace file was actually parsed.
+        """
+        return self.loadcnt
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.totalbytes = 0
+
+    def invalidate(self, filepath):
+        """
+        Removes a trace file from the cache.
+        """
+        filepath = os.path.abspath(filepath)
+        with self.lock:
+            self._remove(filepath)
+
+    def getTrace(self, filepath, reverse=False, diskcache=None):
+        """
+        Returns the sequence trace for the specified file, reverse complemented
+        if reverse is True.  The file is only parsed if it is not in the cache
+        or if it has changed since it was cached.  If diskcache is provided
+        (see DiskTraceCache), traces that are not in memory are loaded from
+        the on-disk cache, if possible.  Raises IOError if the file cannot be
+        read and TraceFileError if it cannot be parsed.
+        """
+        filepath = os.path.abspath(filepath)
+        signature = self._getFileSignature(filepath)
+
+        seqtrace = self._lookup(filepath, signature)
+        if seqtrace is None:
+            seqtrace = self._loadTrace(filepath, signature, diskcache)
+
+        seqtrace = seqtrace.copy()
+        if reverse:
+            seqtrace.reverseComplement(lazy=True)
+
+        return seqtrace
+
+    def hasTrace(self, filepath):
+        """
+        Returns True if getTrace() can return the trace for the specified file,
+        forward or reverse complemented, without parsing the file, that is, if
+        the trace is cached and the file has not changed.
+        """
+        filepath = os.path.abspath(filepath)
+        try:
+            signature = self._getFileSignature(filepath)
+        except IOError:
+            return False
+
+        with self.lock:
+            return (filepath in self.entries) and (self.entries[filepath][0] == signature)
+
+    def _getFileSignature(self, filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError as err:
+            raise IOError(err.errno, err.strerror, filepath)
+
+        return (stat.st_mtime, stat.st_size)
+
+    def _loadTrace(self, filepath, signature, diskcache=None):
+        seqtrace = SequenceTraceFactory.loadTraceFile(
+            filepath, self.sampstorage, diskcache
+        )
+        size = estimateTraceSize(seqtrace)
+        with self.lock:
+            self.loadcnt += 1
+            self._add(filepath, signature, seqtrace, size)
+
+        return seqtrace
+
+    def _lookup(self, key, signature):
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            entry = self.entries[key]
+            if entry[0] != signature:
+                # The file has changed, so the cached trace is stale.
+                self._remove(key)
+                return None
+
+            # Move the entry to the most recently used end of the cache.
+            del self.entries[key]
+            self.entries[key] = entry
+            self.hitcnt += 1
+
+            return entry[1]
+
+    # The remaining methods must be called while holding the lock.
+
+    def _add(self, key, signature, seqtrace, size):
+        self._remove(key)
+        self.entries[key] = (signature, seqtrace, size)
+        self.totalbytes += size
+        self._evict()
+
+    def _remove(self, key):
+        if key in self.entries:
+            self.totalbytes -= self.entries.pop(key)[2]
+
+    def _evict(self):
+        # Discard the least recently used traces until the cache is within its
+        # memory budget.
+        while (self.totalbytes > self.maxbytes) and (len(self.entries) > 0):
+            self.totalbytes -= self.entries.popitem(last=False)[1][2]
+
+
+# The process-wide trace cache.
+_trace_cache = TraceCache()
+
+def getTraceCache():
+    """
+    Returns the process-wide trace cache.
+    """
+    return _trace_cache
+
+
+class DiskTraceCache:
+    """
+    A persistent, on-disk cache of decoded sequence traces.  Each trace is
+    stored in its own file in the cache directory, in a compact binary form
+    that can be loaded with a single memory map and no decoding.  A cache file
+    begins with a header that records the cache format version, the byte
+    order of the data, and the modification time and size of the source trace
+    file.  A cache file is only used if all of these match; otherwise, the
+    trace is parsed again and the cache file is replaced.
+
+    The cache never raises errors: if a cache file cannot be read or written,
+    the trace is simply parsed from the source file.
+    """
+    # The cache file format version.  This must be incremented whenever the
+    # layout of the cache files changes.
+    FORMAT_VERSION = 2
+
+    MAGIC = 'STTRACE\0'
+
+    # The header fields are the magic number, format version, byte order (0
+    # for little-endian, 1 for big-endian), trace file type, source file
+    # modification time and size, number of base calls, number of trace
+    # samples, maximum trace value, size of the comments data, and the array
+    # type codes of the trace samples and confidence scores.
+    HEADER_FORMAT = '=8sHBBdQIIiIcc'
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+    # Each comment key and value is stored as its length followed by its
+    # characters, so keys and values can contain any characters.
+    STRLEN_FORMAT = '=I'
+    STRLEN_SIZE = struct.calcsize(STRLEN_FORMAT)
+
+    # Trace classes indexed by trace file type.
+    TRACE_CLASSES = {
+        ST_ZTR: ZTRSequenceTrace, ST_ABI: ABISequenceTrace, ST_SCF: SCFSequenceTrace
+    }
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+
+    def getCacheDir(self):
+        return self.cachedir
+
+    def getCachePath(self, filepath):
+        """
+        Returns the path of the cache file for a trace file.
+        """
+        pathhash = hashlib.sha1(os.path.abspath(filepath)).hexdigest()
+
+        return os.path.join(self.cachedir, pathhash + '.stc')
+
+    def clear(self):
+        """
+        Deletes all cache files.
+        """
+        if not(os.path.isdir(self.cachedir)):
+            return
+
+        for fname in os.listdir(self.cachedir):
+            if fname.endswith('.stc'):
+                try:
+                    os.remove(os.path.join(self.cachedir, fname))
+                except OSError:
+                    pass
+
+    def _getByteOrderFlag(self):
+        if sys.byteorder == 'little':
+            return 0
+        else:
+            return 1
+
+    def _getTraceType(self, seqtrace):
+        for ftype, traceclass in self.TRACE_CLASSES.iteritems():
+            if seqtrace.__class__ is traceclass:
+                return ftype
+
+        return None
+
+    def _getSampleTypeCode(self, samps):
+        if isinstance(samps, array.array):
+            return samps.typecode
+        elif (numpy is not None) and isinstance(samps, numpy.ndarray):
+            if samps.dtype.kind == 'i':
+                return 'h'
+            else:
+                return 'H'
+        elif (len(samps) > 0) and (min(samps) < 0):
+            return 'h'
+        else:
+            return 'H'
+
+    def _toBytes(self, typecode, values):
+        """
+        Returns the raw, native byte order data for a sequence of values.
+        Arrays that already have the requested type are used directly rather
+        than being copied one element at a time.
+        """
+        if isinstance(values, array.array) and (values.typecode == typecode):
+            return values.tostring()
+        elif (numpy is not None) and isinstance(values, numpy.ndarray):
+            return values.astype(numpy.dtype(typecode)).tostring()
+        else:
+            return array.array(typecode, values).tostring()
+
+    def _pad(self, data, alignment):
+        return '\0' * (-len(data) % alignment)
+
+    def loadTrace(self, filepath, sampstorage=TS_LIST):
+        """
+        Loads a trace from the cache.  Returns None if the trace is not in the
+        cache or if the cache file is not valid for the current trace file.
+        """
+        try:
+            stat = os.stat(filepath)
+            fin = open(self.getCachePath(filepath), 'rb')
+        except (OSError, IOError):
+            return None
+
+        try:
+            try:
+                data = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError):
+                return None
+        finally:
+            fin.close()
+
+        try:
+            return self._decodeTrace(data, filepath, stat, sampstorage)
+        except (struct.error, ValueError, KeyError):
+            # The cache file is damaged, so ignore it.
+            return None
+
+    def _decodeTrace(self, data, filepath, stat, sampstorage):
+        if len(data) < self.HEADER_SIZE:
+            return None
+
+        (magic, version, byteorder, ftype, mtime, fsize, numbases, numsamps,
+            maxval, commentslen, samptype, conftype) = struct.unpack_from(
+                self.HEADER_FORMAT, data, 0
+            )
+        if ((magic != self.MAGIC) or (version != self.FORMAT_VERSION)
+                or (byteorder != self._getByteOrderFlag())
+                or (mtime != stat.st_mtime) or (fsize != stat.st_size)):
+            return None
+
+        # Get the offsets of all of the data sections.
+        bcstart = self.HEADER_SIZE
+        posstart = bcstart + numbases + (-numbases % 4)
+        confstart = posstart + numbases * 4
+        confsize = numbases * array.array(conftype).itemsize
+        sampstart = confstart + confsize + (-confsize % 2)
+        commentsstart = sampstart + numsamps * 2 * 4
+        if (commentsstart + commentslen) != len(data):
+            return None
+
+        seqt = self.TRACE_CLASSES[ftype](sampstorage)
+        seqt.fname = filepath
+        seqt.max_traceval = maxval
+        seqt.basecalls = data[bcstart:bcstart + numbases]
+        seqt.basepos = array.array('I', data[posstart:confstart])
+        seqt.bcconf = array.array(conftype, data[confstart:confstart + confsize])
+
+        for basenum, base in enumerate(('A', 'C', 'G', 'T')):
+            start = sampstart + basenum * numsamps * 2
+            if (sampstorage == TS_MMAP) and (numpy is not None):
+                # Use the mapped cache file data directly.
+                samps = numpy.frombuffer(
+                    data, dtype=numpy.dtype(samptype), count=numsamps, offset=start
+                )
+            else:
+                samps = array.array(samptype, data[start:start + numsamps * 2])
+                if sampstorage == TS_LIST:
+                    samps = samps.tolist()
+            seqt.tracesamps[base] = samps
+
+        keyvals = self._decodeStrings(data, commentsstart, commentsstart + commentslen)
+        if (keyvals is None) or (len(keyvals) % 2 != 0):
+            return None
+        for cnt in range(0, len(keyvals), 2):
+            seqt.comments[keyvals[cnt]] = keyvals[cnt + 1]
+
+        return seqt
+
+    def _encodeStrings(self, strings):
+        parts = []
+        for string in strings:
+            parts.append(struct.pack(self.STRLEN_FORMAT, len(string)))
+            parts.append(string)
+
+        return ''.join(parts)
+
+    def _decodeStrings(self, data, start, end):
+        """
+        Decodes the length-prefixed strings in data from index start up to, but
+        not including, index end.  Returns None if the strings do not exactly
+        fill the range.
+        """
+        strings = []
+        pos = start
+        while pos < end:
+            if pos + self.STRLEN_SIZE > end:
+                return None
+            strlen = struct.unpack_from(self.STRLEN_FORMAT, data, pos)[0]
+            pos += self.STRLEN_SIZE
+            if pos + strlen > end:
+                return None
+            strings.append(data[pos:pos + strlen])
+            pos += strlen
+
+        return strings
+
+    def storeTrace(self, filepath, seqtrace):
+        """
+        Adds a trace to the cache, replacing any existing cache file for the
+        trace.  Only traces that have not been reverse complemented can be
+        cached.  Returns True if the trace was stored.
+        """
+        ftype = self._getTraceType(seqtrace)
+        if (ftype is None) or seqtrace.isReverseComplemented():
+            return False
+
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return False
+
+        numbases = len(seqtrace.basecalls)
+        numsamps = seqtrace.getTraceLength()
+        samptype = self._getSampleTypeCode(seqtrace.tracesamps['A'])
+        if isinstance(seqtrace.bcconf, array.array):
+            conftype = seqtrace.bcconf.typecode
+        else:
+            conftype = CONF_TYPECODE
+
+        # Comments are stored as alternating keys and values.
+        keyvals = []
+        for key, value in seqtrace.comments.iteritems():
+            keyvals += [key, value]
+        comments = self._encodeStrings(keyvals)
+
+        parts = [struct.pack(
+            self.HEADER_FORMAT, self.MAGIC, self.FORMAT_VERSION,
+            self._getByteOrderFlag(), ftype, stat.st_mtime, stat.st_size,
+            numbases, numsamps, seqtrace.max_traceval, len(comments), samptype,
+            conftype
+        )]
+        parts.append(seqtrace.basecalls + self._pad(seqtrace.basecalls, 4))
+        try:
+            parts.append(self._toBytes('I', seqtrace.basepos))
+        except OverflowError:
+            # Negative base call locations cannot be cached.
+            return False
+        confdata = self._toBytes(conftype, seqtrace.bcconf)
+        parts.append(confdata + self._pad(confdata, 2))
+        for base in ('A', 'C', 'G', 'T'):
+            parts.append(self._toBytes(samptype, seqtrace.tracesamps[base]))
+        parts.append(comments)
+
+        # Write the cache file to a temporary file first and then move it into
+        # place so that a partially written cache file is never used.
+        try:
+            if not(os.path.isdir(self.cachedir)):
+                os.makedirs(self.cachedir)
+
+            fd, tmppath = tempfile.mkstemp(suffix='.tmp', dir=self.cachedir)
+            try:
+                fout = os.fdopen(fd, 'wb')
+                fout.write(''.join(parts))
+                fout.close()
+
+                cachepath = self.getCachePath(filepath)
+                if os.path.exists(cachepath):
+                    os.remove(cachepath)
+                os.rename(tmppath, cachepath)
+            except:
+                os.remove(tmppath)
+                raise
+        except EnvironmentError:
+            return False
+
+        return True
@@ -22,16 +22,20 @@ from gi.repository import GdkPixbuf
 
 import sys
 import os.path
+import tempfile
+import shutil
 
 from seqtrace.core import sequencetrace
-from seqtrace.core.consens import ConsensSeqBuilder, ModifiableConsensSeqBuilder
+from seqtrace.core import tracecache
+from seqtrace.core import seqgenerator
+from seqtrace.core.consens import ModifiableConsensSeqBuilder
 from seqtrace.core.stproject import SequenceTraceProject
 from seqtrace.core import stproject_io
 from seqtrace.core import seqwriter
 from seqtrace.core.consens import ConsensSeqSettings
 
 import seqtrace.gui.dialgs as dialgs
-from seqtrace.gui.dialgs import CommonDialogs, EntryDialog, ProgressBarDialog
+from seqtrace.gui.dialgs import CommonDialogs, EntryDialog, ProgressBarDialog, SeqWriterFileDialog
 from seqtrace.gui.statusbar import ProjectStatusBar
 from seqtrace.gui.projsettingsdialg import ProjectSettingsDialog
 from seqtrace.gui.tracewindow_mgr import TraceWindowManager
@@ -50,6 +54,11 @@ class MainWindow(Gtk.Window, CommonDialogs):
 
         self.tw_manager = TraceWindowManager()
 
+        # The on-disk trace cache used by sequence generation for projects
+        # that do not have their own trace cache.  It is created when it is
+        # first needed and deleted when the program exits.
+        self.gen_cachedir = ''
+
         self.fextension = '.str'
         self.wintitle = 'SeqTrace'
         self.project.registerObserver(
@@ -676,7 +685,7 @@ class MainWindow(Gtk.Window, CommonDialogs):
 
     def exportAll(self, widget):
         # create a file chooser dialog to get a file name and format from the user
-        fc = seqwriter.SeqWriterFileDialog(self, 'Export All Sequences')
+        fc = SeqWriterFileDialog(self, 'Export All Sequences')
         fc.setShowOptions(True)
         fc.set_current_folder(os.getcwd())
 
@@ -718,7 +727,7 @@ class MainWindow(Gtk.Window, CommonDialogs):
 
     def exportSelected(self, widget):
         # create a file chooser dialog to get a file name and format from the user
-        fc = seqwriter.SeqWriterFileDialog(self, 'Export Selected Sequences')
+        fc = SeqWriterFileDialog(self, 'Export Selected Sequences')
         fc.setShowOptions(True)
         fc.set_current_folder(os.getcwd())
 
@@ -820,43 +829,67 @@ class MainWindow(Gtk.Window, CommonDialogs):
 
         # load the trace files
         if projectitem.isFile():
-            seqt = self.openTraceFileFromItem(projectitem)
+            seqt = self.openTraceFileFromItem(projectitem, projectitem.getIsReverse())
             if seqt == None:
                 return None
-            if projectitem.getIsReverse():
-                seqt.reverseComplement()
             seqtraces.append(seqt)
         else:
             children = projectitem.getChildren()
             for child in children:
-                seqt = self.openTraceFileFromItem(child)
+                seqt = self.openTraceFileFromItem(child, child.getIsReverse())
                 if seqt == None:
                     return None
-                if child.getIsReverse():
-                    seqt.reverseComplement()
                 seqtraces.append(seqt)
 
         return seqtraces
 
-    def openTraceFileFromItem(self, projectitem):
+    def getDiskTraceCache(self):
+        """
+        Returns the on-disk trace cache for the current project, or None if the
+        project does not use one.
+        """
+        if not(self.project_open) or not(self.project.getUseTraceCache()):
+            return None
+
+        cachedir = self.project.getTraceCacheDir()
+        if cachedir == '':
+            return None
+
+        return tracecache.DiskTraceCache(cachedir)
+
+    def openTraceFileFromItem(self, projectitem, reverse=False):
         fname = projectitem.getName()
         fullpath = os.path.join(self.project.getAbsTraceFileDir(), fname)
 
-        return self.openTraceFileInternal(fullpath)
+        return self.openTraceFileInternal(fullpath, reverse)
 
-    def openTraceFileInternal(self, filepath):
-        # get the appropriate SequenceTrace object
+    def openTraceFileInternal(self, filepath, reverse=False):
+        # Get the appropriate SequenceTrace object.  Traces are loaded through
+        # the trace cache, so unchanged trace files are only parsed once.
         try:
-            seqt = sequencetrace.SequenceTraceFactory.loadTraceFile(filepath)
+            seqt = tracecache.getTraceCache().getTrace(
+                filepath, reverse, self.getDiskTraceCache()
+            )
         except IOError:
-            self.showMessage('The sequence trace file "' + filepath + '" could not be opened.  Verify that the file exists and that you have permission to read it.')
+            self.showTraceFileError(filepath)
             return None
         except sequencetrace.TraceFileError as err:
-            self.showMessage('Error opening "' + filepath + '".\n\n' + str(err))
+            self.showTraceFileError(filepath, str(err))
             return None
 
         return seqt
 
+    def showTraceFileError(self, filepath, errmsg=None):
+        """
+        Tells the user that a trace file could not be loaded.  errmsg is the
+        description of the trace file error, or None if the file could not be
+        opened.
+        """
+        if errmsg is None:
+            self.showMessage('The sequence trace file "' + filepath + '" could not be opened.  Verify that the file exists and that you have permission to read it.')
+        else:
+            self.showMessage('Error opening "' + filepath + '".\n\n' + errmsg)
+
     def traceWindowConsensusSaved(self, tracewindow, compact_consens, full_consens):
         itemid = self.tw_manager.getItemId(tracewindow)
         item = self.project.getItemById(itemid)
@@ -891,15 +924,21 @@ class MainWindow(Gtk.Window, CommonDialogs):
         if response != Gtk.ResponseType.OK:
             return
 
-        for filepath in filenames:
-            # check if the file already exists in the project
-            if self.project.isFileInProject(filepath):
-                response = self.showYesNoDialog('The file "' + filepath
-                        + '" has already been added to this project.  Do you want to add it anyway?')
-                if response != Gtk.ResponseType.YES:
-                    continue
+        # check if any of the files already exist in the project
+        duplicates = self.project.getFilesInProject(filenames)
+        if len(duplicates) == 1:
+            response = self.showYesNoDialog('The file "' + duplicates[0]
+                    + '" has already been added to this project.  Do you want to add it anyway?')
+        elif len(duplicates) > 1:
+            response = self.showYesNoDialog(str(len(duplicates)) + ' of the selected files '
+                    + 'have already been added to this project.  Do you want to add them anyway?')
 
-            self.project.addFiles((filepath,))
+        if (len(duplicates) > 0) and (response != Gtk.ResponseType.YES):
+            duplicates = set(duplicates)
+            filenames = [filepath for filepath in filenames if filepath not in duplicates]
+
+        if len(filenames) > 0:
+            self.project.addFiles(filenames)
 
     def projectRemoveFiles(self, widget):
         # confirm this is what the user actually wants to do
@@ -963,28 +1002,57 @@ class MainWindow(Gtk.Window, CommonDialogs):
         diag = ProgressBarDialog(self, progressmsg)
         diag.show()
 
-        cnt = 0.0
+        # Get the trace files for each item that has a consensus sequence.
+        jobs = []
         for item in itemlist:
-            # update the progress bar and check if the user canceled the operation
-            diag.updateProgress(cnt / len(itemlist))
-            cnt += 1
-            if diag.getIsCanceled():
-                break
-
             if item.isFile() and item.hasParent():
                 continue
 
-            # load the trace files
-            seqtraces = self.getSeqTraces(item)
-            if seqtraces == None:
+            if item.isFile():
+                fileitems = [item]
+            else:
+                fileitems = item.getChildren()
+            if len(fileitems) == 0:
                 continue
 
-            # get and save the consensus sequence
-            csb = ConsensSeqBuilder(seqtraces, self.project.getConsensSeqSettings())
-            full_cons = csb.getConsensus()
-            compact_cons = csb.getCompactConsensus()
-            item.setUseSequence(True)
-            item.setConsensusSequence(compact_cons, full_cons)
+            tracefiles = [
+                (os.path.join(self.project.getAbsTraceFileDir(), fileitem.getName()), fileitem.getIsReverse())
+                for fileitem in fileitems
+            ]
+            jobs.append(seqgenerator.GenerationJob(item.getId(), tracefiles))
+
+        # Calculate the consensus sequences in worker processes and save them
+        # as the results arrive.  Traces that are already in the in-memory
+        # trace cache are used without parsing the files again.  The worker
+        # processes are stopped after the sequences are generated, so the
+        # traces they load are kept in an on-disk cache for the next run.
+        diskcache = self.getDiskTraceCache()
+        if diskcache is not None:
+            cachedir = diskcache.getCacheDir()
+        else:
+            if self.gen_cachedir == '':
+                self.gen_cachedir = tempfile.mkdtemp(prefix='seqtrace_cache_')
+            cachedir = self.gen_cachedir
+        generator = seqgenerator.ConsensusGenerator(
+            self.project.getConsensSeqSettings(), cachedir=cachedir
+        )
+
+        def checkCanceled():
+            diag.updateProgress(cnt / len(jobs))
+            if diag.getIsCanceled():
+                generator.cancel()
+
+        cnt = 0.0
+        for result in generator.generate(jobs, checkCanceled):
+            cnt += 1
+            if result.isError():
+                self.showTraceFileError(result.error_path, result.error_msg)
+            else:
+                item = self.project.getItemById(result.jobid)
+                item.setUseSequence(True)
+                item.setConsensusSequence(result.compact_cons, result.full_cons)
+
+            checkCanceled()
 
         diag.destroy()
 
@@ -1116,5 +1184,8 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.''')
         # close any remaining trace windows that are still open
         self.tw_manager.closeAllTraceWindows()
 
+        if self.gen_cachedir != '':
+            shutil.rmtree(self.gen_cachedir, True)
+
         Gtk.main_quit()
 
@@ -114,6 +114,13 @@ class ProjectSettingsDialog(Gtk.Dialog, CommonDialogs):
 
         tracevb.pack_start(vb, True, True, 0)
 
+        # Set up the UI component for the on-disk trace cache.
+        self.tracecache_checkbox = Gtk.CheckButton(
+            'Cache decoded trace files in a folder next to the project file'
+        )
+        self.tracecache_checkbox.set_active(self.project.getUseTraceCache())
+        tracevb.pack_start(self.tracecache_checkbox, True, True, 0)
+
         frame = Gtk.Frame(label='Trace files')
         frame.add(tracevb)
         mainvb.pack_start(frame, True, True, 0)
@@ -369,6 +376,7 @@ class ProjectSettingsDialog(Gtk.Dialog, CommonDialogs):
         self.project.setTraceFileDir(self.getTraceFileFolder())
         self.project.setFwdTraceSearchStr(self.getFwdTraceSearchStr())
         self.project.setRevTraceSearchStr(self.getRevTraceSearchStr())
+        self.project.setUseTraceCache(self.tracecache_checkbox.get_active())
 
         self.project.setFont(self.fontbutton.get_font_desc())
 
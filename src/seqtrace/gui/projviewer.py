@@ -41,14 +41,121 @@ from seqtrace.gui import images_folder
 #GObject.type_register(CellRendererPixbufClickable)
 
 
+class ProjectTreeStore(Gtk.TreeStore):
+    """
+    A Gtk.TreeStore view of a project's items.  The rows are kept in sync with
+    the project by observing its item events, and the column numbers are the
+    item property constants from stproject.  Changing the sort column of the
+    tree store also changes the order in which the project's items are
+    iterated.
+    """
+    def __init__(self, project):
+        Gtk.TreeStore.__init__(self, str, str, int, bool, str, str, bool, str, bool)
+
+        self.project = project
+
+        # Maps item IDs to the tree iters of their rows.  Gtk.TreeStore iters
+        # remain valid until their rows are removed.
+        self.tsiters = {}
+
+        self.project.registerObserver('items_reset', self.itemsReset)
+        self.project.registerObserver('items_added', self.itemsAdded)
+        self.project.registerObserver('items_removed', self.itemsRemoved)
+        self.project.registerObserver('item_changed', self.itemChanged)
+
+        self.set_sort_column_id(stproject.FILE_NAME, Gtk.SortType.ASCENDING)
+        self.connect('sort-column-changed', self.sortColumnChanged)
+
+        self.itemsReset()
+
+    def _appendItem(self, item, parent_tsiter=None):
+        tsiter = self.append(parent_tsiter, item.getRowData())
+        self.tsiters[item.getId()] = tsiter
+
+        for child in item.getChildren():
+            self._appendItem(child, tsiter)
+
+    def _suspendSorting(self):
+        """
+        Turns off sorting so that rows can be added without sorting each new
+        row into place.  Returns the sort column and order to pass to
+        _resumeSorting() after the rows are added.
+        """
+        sortcol, order = self.get_sort_column_id()
+        self.set_sort_column_id(Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID, Gtk.SortType.ASCENDING)
+
+        return (sortcol, order)
+
+    def _resumeSorting(self, sortcol, order):
+        if sortcol is not None:
+            self.set_sort_column_id(sortcol, order)
+
+    def itemsReset(self):
+        sortcol, order = self._suspendSorting()
+
+        self.clear()
+        self.tsiters = {}
+        for item in self.project:
+            self._appendItem(item)
+
+        self._resumeSorting(sortcol, order)
+
+    def itemsAdded(self, items):
+        # Sort all of the new rows at once if there is more than one.
+        if len(items) > 1:
+            sortcol, order = self._suspendSorting()
+
+        for item in items:
+            if item.hasParent():
+                self._appendItem(item, self.tsiters[item.getParent().getId()])
+            else:
+                self._appendItem(item)
+
+        if len(items) > 1:
+            self._resumeSorting(sortcol, order)
+
+    def _forgetItem(self, item):
+        self.tsiters.pop(item.getId(), None)
+        for child in item.getChildren():
+            self._forgetItem(child)
+
+    def itemsRemoved(self, items):
+        for item in items:
+            tsiter = self.tsiters.get(item.getId())
+            if tsiter is not None:
+                # Removing a row also removes its child rows.
+                self.remove(tsiter)
+                self._forgetItem(item)
+
+    def itemChanged(self, item):
+        tsiter = self.tsiters.get(item.getId())
+        if tsiter is not None:
+            self.set_row(tsiter, item.getRowData())
+
+    def sortColumnChanged(self, treestore):
+        sortcol, order = self.get_sort_column_id()
+        if (sortcol is not None) and (sortcol >= 0):
+            self.project.setSortBy(sortcol, int(order))
+
+    def getItemByTsiter(self, tsiter):
+        return self.project.getItemById(self.get_value(tsiter, stproject.NODE_ID))
+
+    def getItemByPath(self, path):
+        return self.getItemByTsiter(self.get_iter(path))
+
+    def getItemsByPaths(self, paths):
+        return [self.getItemByPath(path) for path in paths]
+
+
 class ProjectViewer(Gtk.ScrolledWindow, Observable):
     def __init__(self, project):
         Gtk.ScrolledWindow.__init__(self)
 
         self.project = project
+        self.treestore = ProjectTreeStore(project)
 
         # initialize the TreeView
-        self.treeview = Gtk.TreeView(self.project.getTreeStore())
+        self.treeview = Gtk.TreeView(self.treestore)
         self.treeview.set_enable_tree_lines(True)
         self.treeview.set_grid_lines(Gtk.TreeViewGridLines.NONE)
         self.treeview.set_rules_hint(True)
@@ -120,11 +227,11 @@ class ProjectViewer(Gtk.ScrolledWindow, Observable):
                 'selection_changed', 'useseq_changed'])
 
     def useseqToggled(self, cell, path):
-        item = self.project.getItemByPath(path)
+        item = self.treestore.getItemByPath(path)
         self.notifyObservers('useseq_changed', (item,))
 
     def showFrwdRev(self, col, renderer, model, node, data):
-        item = self.project.getItemByTsiter(node)
+        item = self.treestore.getItemByTsiter(node)
 
         if item.isFile():
             renderer.set_property('visible', True)
@@ -137,7 +244,7 @@ class ProjectViewer(Gtk.ScrolledWindow, Observable):
             #renderer.set_property('visible', False)
 
     def isRowFile(self, col, renderer, model, node, data):
-        item = self.project.getItemByTsiter(node)
+        item = self.treestore.getItemByTsiter(node)
 
         if item.isFile():
             renderer.set_property('editable', False)
@@ -145,7 +252,7 @@ class ProjectViewer(Gtk.ScrolledWindow, Observable):
             renderer.set_property('editable', True)
 
     def renderHasSeq(self, col, renderer, model, node, data):
-        item = self.project.getItemByTsiter(node)
+        item = self.treestore.getItemByTsiter(node)
         self.setSeqRendererVisible(renderer, item)
 
         if item.hasSequence():
@@ -154,7 +261,7 @@ class ProjectViewer(Gtk.ScrolledWindow, Observable):
             renderer.set_property('pixbuf', self.hasseq_no)
 
     def renderUseSeq(self, col, renderer, model, node, data):
-        item = self.project.getItemByTsiter(node)
+        item = self.treestore.getItemByTsiter(node)
         self.setSeqRendererVisible(renderer, item)
 
     def setSeqRendererVisible(self, renderer, item):
@@ -184,12 +291,12 @@ class ProjectViewer(Gtk.ScrolledWindow, Observable):
         self.treeview.set_cursor(paths[0], self.col2, True)
 
     def nameEdited(self, cell, path, new_text):
-        item = self.project.getItemByPath(path)
+        item = self.treestore.getItemByPath(path)
 
         self.notifyObservers('item_renamed', (item, new_text))
 
     def notesEdited(self, cell, path, new_text):
-        item = self.project.getItemByPath(path)
+        item = self.treestore.getItemByPath(path)
 
         self.notifyObservers('notes_edited', (item, new_text))
 
@@ -203,7 +310,7 @@ class ProjectViewer(Gtk.ScrolledWindow, Observable):
             return
 
         path = pathinfo[0]
-        item = self.project.getItemByPath(path)
+        item = self.treestore.getItemByPath(path)
 
         # left click
         if event.button == 1:
@@ -228,7 +335,7 @@ class ProjectViewer(Gtk.ScrolledWindow, Observable):
     def getSelection(self):
         model, paths = self.treeview.get_selection().get_selected_rows()
 
-        return self.project.getItemsByPaths(paths)
+        return self.treestore.getItemsByPaths(paths)
 
     def selectChanged(self, selection):
         sel_cnt = selection.count_selected_rows()
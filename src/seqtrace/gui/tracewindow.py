@@ -19,7 +19,7 @@ from seqtrace.core import seqwriter
 from seqtrace.core.consens import ConsensSeqBuilder
 from seqtrace.core.observable import Observable
 
-from seqtrace.gui.dialgs import CommonDialogs, EntryDialog
+from seqtrace.gui.dialgs import CommonDialogs, EntryDialog, SeqWriterFileDialog
 from seqtrace.gui.scrolledsequenceviewer import ScrolledConsensusSequenceViewer
 from seqtrace.gui.tracegui import SequenceTraceViewer
 from seqtrace.gui.tracelayout import SequenceTraceLayout
@@ -575,7 +575,7 @@ class TraceWindow(Gtk.Window, CommonDialogs, Observable):
 
     def exportConsensus(self, widget):
         # create a file chooser dialog to get a file name and format from the user
-        fc = seqwriter.SeqWriterFileDialog(self, 'Export Consensus Sequence')
+        fc = SeqWriterFileDialog(self, 'Export Consensus Sequence')
         fc.set_current_folder(os.getcwd())
         response = fc.run()
         fname = fc.get_filename()
@@ -603,7 +603,7 @@ class TraceWindow(Gtk.Window, CommonDialogs, Observable):
 
     def exportRawSequence(self, widget):
         # create a file chooser dialog to get a file name and format from the user
-        fc = seqwriter.SeqWriterFileDialog(self, 'Export Raw Sequence(s)')
+        fc = SeqWriterFileDialog(self, 'Export Raw Sequence(s)')
         fc.set_current_folder(os.getcwd())
         response = fc.run()
         fname = fc.get_filename()
@@ -632,7 +632,7 @@ class TraceWindow(Gtk.Window, CommonDialogs, Observable):
 
     def exportAlignment(self, widget):
         # create a file chooser dialog to get a file name and format from the user
-        fc = seqwriter.SeqWriterFileDialog(self, 'Export Alignment')
+        fc = SeqWriterFileDialog(self, 'Export Alignment')
         fc.set_current_folder(os.getcwd())
         response = fc.run()
         fname = fc.get_filename()
@@ -17,6 +17,7 @@
 
 import seqtrace.core.align as align
 import seqtrace.core.align.pyalign as pyalign
+import seqtrace.core.align.banding as banding
 try:
     # try to load the compiled C alignment module
     import seqtrace.core.align.calign as calign
@@ -24,8 +25,15 @@ except ImportError:
     # if that fails, make calign a dummy variable, causing the tests to fail
     # but preventing the script from crashing due to a failed import
     calign = None
+try:
+    import seqtrace.core.align.npalign as npalign
+except ImportError:
+    # NumPy is not installed, so the NumPy implementation cannot be tested.
+    npalign = None
 
 import unittest
+import random
+import threading
 
 
 
@@ -200,6 +208,252 @@ class TestPairwiseAlignment(unittest.TestCase):
         self.assertEquals(self.align.getAlignedSeqIndexes()[1],
                 [0, 1, 2, 3, 4, 5, 6, -8, -8, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, -19, -19])
 
+    def test_bandedAlignment(self):
+        # Simulate overlapping forward and reverse reads of the same sequence
+        # with a few sequencing errors.
+        rng = random.Random(1)
+        template = ''.join([rng.choice('ACGT') for cnt in range(400)])
+        seq1 = template[30:]
+        seq2 = list(template[:370])
+        for cnt in (50, 120, 121, 200, 310):
+            seq2[cnt] = rng.choice('ACGT')
+        del seq2[250]
+        seq2.insert(150, 'A')
+        seq2 = ''.join(seq2)
+
+        self.align.setSequences(seq1, seq2)
+        self.align.doAlignment()
+        self.assertIsNone(self.align.getAlignmentBand())
+        expected = (
+            self.align.getAlignedSequences(), self.align.getAlignedSeqIndexes(),
+            self.align.getAlignmentScore()
+        )
+
+        # The banded alignment should be identical to the full alignment.  The
+        # band is centered on the diagonal of the overlap but might have been
+        # widened to prove that the alignment is optimal.
+        self.align.setBandWidth(10)
+        self.assertEqual(self.align.getBandWidth(), 10)
+        self.align.doAlignment()
+        lo, hi = self.align.getAlignmentBand()
+        self.assertEqual((lo + hi) / 2, 30)
+        self.assertTrue(hi - lo < 200)
+        self.assertEqual(
+            (self.align.getAlignedSequences(), self.align.getAlignedSeqIndexes(),
+            self.align.getAlignmentScore()), expected
+        )
+
+        # A band that is too narrow should be widened or abandoned, but the
+        # alignment must still be optimal.
+        self.align.setBandWidth(1)
+        self.align.doAlignment()
+        self.assertEqual(self.align.getAlignmentScore(), expected[2])
+
+        # Sequences without any shared k-mers are aligned without a band.
+        self.align.setSequences('CATATCCATATAAG', 'TGTCCATCATAAGGCA')
+        self.align.doAlignment()
+        self.assertIsNone(self.align.getAlignmentBand())
+        self.assertEqual(self.align.getAlignmentScore(), 54)
+
+        # Gap rewards cannot be used with a band.
+        self.align.setGapPenalty(1)
+        self.align.setSequences(seq1, seq2)
+        self.align.doAlignment()
+        self.assertIsNone(self.align.getAlignmentBand())
+
+    def test_bandedAlignmentRandom(self):
+        """
+        Compares banded and full alignments of random, partially overlapping
+        sequences.
+        """
+        rng = random.Random(2)
+        bandalign = self.align.__class__()
+        for cnt in range(40):
+            template = ''.join([rng.choice('ACGTN') for cnt in range(rng.randint(10, 120))])
+            seq1 = template[rng.randint(0, 10):]
+            seq2 = ''.join([
+                base if rng.random() > 0.1 else rng.choice(('', 'A', 'GC'))
+                for base in template[:len(template) - rng.randint(0, 10)]
+            ])
+
+            for gapp in (-6, -12):
+                self.align.setGapPenalty(gapp)
+                self.align.setSequences(seq1, seq2)
+                self.align.doAlignment()
+
+                bandalign.setGapPenalty(gapp)
+                bandalign.setBandWidth(rng.randint(1, 4))
+                bandalign.setSequences(seq1, seq2)
+                bandalign.doAlignment()
+
+                self.assertEqual(bandalign.getAlignmentScore(), self.align.getAlignmentScore())
+                aligned1, aligned2 = bandalign.getAlignedSequences()
+                self.assertEqual(aligned1.replace('-', ''), seq1)
+                self.assertEqual(aligned2.replace('-', ''), seq2)
+
+    def test_lowMemoryAlignment(self):
+        """
+        Verifies that low-memory alignments are identical to normal alignments,
+        including the end gaps and the sequence indexes.
+        """
+        rng = random.Random(3)
+        lowmemalign = self.align.__class__()
+        lowmemalign.setLowMemory(True)
+        self.assertTrue(lowmemalign.getLowMemory())
+
+        seqpairs = [('', ''), ('', 'ACGT'), ('ACGT', ''), ('A', 'T')]
+        for cnt in range(30):
+            template = ''.join([rng.choice('ACGTN') for cnt in range(rng.randint(1, 150))])
+            seqpairs.append((
+                template[rng.randint(0, 20):],
+                ''.join([
+                    base if rng.random() > 0.1 else rng.choice(('', 'A', 'GC'))
+                    for base in template[:len(template) - rng.randint(0, 20)]
+                ])
+            ))
+
+        for seq1, seq2 in seqpairs:
+            for gapp in (-6, 0):
+                self.align.setGapPenalty(gapp)
+                self.align.setSequences(seq1, seq2)
+                self.align.doAlignment()
+
+                lowmemalign.setGapPenalty(gapp)
+                lowmemalign.setSequences(seq1, seq2)
+                lowmemalign.doAlignment()
+
+                self.assertEqual(lowmemalign.getAlignmentScore(), self.align.getAlignmentScore())
+                self.assertEqual(lowmemalign.getAlignedSequences(), self.align.getAlignedSequences())
+                self.assertEqual(lowmemalign.getAlignedSeqIndexes(), self.align.getAlignedSeqIndexes())
+
+    def test_invalidBases(self):
+        self.align.setSequences('ACXT', 'ACGT')
+        self.assertRaises(KeyError, self.align.doAlignment)
+
+    def test_threads(self):
+        """
+        Verifies that alignments that run at the same time on several threads
+        produce the correct results.
+        """
+        rng = random.Random(4)
+        seqpairs = []
+        for cnt in range(16):
+            template = ''.join([rng.choice('ACGT') for cnt in range(rng.randint(50, 200))])
+            seqpairs.append((
+                template[rng.randint(0, 20):],
+                ''.join([base for base in template if rng.random() > 0.05])
+            ))
+
+        expected = []
+        for seq1, seq2 in seqpairs:
+            self.align.setSequences(seq1, seq2)
+            self.align.doAlignment()
+            expected.append((self.align.getAlignedSequences(), self.align.getAlignmentScore()))
+
+        results = [None] * len(seqpairs)
+        def alignPairs(indexes):
+            align = self.align.__class__()
+            for index in indexes:
+                align.setSequences(*seqpairs[index])
+                align.doAlignment()
+                results[index] = (align.getAlignedSequences(), align.getAlignmentScore())
+
+        threads = [
+            threading.Thread(target=alignPairs, args=(range(cnt, len(seqpairs), 4),))
+            for cnt in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, expected)
+
+    def test_calcAlignmentScore(self):
+        """
+        Verifies that score-only alignments produce the same scores as full
+        alignments and that they correctly rule out low-scoring alignments.
+        """
+        rng = random.Random(7)
+        seqpairs = [('', ''), ('', 'ACGT'), ('ACGT', '')]
+        for cnt in range(30):
+            template = ''.join([rng.choice('ACGTN') for cnt in range(rng.randint(1, 80))])
+            seqpairs.append((
+                template[rng.randint(0, 10):rng.randint(10, 30)],
+                ''.join([base for base in template if rng.random() > 0.1])
+            ))
+
+        for seq1, seq2 in seqpairs:
+            for gapp in (-9, 0, 3):
+                self.align.setGapPenalty(gapp)
+                self.align.setSequences(seq1, seq2)
+                self.align.doAlignment()
+                score = self.align.getAlignmentScore()
+                aligned = self.align.getAlignedSequences()
+
+                self.assertEqual(self.align.calcAlignmentScore(), score)
+                self.assertEqual(self.align.calcAlignmentScore(score - 10), score)
+                self.assertEqual(self.align.calcAlignmentScore(score), score)
+                self.assertIsNone(self.align.calcAlignmentScore(score + 1))
+                self.assertIsNone(self.align.calcAlignmentScore(score + 100))
+
+                # The results of the full alignment should not change.
+                self.assertEqual(self.align.getAlignedSequences(), aligned)
+                self.assertEqual(self.align.getAlignmentScore(), score)
+
+    def test_alignMany(self):
+        """
+        Verifies that batch alignments, with and without worker threads, are
+        identical to separate alignments of each pair.
+        """
+        rng = random.Random(6)
+        pairs = [('', ''), ('ACGT', '')]
+        for cnt in range(20):
+            template = ''.join([rng.choice('ACGT') for cnt in range(rng.randint(20, 300))])
+            pairs.append((
+                template[rng.randint(0, 20):],
+                ''.join([base for base in template if rng.random() > 0.05])
+            ))
+
+        for bandwidth, lowmemory in ((0, False), (10, False), (0, True)):
+            self.align.setBandWidth(bandwidth)
+            self.align.setLowMemory(lowmemory)
+            expected = []
+            for seq1, seq2 in pairs:
+                self.align.setGapPenalty(-9)
+                self.align.setSequences(seq1, seq2)
+                self.align.doAlignment()
+                expected.append(self.align.getAlignedSequences() + self.align.getAlignedSeqIndexes())
+
+            self.align.setGapPenalty(-6)
+            self.align.setSequences('ACGT', 'AGT')
+            self.assertEqual(self.align.alignMany(pairs, -9), expected)
+            self.assertEqual(self.align.alignMany(pairs, -9, 3), expected)
+
+            # The object's own settings and sequences should not change.
+            self.assertEqual(self.align.getGapPenalty(), -6)
+            self.assertEqual(self.align.getSequences(), ('ACGT', 'AGT'))
+
+        self.assertEqual(self.align.alignMany([]), [])
+
+        # Errors on worker threads should be raised by alignMany().
+        self.assertRaises(KeyError, self.align.alignMany, pairs + [('ACXT', 'ACGT')], None, 2)
+
+
+class TestBanding(unittest.TestCase):
+    def test_estimateDiagonal(self):
+        self.assertEqual(banding.estimateDiagonal('ACGTTGCAAT', 'GGACGTTGCAATCC'), 2)
+        self.assertEqual(banding.estimateDiagonal('GGACGTTGCAATCC', 'ACGTTGCAAT'), -2)
+        self.assertIsNone(banding.estimateDiagonal('ACGTTGCAAT', 'TTTTTTTTTT'))
+        self.assertIsNone(banding.estimateDiagonal('', 'ACGTTGCAAT'))
+
+    def test_getOutsideBandBound(self):
+        # For a 10 x 12 matrix, the diagonals 0 to 2 are the longest (10 cells).
+        self.assertEqual(banding.getOutsideBandBound(10, 12, 0, 2, 6), 54)
+        self.assertEqual(banding.getOutsideBandBound(10, 12, -1, 3, 6), 48)
+        self.assertEqual(banding.getOutsideBandBound(10, 12, 4, 6, 6), 60)
+        self.assertEqual(banding.getOutsideBandBound(10, 12, -10, 12, 6), banding.UNREACHABLE)
+
 
 class TestPyPairwiseAlignment(TestPairwiseAlignment):
     """
@@ -224,3 +478,37 @@ if __name__ == '__main__':
     suite = unittest.defaultTestLoader.loadTestsFromName(__name__)
     unittest.TextTestRunner(verbosity=2).run(suite)
 
+
+@unittest.skipIf(npalign is None, 'NumPy is not installed')
+class TestNpPairwiseAlignment(TestPairwiseAlignment):
+    """
+    Tests the pairwise alignment code with the NumPy implementation.
+    """
+    def setUp(self):
+        self.align = npalign.PairwiseAlignment()
+
+    def test_samePythonResults(self):
+        """
+        Verifies that the NumPy implementation produces exactly the same
+        alignments as the Python implementation, including the choices between
+        equally good alignments.
+        """
+        rng = random.Random(5)
+        pyaligner = pyalign.PairwiseAlignment()
+        for cnt in range(60):
+            template = ''.join([rng.choice('ACGTNRY') for cnt in range(rng.randint(0, 60))])
+            seq1 = template[rng.randint(0, 10):]
+            seq2 = ''.join([
+                base if rng.random() > 0.15 else rng.choice(('', 'A', 'GC'))
+                for base in template[:len(template) - rng.randint(0, 10)]
+            ])
+
+            for gapp in (-6, 0, 3):
+                for aligner in (pyaligner, self.align):
+                    aligner.setGapPenalty(gapp)
+                    aligner.setSequences(seq1, seq2)
+                    aligner.doAlignment()
+
+                self.assertEqual(self.align.getAlignmentScore(), pyaligner.getAlignmentScore())
+                self.assertEqual(self.align.getAlignedSequences(), pyaligner.getAlignedSequences())
+                self.assertEqual(self.align.getAlignedSeqIndexes(), pyaligner.getAlignedSeqIndexes())
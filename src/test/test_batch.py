@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core import batch
+from seqtrace.core import fwdrev
+from seqtrace.core import seqwriter
+from seqtrace.core.consens import ConsensSeqBuilder, ConsensSeqSettings
+from seqtrace.core.sequencetrace import SequenceTraceFactory
+
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+
+
+# set the location of the test data files
+test_data = os.path.dirname(__file__) + '/test_data/'
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for src, dest in (
+            ('forward.ztr', 'seq1_F.ztr'), ('forward.ztr', 'seq1_R.ztr'),
+            ('forward.scf', 'seq2_R.scf'), ('forward.ab1', 'seq3.ab1'),
+            ('error-bad_index.ab1', 'seq4_F.ab1'), ('forward.ab1', 'notes.txt')
+        ):
+            shutil.copy(test_data + src, os.path.join(self.tmpdir, dest))
+
+        self.outfile = os.path.join(self.tmpdir, 'out.fasta')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def getConsensus(self, fnames, reverse):
+        seqtraces = []
+        for fname, isreverse in zip(fnames, reverse):
+            seqt = SequenceTraceFactory.loadTraceFile(os.path.join(self.tmpdir, fname))
+            if isreverse:
+                seqt.reverseComplement()
+            seqtraces.append(seqt)
+
+        csb = ConsensSeqBuilder(seqtraces, ConsensSeqSettings(), align_all_primers=False)
+
+        return csb.getCompactConsensus()
+
+    def test_readTraceDirectory(self):
+        items = batch.readTraceDirectory(self.tmpdir)
+
+        self.assertEqual(
+            [item.getName() for item in items],
+            ['seq1.ztr', 'seq2_R.scf', 'seq3.ab1', 'seq4_F.ab1']
+        )
+        self.assertEqual([item.getId() for item in items], range(4))
+
+        self.assertFalse(items[0].isFile())
+        children = items[0].getChildren()
+        self.assertEqual([child.getName() for child in children], ['seq1_F.ztr', 'seq1_R.ztr'])
+        self.assertEqual([child.getIsReverse() for child in children], [False, True])
+
+        self.assertTrue(items[1].isFile())
+        self.assertTrue(items[1].getIsReverse())
+        self.assertFalse(items[2].getIsReverse())
+
+        # A naming template pairs the same files with the default search
+        # strings.
+        pattern = fwdrev.templateToPattern('*{dir}.ztr', '_F', '_R')
+        items = batch.readTraceDirectory(self.tmpdir, pattern=pattern)
+        self.assertEqual(
+            [item.getName() for item in items],
+            ['seq1.ztr', 'seq2_R.scf', 'seq3.ab1', 'seq4_F.ab1']
+        )
+
+        self.assertRaises(batch.BatchError, batch.readTraceDirectory, os.path.join(self.tmpdir, 'none'))
+        self.assertRaises(batch.BatchError, batch.readTraceDirectory, self.tmpdir, pattern='(')
+
+    def test_run(self):
+        items = batch.readTraceDirectory(self.tmpdir)
+        for numworkers in (1, 2):
+            pipeline = batch.BatchPipeline(None, self.tmpdir, numworkers)
+            pipeline.run(items, self.outfile, seqwriter.FORMAT_FASTA)
+
+            self.assertEqual(pipeline.getNumSequences(), 3)
+            self.assertEqual(
+                pipeline.getErrors(),
+                [(os.path.join(self.tmpdir, 'seq4_F.ab1'), pipeline.getErrors()[0][1])]
+            )
+            self.assertIsNotNone(pipeline.getErrors()[0][1])
+            self.assertEqual(sorted(pipeline.getStageTimes().keys()), ['consensus', 'parse', 'write'])
+
+            with open(self.outfile) as fin:
+                lines = fin.read().split('\n')
+            names = [line[1:] for line in lines if line.startswith('>')]
+            self.assertEqual(names, ['seq1_F.ztr, seq1_R.ztr', 'seq2_R.scf', 'seq3.ab1'])
+
+            seqs = ''.join([line for line in lines if not(line.startswith('>'))])
+            self.assertEqual(
+                seqs,
+                self.getConsensus(('seq1_F.ztr', 'seq1_R.ztr'), (False, True)) +
+                self.getConsensus(('seq2_R.scf',), (True,)) +
+                self.getConsensus(('seq3.ab1',), (False,))
+            )
+
+    def test_readProjectFile(self):
+        items, settings, tracedir = batch.readProjectFile(test_data + 'test_project-0.9.str')
+
+        self.assertEqual(tracedir, os.path.abspath(test_data + 'tracedir'))
+        self.assertEqual(settings.getMinConfScore(), 20)
+        self.assertEqual(settings.getConsensusAlgorithm(), 'legacy')
+        self.assertEqual(len(items), 4)
@@ -17,8 +17,11 @@
 
 from seqtrace.core.consens import *
 from seqtrace.core.sequencetrace import SequenceTrace
+import seqtrace.core.consens as consens
 
 import unittest
+import random
+import array
 
 
 
@@ -394,6 +397,62 @@ class TestConsensus(unittest.TestCase):
             for (expconf, conf) in zip(expconsconf, confvals):
                 self.assertAlmostEqual(expconf, conf)
 
+    @unittest.skipIf(consens.numpy is None, 'NumPy is not available')
+    def test_BayesianConsensusArrays(self):
+        """
+        Verifies that the array-based and column-by-column implementations of
+        the Bayesian consensus algorithm produce identical results.
+        """
+        self.settings.setDoQualityTrim(False)
+        self.settings.setTrimConsensus(False)
+        self.settings.setForwardPrimer('')
+        self.settings.setReversePrimer('')
+        self.settings.setConsensusAlgorithm('Bayesian')
+
+        rng = random.Random(1)
+        codes = 'ATGCATGCATGCWSMKRYBDHVN'
+        numarrays = 0
+        for cnt in range(60):
+            seq = ''.join([rng.choice('ATGC') for i in range(rng.randint(0, 120))])
+            seqts = []
+            for seqnum in range(2):
+                seqt = SequenceTrace()
+                seqt.basecalls = ''.join([
+                    base if rng.random() > 0.15 else rng.choice(('', codes[rng.randint(0, 22)] + base))
+                    for base in seq[rng.randint(0, 20):]
+                ])
+                confs = [rng.randint(1, 62) for i in range(len(seqt.basecalls))]
+                if cnt % 3 == 0:
+                    seqt.bcconf = array.array('B', confs)
+                elif cnt % 3 == 1:
+                    seqt.bcconf = array.array('b', confs)
+                else:
+                    seqt.bcconf = confs
+                seqt.rcview = (cnt % 4 == seqnum)
+                seqts.append(seqt)
+
+            self.settings.setMinConfScore(rng.choice((1, 10, 20, 30, 40)))
+            cons = ConsensSeqBuilder(seqts, self.settings)
+            min_confscore = self.settings.getMinConfScore()
+
+            cons._makeBayesianConsensusColumns(min_confscore)
+            expcons, expconf = cons.consensus, cons.consconf
+            if cons._makeBayesianConsensusArrays(min_confscore):
+                numarrays += 1
+            self.assertEqual(cons.consensus, expcons)
+            self.assertEqual(cons.consconf, expconf)
+            self.assertEqual([type(val) for val in cons.consconf], [type(val) for val in expconf])
+
+        # Nearly all of the random alignments should be supported by the array
+        # implementation.
+        self.assertTrue(numarrays > 50)
+
+        # Invalid nucleotide codes are not supported by the array
+        # implementation.
+        cons = ConsensSeqBuilder((self.seqt4, self.seqt5), self.settings)
+        cons.alignedseqs[0] = cons.alignedseqs[0].replace('W', 'X')
+        self.assertFalse(cons._makeBayesianConsensusArrays(20))
+
     def test_legacyConsensus(self):
         """
         Test consensus sequence construction with two (forward/reverse) sequence traces using
@@ -575,6 +634,10 @@ class TestConsensus(unittest.TestCase):
                 ['-------ACACGAATTAC',
                  'GCTCCTG-----------',
                  '                  '],
+                # no overlap, with a gap between the sequences
+                ['---------ACGAATTAC',
+                 'GCTCCTG-----------',
+                 '                  '],
                 # extra gaps at alignment ends
                 ['----CTGACACGAAT---',
                  '-CTCCTGACACGAA----',
@@ -1009,6 +1072,126 @@ class TestConsensus(unittest.TestCase):
         self.seqt8.isreverse_comped = False
 
 
+    def test_insertAlignmentGaps(self):
+        """
+        Tests inserting the gaps from a primer alignment into the trace
+        alignment.
+        """
+        cons = ConsensSeqBuilder((self.seqt8, self.seqt9), self.settings)
+
+        cons.alignedseqs = ['---CGT', 'TTAC--']
+        cons.seqindexes = [[-1, -1, -1, 0, 1, 2], [0, 1, 2, 3, -5, -5]]
+        self.assertEqual(cons._insertAlignmentGaps(0, 'T-T-'), 2)
+        self.assertEqual(cons.alignedseqs, ['-----CGT', 'T-T-AC--'])
+        self.assertEqual(cons.seqindexes, [[-1, -1, -1, -1, -1, 0, 1, 2], [0, -2, 1, -3, 2, 3, -5, -5]])
+
+        # Gaps at the end of the alignment.
+        self.assertEqual(cons._insertAlignmentGaps(6, '-G-T--'), 4)
+        self.assertEqual(cons.alignedseqs, ['-----C-G-T--', 'T-T-AC------'])
+        self.assertEqual(
+            cons.seqindexes,
+            [[-1, -1, -1, -1, -1, 0, -2, 1, -3, 2, -4, -4], [0, -2, 1, -3, 2, 3, -5, -5, -5, -5, -5, -5]]
+        )
+
+        # Without gaps, nothing should change.
+        self.assertEqual(cons._insertAlignmentGaps(4, 'AC'), 0)
+        self.assertEqual(cons.alignedseqs, ['-----C-G-T--', 'T-T-AC------'])
+
+    def test_alignPrimersOnlyIfNeeded(self):
+        """
+        Verifies that skipping the alignments of primers that cannot be trimmed
+        does not change the trimmed consensus sequences.
+        """
+        self.settings.setMinConfScore(10)
+        self.settings.setDoQualityTrim(True)
+        self.settings.setTrimPrimers(True)
+        self.settings.setTrimEndGaps(False)
+        self.settings.setQualityTrimParams(1, 1)
+        self.settings.setConsensusAlgorithm('Bayesian')
+
+        primers = [
+            'AAG', 'TAA', 'TAG', 'GAA', 'CCTAA', 'CCGTA', 'AGCAA', 'ATTAA', 'AATG',
+            'TACAT', 'ATGAAGCTT', 'CCGTACATTAA', 'GGGG', 'CCCC', 'ATTC', 'GATCCT',
+            'GATCTGACA', 'NNTAAGC'
+        ]
+        rng = random.Random(1)
+        self.seqt8.isreverse_comped = True
+        for tracelist in ((self.seqt8, self.seqt9), (self.seqt8,), (self.seqt9,)):
+            for cnt in range(60):
+                self.settings.setForwardPrimer(rng.choice(primers))
+                self.settings.setReversePrimer(rng.choice(primers))
+                self.settings.setPrimerMatchThreshold(rng.choice((0.3, 0.5, 0.55, 0.8, 0.9, 1.0)))
+
+                cons = ConsensSeqBuilder(tracelist, self.settings)
+                batchcons = ConsensSeqBuilder(tracelist, self.settings, align_all_primers=False)
+                self.assertEqual(batchcons.getCompactConsensus(), cons.getCompactConsensus())
+
+        # Without primer trimming, the primers do not need to be aligned at all.
+        self.settings.setTrimPrimers(False)
+        cons = ConsensSeqBuilder((self.seqt8, self.seqt9), self.settings, align_all_primers=False)
+        self.assertEqual(cons.getAlignedPrimers(), '')
+
+        self.seqt8.isreverse_comped = False
+
+    def test_stageCache(self):
+        """
+        Verifies that repeating only the consensus stages that depend on
+        changed settings gives the same results as building the consensus
+        sequence from scratch.
+        """
+        self.settings.setConsensusAlgorithm('Bayesian')
+        self.settings.setTrimPrimers(True)
+        self.settings.setForwardPrimer('AAGC')
+        self.settings.setReversePrimer('GTAA')
+
+        # Changing the minimum confidence score should not repeat any
+        # alignments.
+        cons = ConsensSeqBuilder((self.seqt8, self.seqt9), self.settings)
+        readstage, primerstage = cons.readstage, cons.primerstage
+        self.settings.setMinConfScore(10)
+        cons.makeConsensusSequence()
+        self.assertIs(cons.readstage, readstage)
+        self.assertIs(cons.primerstage, primerstage)
+
+        # Changing a primer should only repeat the primer alignments.
+        self.settings.setReversePrimer('GTAAT')
+        cons.makeConsensusSequence()
+        self.assertIs(cons.readstage, readstage)
+        self.assertIsNot(cons.primerstage, primerstage)
+
+        rng = random.Random(1)
+        for tracelist in ((self.seqt8, self.seqt9), (self.seqt8,), (self.seqt10, self.seqt11)):
+            for align_all_primers in (True, False):
+                cons = ConsensSeqBuilder(tracelist, self.settings, align_all_primers)
+                for cnt in range(40):
+                    setting = rng.randint(0, 6)
+                    if setting == 0:
+                        self.settings.setMinConfScore(rng.choice((1, 10, 20, 30, 40)))
+                    elif setting == 1:
+                        self.settings.setConsensusAlgorithm(rng.choice(('Bayesian', 'legacy')))
+                    elif setting == 2:
+                        self.settings.setTrimPrimers(rng.choice((True, False)))
+                    elif setting == 3:
+                        self.settings.setForwardPrimer(rng.choice(('', 'AAGC', 'TAAGCT', 'GGAAC')))
+                    elif setting == 4:
+                        self.settings.setPrimerMatchThreshold(rng.choice((0.5, 0.8, 1.0)))
+                    elif setting == 5:
+                        self.settings.setTrimEndGaps(rng.choice((True, False)))
+                    else:
+                        self.settings.setQualityTrimParams(rng.randint(2, 10), 2)
+                        self.settings.setDoQualityTrim(rng.choice((True, False)))
+
+                    # Edits to the consensus sequence should not affect the
+                    # cached stages.
+                    cons.consensus = 'N' * len(cons.consensus)
+                    cons.makeConsensusSequence()
+                    newcons = ConsensSeqBuilder(tracelist, self.settings, align_all_primers)
+                    self.assertEqual(cons.getConsensus(), newcons.getConsensus())
+                    self.assertEqual(cons.consconf, newcons.consconf)
+                    self.assertEqual(cons.getAlignedPrimers(), newcons.getAlignedPrimers())
+                    self.assertEqual(cons.alignedseqs, newcons.alignedseqs)
+                    self.assertEqual(cons.seqindexes, newcons.seqindexes)
+
 
 class TestModifiableConsensus(unittest.TestCase):
     def setUp(self):
@@ -1062,6 +1245,23 @@ class TestModifiableConsensus(unittest.TestCase):
             self.cons.modifyBases(testcase[0], testcase[1], testcase[2])
             self.assertEqual(self.cons.getConsensus(), testcase[3])
 
+    def test_getConsensusRange(self):
+        # Ranges of the consensus sequence should follow string slicing rules,
+        # both before and after the sequence is edited.
+        ranges = [(0, -2), (-5, -2), (-5, -1), (3, 10), (10, 3), (0, 100), (-100, 2), (0, -1)]
+        for edit in (False, True):
+            if edit:
+                self.cons.modifyBases(7, 10, 'TCAT')
+
+            # Get the partial ranges before the full sequence, which is cached.
+            results = [self.cons.getConsensus(start, end) for start, end in ranges]
+            consensus = self.cons.getConsensus()
+            for (start, end), result in zip(ranges, results):
+                if end == -1:
+                    self.assertEqual(result, consensus[start:])
+                else:
+                    self.assertEqual(result, consensus[start:end + 1])
+
     def test_undoRedo(self):
         # apply all of the delete test cases
         for testcase in self.del_tests:
@@ -1105,6 +1305,61 @@ class TestModifiableConsensus(unittest.TestCase):
         self.cons.redo()
         self.assertEqual(self.cons.getConsensus(), self.seqt1.getBaseCalls())
 
+    def test_undoHistory(self):
+        # Adjacent edits of the same kind should be undone together.
+        self.cons.deleteBases(4, 5)
+        self.cons.deleteBases(6, 6)
+        self.cons.deleteBases(3, 2)
+        self.assertEqual(self.cons.getConsensus(), 'AA     CTGACATGATTTACG')
+        self.cons.modifyBases(7, 8, 'GG')
+        self.cons.modifyBases(9, 9, 'A')
+        self.assertEqual(self.cons.getConsensus(), 'AA     GGAACATGATTTACG')
+        self.assertEqual(len(self.cons.undo_stack), 2)
+
+        self.cons.undo()
+        self.assertEqual(self.cons.getConsensus(), 'AA     CTGACATGATTTACG')
+        self.cons.undo()
+        self.assertEqual(self.cons.getConsensus(), self.seqt1.getBaseCalls())
+        self.cons.redo()
+        self.assertEqual(self.cons.getConsensus(), 'AA     CTGACATGATTTACG')
+
+        # Edits after an undo or redo start a new record, and a new edit
+        # clears the redo history.
+        self.cons.deleteBases(7, 7)
+        self.assertEqual(len(self.cons.redo_stack), 0)
+        self.assertEqual(len(self.cons.undo_stack), 2)
+        self.cons.undo()
+        self.assertEqual(self.cons.getConsensus(), 'AA     CTGACATGATTTACG')
+
+        # Without coalescing, each edit is a separate record.
+        cons = ModifiableConsensSeqBuilder((self.seqt1,), self.settings, coalesce_edits=False)
+        cons.deleteBases(4, 5)
+        cons.deleteBases(6, 6)
+        self.assertEqual(len(cons.undo_stack), 2)
+
+        # Recalculating the sequence should only save the changed bases.
+        self.cons.modifyBases(20, 21, 'TT')
+        self.cons.recalcConsensusSequence()
+        self.assertEqual(self.cons.undo_stack[-1]['old'], '     CTGACATGATTTATT')
+        self.assertEqual(self.cons.undo_stack[-1]['new'], 'GCTACCTGACATGATTTACG')
+        self.cons.undo()
+        self.assertEqual(self.cons.getConsensus(), 'AA     CTGACATGATTTATT')
+
+        # The oldest records should be dropped when the history is too large,
+        # but the most recent change can always be undone.
+        cons = ModifiableConsensSeqBuilder((self.seqt1,), self.settings, max_undo_size=10)
+        cons.modifyBases(0, 1, 'TT')
+        cons.modifyBases(10, 11, 'TT')
+        cons.modifyBases(20, 21, 'TT')
+        self.assertEqual(len(cons.undo_stack), 2)
+        self.assertEqual(cons.undo_size, 8)
+        cons.modifyBases(0, 21, 'A' * 22)
+        self.assertEqual(len(cons.undo_stack), 1)
+        cons.undo()
+        self.assertEqual(cons.getConsensus(), 'TTGCTACCTGTTATGATTTATT')
+        cons.undo()
+        self.assertEqual(cons.getConsensus(), 'TTGCTACCTGTTATGATTTATT')
+
 
 
 
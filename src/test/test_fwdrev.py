@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core.fwdrev import FwdRevMatchIter, RegexFwdRevMatchIter, templateToPattern
+from seqtrace.core.stproject_io import ProjectItemData
+
+import unittest
+
+
+def getItems(names):
+    items = []
+    for name in names:
+        item = ProjectItemData()
+        item.setName(name)
+        items.append(item)
+
+    return items
+
+def getMatches(matchiter):
+    return [(fwd.getName(), rev.getName(), sharedname) for fwd, rev, sharedname in matchiter]
+
+
+class TestFwdRev(unittest.TestCase):
+    def test_matchIter(self):
+        # Names are matched from the last to the first, and each name is
+        # matched with the first unmatched name that has the opposite name.
+        names = ['b_R.ab1', 'c_F.ab1', 'a_F.ab1', 'b_F.ab1', 'a_R.ab1', 'b_R.ab1']
+        self.assertEqual(
+            [('b_F.ab1', 'b_R.ab1', 'b.ab1'), ('a_F.ab1', 'a_R.ab1', 'a.ab1')],
+            getMatches(FwdRevMatchIter(getItems(names), '_F', '_R'))
+        )
+
+        # Each occurrence of a search string is tried, from left to right.
+        pairs = [
+            ['F_', 'R_', ''],
+            ['F_CO1_F_10F_.ab1F_', 'R_CO1_F_10F_.ab1F_', 'CO1_F_10F_.ab1F_'],
+            ['F_CO1_F_10F_.ab1F_', 'F_CO1_R_10F_.ab1F_', 'F_CO1_10F_.ab1F_'],
+            ['F_CO1_F_10F_.ab1F_', 'F_CO1_F_10R_.ab1F_', 'F_CO1_F_10.ab1F_'],
+            ['F_CO1_F_10F_.ab1F_', 'F_CO1_F_10F_.ab1R_', 'F_CO1_F_10F_.ab1']
+        ]
+        names = ['16S_R_10.ab1']
+        for pair in reversed(pairs):
+            names += pair[1::-1]
+        names.append('F_12S_.ab1')
+
+        self.assertEqual(
+            [tuple(pair) for pair in pairs],
+            getMatches(FwdRevMatchIter(getItems(names), 'F_', 'R_'))
+        )
+
+    def test_regexMatchIter(self):
+        names = ['F_a_R.ab1', 'F_a_F.ab1', 'R_b_F.ab1', 'F_b_F.ab1', 'c_F.scf', 'c_R.scf']
+        pattern = templateToPattern('*_{dir}.ab1', 'F', 'R')
+
+        # Only the search strings at the end of the names are used, and names
+        # that do not match the pattern are ignored.
+        self.assertEqual(
+            [('F_a_F.ab1', 'F_a_R.ab1', 'F_a_.ab1')],
+            getMatches(RegexFwdRevMatchIter(getItems(names), pattern, 'F', 'R'))
+        )
+        self.assertEqual(
+            [('F_b_F.ab1', 'R_b_F.ab1', '_b_F.ab1')],
+            getMatches(RegexFwdRevMatchIter(getItems(names), r'(?P<dir>[FR])_b_F\.ab1', 'F', 'R'))
+        )
+
+        # With the default search strings, "{dir}" includes the separator.
+        names = ['CO1_F_2.ab1', 'CO1_R_2.ab1', 'CO1_F.ab1', 'CO1_R.ab1']
+        pattern = templateToPattern('*{dir}.ab1', '_F', '_R')
+        self.assertEqual(
+            [('CO1_F.ab1', 'CO1_R.ab1', 'CO1.ab1')],
+            getMatches(RegexFwdRevMatchIter(getItems(names), pattern, '_F', '_R'))
+        )
+        pattern = templateToPattern('*_{dir}.ab1', '_F', '_R')
+        self.assertEqual([], getMatches(RegexFwdRevMatchIter(getItems(names), pattern, '_F', '_R')))
+
+        self.assertRaises(ValueError, RegexFwdRevMatchIter, [], r'.*_[FR]\.ab1', 'F', 'R')
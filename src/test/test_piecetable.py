@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core.piecetable import PieceTable
+import seqtrace.core.piecetable as piecetable
+
+import unittest
+import random
+
+
+class TestPieceTable(unittest.TestCase):
+    def test_getText(self):
+        pt = PieceTable('ACGTACGT')
+        self.assertEqual(len(pt), 8)
+        self.assertEqual(pt.getText(), 'ACGTACGT')
+        self.assertEqual(pt.getText(2, 5), 'GTA')
+        self.assertEqual(pt.getText(6), 'GT')
+
+        pt = PieceTable()
+        self.assertEqual(len(pt), 0)
+        self.assertEqual(pt.getText(), '')
+
+    def test_replace(self):
+        pt = PieceTable('ACGTACGT')
+        pt.replace(2, 4, 'NN')
+        self.assertEqual(pt.getText(1, 5), 'CNNA')
+        self.assertEqual(pt.getText(), 'ACNNACGT')
+
+        # Replacements can change the length of the text.
+        pt.replace(0, 1, '')
+        pt.replace(7, 7, 'TTT')
+        self.assertEqual(len(pt), 10)
+        self.assertEqual(pt.getText(), 'CNNACGTTTT')
+
+        self.assertRaises(IndexError, pt.replace, 5, 11, 'A')
+        self.assertRaises(IndexError, pt.replace, 5, 4, 'A')
+
+    def test_randomEdits(self):
+        # Compare many random edits with the same edits to a string, enough to
+        # trigger merging of the pieces.
+        rng = random.Random(1)
+        text = 'ACGT' * 20
+        pt = PieceTable(text)
+        for cnt in range(piecetable.MAX_PIECES * 3):
+            start = rng.randint(0, len(text))
+            end = rng.randint(start, min(start + 5, len(text)))
+            newtext = ''.join([rng.choice('ACGTN ') for i in range(rng.randint(0, 5))])
+            text = text[:start] + newtext + text[end:]
+            pt.replace(start, end, newtext)
+
+            self.assertTrue(len(pt.pieces) <= piecetable.MAX_PIECES)
+            self.assertEqual(len(pt), len(text))
+            start = rng.randint(0, len(text))
+            end = rng.randint(start, len(text))
+            self.assertEqual(pt.getText(start, end), text[start:end])
+            if cnt % 10 == 0:
+                self.assertEqual(pt.getText(), text)
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core.primerindex import PrimerIndex
+from seqtrace.core.consens import ConsensSeqSettings
+from seqtrace.core.align import PairwiseAlignment
+
+import unittest
+import random
+
+
+class TestPrimerIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PrimerIndex('GGTCAACAAATCATAAAGATATTGG', 'TAAACTTCAGGGTGACCAAAAAATCA', 6)
+
+    def test_getPrimer(self):
+        self.assertEqual(
+            self.index.getPrimers(),
+            ('GGTCAACAAATCATAAAGATATTGG', 'TAAACTTCAGGGTGACCAAAAAATCA')
+        )
+        self.assertEqual(self.index.getPrimer('forward'), 'GGTCAACAAATCATAAAGATATTGG')
+        self.assertEqual(self.index.getPrimer('forward_rc'), 'CCAATATCTTTATGATTTGTTGACC')
+        self.assertEqual(self.index.getPrimer('reverse_rc'), 'TGATTTTTTGGTCACCCTGAAGTTTA')
+        self.assertEqual(self.index.getKmerSize(), 6)
+
+    def test_canMatch(self):
+        primer = 'GGTCAACAAATCATAAAGATATTGG'
+
+        # With a low threshold, the index cannot rule anything out.
+        self.assertTrue(self.index.canMatch('forward', 'TTTTTTTTTT', 0.5))
+        self.assertTrue(self.index.canMatch('forward', 'TTTTTTTTTT', 0))
+
+        # With a high threshold, at least one block must occur exactly.
+        self.assertFalse(self.index.canMatch('forward', 'TTTTTTTTTT', 1.0))
+        self.assertFalse(self.index.canMatch('forward', '', 0.9))
+        self.assertTrue(self.index.canMatch('forward', 'CC' + primer[6:12] + 'CC', 0.9))
+        self.assertFalse(self.index.canMatch('forward', 'TT' + primer[4:10] + 'TT', 0.9))
+
+        # Verify that the index never rules out primer alignments that reach
+        # the threshold.
+        rng = random.Random(1)
+        align = PairwiseAlignment()
+        align.setGapPenalty(-9)
+        for cnt in range(300):
+            target = ''.join([
+                base if rng.random() > 0.12 else rng.choice(('', 'A', 'GC', 'T'))
+                for base in primer
+            ])
+            target = (
+                ''.join([rng.choice('ACGT') for i in range(rng.randint(0, 20))]) + target
+                + ''.join([rng.choice('ACGT') for i in range(rng.randint(0, 20))])
+            )
+            align.setSequences(primer, target)
+            align.doAlignment()
+            praligned, targetaligned = align.getAlignedSequences()
+            start = len(praligned) - len(praligned.lstrip('-'))
+            end = len(praligned.rstrip('-'))
+            matches = len([
+                index for index in range(start, end)
+                if praligned[index] == targetaligned[index]
+            ])
+
+            for threshold in (0.7, 0.8, 0.9, 0.95, 1.0):
+                if float(matches) / (end - start) >= threshold:
+                    self.assertTrue(self.index.canMatch('forward', target, threshold))
+
+    def test_settingsIndex(self):
+        settings = ConsensSeqSettings()
+        settings.setForwardPrimer('ACGTTGCA')
+        settings.setReversePrimer('TTGACCAT')
+
+        # The index should be shared until the primers change.
+        index = settings.getPrimerIndex()
+        self.assertEqual(index.getPrimers(), ('ACGTTGCA', 'TTGACCAT'))
+        self.assertIs(settings.getPrimerIndex(), index)
+
+        settings.setReversePrimer('TTGACCATG')
+        self.assertEqual(settings.getPrimerIndex().getPrimers(), ('ACGTTGCA', 'TTGACCATG'))
+        self.assertIsNot(settings.getPrimerIndex(), index)
+
+        index = settings.getPrimerIndex()
+        settings.setForwardPrimer('ACGTTGC')
+        self.assertEqual(settings.getPrimerIndex().getPrimers(), ('ACGTTGC', 'TTGACCATG'))
+        self.assertIsNot(settings.getPrimerIndex(), index)
+
+        settings.setAll(20, 'Bayesian', True, False, False, 0.8, 'ACGTTGCA', 'TTGACCAT', True, (10, 8))
+        self.assertEqual(settings.getPrimerIndex().getPrimers(), ('ACGTTGCA', 'TTGACCAT'))
+
+        other = ConsensSeqSettings()
+        other.getPrimerIndex()
+        other.copyFrom(settings)
+        self.assertEqual(other.getPrimerIndex().getPrimers(), ('ACGTTGCA', 'TTGACCAT'))
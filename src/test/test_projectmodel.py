@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core.stproject import SequenceTraceProject
+
+import unittest
+import os
+import os.path
+import tempfile
+
+
+# set the location of the test data files
+test_data = os.path.dirname(os.path.abspath(__file__)) + '/test_data/'
+
+
+# Tests the project's item indexes and item events.  Unlike test_project, these
+# tests do not need Gtk.
+class TestProjectModel(unittest.TestCase):
+    def setUp(self):
+        self.proj = SequenceTraceProject()
+        self.proj.setProjectFileName('test.str')
+        self.proj.addFiles(('b_F.ztr', 'b_R.ztr', 'a_F.ztr'))
+
+        self.events = []
+        for event in ('items_reset', 'items_added', 'items_removed', 'item_changed'):
+            self.proj.registerObserver(event, self.eventOccurred, event)
+
+    def eventOccurred(self, event, *args):
+        self.events.append(event)
+
+    def test_indexes(self):
+        items = [self.proj.getItemById(idnum) for idnum in range(3)]
+        self.assertEqual(['b_F.ztr', 'b_R.ztr', 'a_F.ztr'], [item.getName() for item in items])
+        self.assertEqual(['a_F.ztr', 'b_F.ztr', 'b_R.ztr'], [item.getName() for item in self.proj])
+
+        # Renaming a file item updates the file name index and the sort order.
+        items[2].setName('c_F.ztr')
+        self.assertFalse(self.proj.isFileInProject('a_F.ztr'))
+        self.assertTrue(self.proj.isFileInProject('c_F.ztr'))
+        self.assertEqual(['b_F.ztr', 'b_R.ztr', 'c_F.ztr'], [item.getName() for item in self.proj])
+        self.assertEqual(['item_changed'], self.events)
+
+        # Associated items keep their IDs and are linked to their parent.
+        group = self.proj.associateItems(items[:2], 'b')
+        self.assertEqual(3, group.getId())
+        self.assertIs(group, self.proj.getItemById(3))
+        self.assertEqual(items[:2], list(group.getChildren()))
+        self.assertIs(group, items[0].getParent())
+        self.assertIs(items[0], self.proj.getItemById(0))
+        self.assertEqual(2, self.proj.getNumItems())
+        self.assertEqual(3, self.proj.getNumFiles())
+
+        # Removing one file of a group moves the other file to the root level.
+        self.proj.removeFileItems((items[1],))
+        self.assertFalse(group.isValid())
+        self.assertIsNone(self.proj.getItemById(1))
+        self.assertFalse(items[0].hasParent())
+        self.assertFalse(self.proj.isFileInProject('b_R.ztr'))
+        self.assertEqual(['b_F.ztr', 'c_F.ztr'], [item.getName() for item in self.proj])
+        self.assertEqual(2, self.proj.getNumFiles())
+
+    def test_loadProject(self):
+        self.proj.clearProject()
+        self.proj.loadProjectFile(test_data + 'test_project-0.9.str')
+
+        # Clearing and loading a project each replace all items in one event.
+        self.assertEqual(['items_reset', 'items_reset'], self.events)
+
+        for item in self.proj:
+            self.assertIs(item, self.proj.getItemById(item.getId()))
+            for child in item.getChildren():
+                self.assertIs(item, child.getParent())
+                self.assertTrue(self.proj.isFileInProject(
+                    os.path.join(self.proj.getAbsTraceFileDir(), child.getName())
+                ))
+
+    def test_addFiles(self):
+        tracedir = self.proj.getAbsTraceFileDir()
+        filepaths = [os.path.join(tracedir, fname) for fname in ('c_F.ztr', 'a_F.ztr', 'b_R.ztr')]
+
+        self.assertEqual(filepaths[1:], self.proj.getFilesInProject(filepaths))
+
+        # All of the files are added with a single event.
+        self.proj.addFiles(filepaths)
+        self.assertEqual(['items_added'], self.events)
+        self.assertEqual(6, self.proj.getNumFiles())
+        self.assertEqual(filepaths, self.proj.getFilesInProject(filepaths))
+        self.assertEqual(
+            ['a_F.ztr', 'a_F.ztr', 'b_F.ztr', 'b_R.ztr', 'b_R.ztr', 'c_F.ztr'],
+            [item.getName() for item in self.proj]
+        )
+
+    def test_saveProject(self):
+        items = [self.proj.getItemById(idnum) for idnum in range(3)]
+        self.proj.associateItems(items[:2], 'b')
+        items[2].setConsensusSequence('ACGT', '-ACGT-')
+
+        tmpfile = tempfile.NamedTemporaryFile(suffix='.str', delete=False)
+        tmpfile.close()
+        try:
+            # A project that uses the default font can be saved without Gtk,
+            # and it still uses the default font after it is loaded.
+            self.proj.saveProjectFile(tmpfile.name)
+            proj = SequenceTraceProject()
+            proj.loadProjectFile(tmpfile.name)
+            self.assertIsNone(proj.getFontString())
+            self.assertEqual(
+                [(item.getName(), item.getCompactConsSequence()) for item in self.proj],
+                [(item.getName(), item.getCompactConsSequence()) for item in proj]
+            )
+            self.assertEqual(
+                [[child.getName() for child in item.getChildren()] for item in proj],
+                [[], ['b_F.ztr', 'b_R.ztr']]
+            )
+
+            self.proj.setFontString('Sans 14')
+            self.proj.saveProjectFile(tmpfile.name)
+            proj.loadProjectFile(tmpfile.name)
+            self.assertEqual('Sans 14', proj.getFontString())
+        finally:
+            os.remove(tmpfile.name)
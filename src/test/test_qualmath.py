@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core import qualmath
+
+import unittest
+import math
+
+
+class TestQualMath(unittest.TestCase):
+    def test_probabilities(self):
+        # The table values must be identical to the direct calculations.
+        for score in range(-qualmath.QUAL_OFFSET, qualmath.MAX_TABLE_QUAL + 1):
+            self.assertEqual(qualmath.errorProb(score), 10.0 ** (score / -10.0))
+            self.assertEqual(qualmath.correctProb(score), 1.0 - (10.0 ** (score / -10.0)))
+
+        # Scores outside of the tables are calculated directly.
+        for score in (-200, 300, 20.5):
+            self.assertEqual(qualmath.errorProb(score), 10.0 ** (score / -10.0))
+            self.assertEqual(qualmath.correctProb(score), 1.0 - (10.0 ** (score / -10.0)))
+
+        self.assertEqual(qualmath.phredScore(0.001), -10.0 * math.log10(0.001))
+        self.assertAlmostEqual(qualmath.getMeanErrorScore(20, 20), 20)
+        self.assertAlmostEqual(qualmath.getMeanErrorScore(10, 30), -10 * math.log10(0.0505))
+
+    def test_getBaseDist(self):
+        # Unambiguous bases.
+        self.assertEqual(qualmath.getBaseDist('A', 20), (0.99, 0.01 / 3, 0.01 / 3, 0.01 / 3))
+        self.assertEqual(qualmath.getBaseDist('C', 20), (0.01 / 3, 0.01 / 3, 0.01 / 3, 0.99))
+
+        # 2-base and 3-base ambiguity codes.
+        self.assertEqual(qualmath.getBaseDist('W', 10), (0.45, 0.45, 0.05, 0.05))
+        self.assertEqual(qualmath.getBaseDist('B', 10), (0.1, 0.9 / 3, 0.9 / 3, 0.9 / 3))
+
+        # Cached results are the same.
+        self.assertIs(qualmath.getBaseDist('B', 10), qualmath.getBaseDist('B', 10))
+
+        # Codes without distributions.
+        self.assertIsNone(qualmath.getBaseDist('N', 10))
+        self.assertIsNone(qualmath.getBaseDist('-', 10))
+
+    def test_getConsensusCall(self):
+        # Two matching calls should increase the confidence score.
+        cbase, cscore = qualmath.getConsensusCall('A', 20, 'A', 20)
+        self.assertEqual(cbase, 'A')
+        self.assertAlmostEqual(cscore, 44.6841, 4)
+
+        # The higher-quality call should win.
+        cbase, cscore = qualmath.getConsensusCall('A', 10, 'T', 30)
+        self.assertEqual(cbase, 'T')
+        cbase, cscore = qualmath.getConsensusCall('T', 30, 'A', 10)
+        self.assertEqual(cbase, 'T')
+
+        # Ties are resolved in the order of DIST_BASES.
+        self.assertEqual(qualmath.getConsensusCall('C', 20, 'G', 20)[0], 'G')
+        self.assertEqual(qualmath.getConsensusCall('W', 20, 'W', 20)[0], 'A')
+
+        # The results should not depend on the state of the cache.
+        dist = qualmath.getPosteriorDist('R', 12, 'G', 30)
+        expected = qualmath.getMostProbableBase(dist)
+        self.assertEqual(qualmath.getConsensusCall('R', 12, 'G', 30), expected)
+        self.assertEqual(qualmath.getConsensusCall('R', 12, 'G', 30), expected)
+        qualmath._callcache.clear()
+        self.assertEqual(qualmath.getConsensusCall('R', 12, 'G', 30), expected)
@@ -0,0 +1,170 @@
+#!/usr/bin/python
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core.seqgenerator import ConsensusGenerator, GenerationJob
+from seqtrace.core.consens import ConsensSeqBuilder, ConsensSeqSettings, ModifiableConsensSeqBuilder
+from seqtrace.core.sequencetrace import SequenceTraceFactory
+from seqtrace.core import tracecache
+
+import unittest
+import multiprocessing
+import os
+import os.path
+import tempfile
+import shutil
+
+
+# set the location of the test data files
+test_data = os.path.dirname(__file__) + '/test_data/'
+
+
+class TestConsensusGenerator(unittest.TestCase):
+    def setUp(self):
+        self.settings = ConsensSeqSettings()
+        self.settings.setTrimEndGaps(True)
+        # Aligning these primers inserts gaps into the trace alignments.
+        self.settings.setForwardPrimer('ATGCATGCATGCATGC')
+        self.settings.setReversePrimer('ATGCATGCATGCATGC')
+
+        self.jobs = [
+            GenerationJob(0, [(test_data + 'forward.ab1', False)]),
+            GenerationJob(1, [(test_data + 'forward.scf', False), (test_data + 'forward.ztr', True)]),
+            GenerationJob(2, [(test_data + 'missing.ab1', False)]),
+            GenerationJob(3, [(test_data + 'forward.ztr', False), (test_data + 'error-bad_index.ab1', True)]),
+            GenerationJob(4, [(test_data + 'mismatch_base_calls.ab1', True)])
+        ]
+
+    def getExpected(self, job):
+        seqtraces = []
+        for filepath, reverse in job.tracefiles:
+            seqt = SequenceTraceFactory.loadTraceFile(filepath)
+            if reverse:
+                seqt.reverseComplement()
+            seqtraces.append(seqt)
+
+        # Use the same builder options as the trace windows so that the
+        # results are compared with the sequences the GUI would calculate.
+        csb = ConsensSeqBuilder(seqtraces, self.settings)
+
+        return (csb.getCompactConsensus(), csb.getConsensus())
+
+    def checkResults(self, results):
+        self.assertEqual([result.jobid for result in results], range(len(self.jobs)))
+
+        for index in (0, 1, 4):
+            self.assertFalse(results[index].isError())
+            self.assertEqual(
+                (results[index].compact_cons, results[index].full_cons),
+                self.getExpected(self.jobs[index])
+            )
+
+        self.assertTrue(results[2].isError())
+        self.assertEqual(results[2].error_path, test_data + 'missing.ab1')
+        self.assertIsNone(results[2].error_msg)
+        self.assertIsNone(results[2].full_cons)
+
+        self.assertTrue(results[3].isError())
+        self.assertEqual(results[3].error_path, test_data + 'error-bad_index.ab1')
+        self.assertIsNotNone(results[3].error_msg)
+
+    def test_generate(self):
+        # Results from the worker processes should be identical to the results
+        # calculated in this process.
+        for numworkers in (1, 3):
+            generator = ConsensusGenerator(self.settings, numworkers)
+            self.checkResults(list(generator.generate(self.jobs)))
+
+        self.assertEqual(list(ConsensusGenerator(self.settings, 2).generate([])), [])
+        self.assertRaises(ValueError, ConsensusGenerator, self.settings, 0)
+
+    def test_reuseTraces(self):
+        # Count the trace files that are parsed in this process and in the
+        # worker processes.
+        parsed = multiprocessing.Value('i', 0)
+        origload = SequenceTraceFactory.loadTraceFile
+        def loadTraceFile(filepath, *args):
+            with parsed.get_lock():
+                parsed.value += 1
+            return origload(filepath, *args)
+
+        jobs = [self.jobs[index] for index in (0, 1, 4)]
+        tracecache.getTraceCache().clear()
+        SequenceTraceFactory.loadTraceFile = staticmethod(loadTraceFile)
+        try:
+            # The first run parses each trace file once, and the second run,
+            # even with worker processes, uses the in-memory trace cache.
+            results = list(ConsensusGenerator(self.settings, 1).generate(jobs))
+            self.assertEqual(parsed.value, 4)
+            generator = ConsensusGenerator(self.settings, 3)
+            self.assertEqual(
+                [(result.compact_cons, result.full_cons) for result in generator.generate(jobs)],
+                [(result.compact_cons, result.full_cons) for result in results]
+            )
+            self.assertEqual(parsed.value, 4)
+        finally:
+            SequenceTraceFactory.loadTraceFile = staticmethod(origload)
+            tracecache.getTraceCache().clear()
+
+        # Traces loaded by worker processes are kept in the on-disk cache, so
+        # the second run does not parse the files again.
+        cachedir = tempfile.mkdtemp()
+        try:
+            generator = ConsensusGenerator(self.settings, 3, cachedir, cache_traces=False)
+            list(generator.generate(jobs))
+            cachefiles = [os.path.join(cachedir, fname) for fname in os.listdir(cachedir)]
+            self.assertEqual(len(cachefiles), 4)
+            for cachefile in cachefiles:
+                os.utime(cachefile, (0, 0))
+
+            list(generator.generate(jobs))
+            self.assertEqual([os.path.getmtime(cachefile) for cachefile in cachefiles], [0] * 4)
+        finally:
+            shutil.rmtree(cachedir)
+
+    def test_cancel(self):
+        for numworkers in (1, 2):
+            generator = ConsensusGenerator(self.settings, numworkers)
+            results = []
+            for result in generator.generate(self.jobs):
+                results.append(result)
+                generator.cancel()
+
+            self.assertEqual(len(results), 1)
+            self.assertEqual(results[0].jobid, 0)
+            self.assertTrue(generator.isCanceled())
+
+    def test_fullConsensus(self):
+        # Aligning the primers inserts gaps into the trace alignment, which
+        # changes the full consensus sequence even if the primers are not
+        # trimmed.  The stored full consensus sequences must be usable by the
+        # trace windows, which always align the primers.
+        self.settings.setTrimPrimers(False)
+
+        seqt = SequenceTraceFactory.loadTraceFile(test_data + 'forward.ab1')
+        csb = ModifiableConsensSeqBuilder((seqt,), self.settings)
+
+        job = GenerationJob(0, [(test_data + 'forward.ab1', False)])
+        result = list(ConsensusGenerator(self.settings, 1).generate([job]))[0]
+        self.assertEqual(result.full_cons, csb.getConsensus())
+        csb.setConsensSequence(result.full_cons)
+
+        # Without all of the primer alignments, only the compact consensus
+        # sequence is the same.
+        generator = ConsensusGenerator(self.settings, 1, align_all_primers=False)
+        result = list(generator.generate([job]))[0]
+        self.assertEqual(result.compact_cons, csb.getCompactConsensus())
+        self.assertNotEqual(len(result.full_cons), len(csb.getConsensus()))
@@ -19,7 +19,10 @@ from seqtrace.core.sequencetrace import *
 
 import unittest
 import random
+import os
 import os.path
+import tempfile
+from struct import pack
 
 
 # set the location of the test data files
@@ -57,6 +60,68 @@ class TestSequenceTraceMethods(unittest.TestCase):
         result = reverseCompSequence(basecalls)
         self.assertEqual(result, 'ABATHGCRTVAAGYMAGKTCDGAGSWT')
 
+        # Test lowercase codes, unicode strings, and invalid codes.
+        self.assertEqual(reverseCompSequence('acgtn'), 'nacgt')
+        self.assertEqual(reverseCompSequence(u'AACG'), 'CGTT')
+        self.assertEqual(reverseCompSequence(''), '')
+        self.assertRaises(KeyError, reverseCompSequence, 'ACGXT')
+        self.assertRaises(KeyError, reverseCompSequence, 'AC-T')
+
+
+class TestZTRDecoders(unittest.TestCase):
+    """
+    Tests the ZTR data decoding filters on small, hand-constructed inputs that
+    exercise the edge cases (integer wraparound, escape codes, and guard
+    bytes).
+    """
+    def setUp(self):
+        self.trace = ZTRSequenceTrace()
+
+    def test_decode8BitDelta(self):
+        # 2 levels of delta filtering; the second value wraps around.
+        self.assertEqual(self.trace.decode8BitDelta('\x02\x01\xff\x03'), '\x01\x01\x04')
+        self.assertEqual(self.trace.decode8BitDelta('\x00\x01\xff'), '\x01\xff')
+
+    def test_decode16BitDelta(self):
+        self.assertEqual(
+            self.trace.decode16BitDelta('\x01\x00\x01\xff\xff\x00\x05'),
+            '\x00\x01\x00\x00\x00\x05'
+        )
+        self.assertRaises(ZTRError, self.trace.decode16BitDelta, '\x01\x00\x01\xff')
+
+    def test_decode32BitDelta(self):
+        self.assertEqual(
+            self.trace.decode32BitDelta('\x01\x00\x00\x00\x00\x00\x02\xff\xff\xff\xff'),
+            '\x00\x00\x00\x02\x00\x00\x00\x01'
+        )
+
+    def test_decode16To8(self):
+        # Includes an escaped value that itself contains the escape byte.
+        self.assertEqual(
+            self.trace.decode16To8('\x01\xff\x80\x80\x80\x7f'),
+            '\x00\x01\xff\xff\x80\x80\x00\x7f'
+        )
+
+    def test_decode32To8(self):
+        self.assertEqual(
+            self.trace.decode32To8('\xfe\x80\x12\x34\x56\x78\x02'),
+            '\xff\xff\xff\xfe\x12\x34\x56\x78\x00\x00\x00\x02'
+        )
+
+    def test_followDecode(self):
+        # Use a decode table in which every byte value predicts its successor.
+        table = ''.join([chr((val + 1) % 256) for val in range(256)])
+        self.assertEqual(self.trace.followDecode(table + '\xfe\x00\x00\xff'), '\xfe\xff\x00\x02')
+
+    def test_RLEUncompress(self):
+        # Guard byte 'g': a literal guard, a run of 5 'a's, and literal data.
+        self.assertEqual(
+            self.trace.RLEUncompress('\x09\x00\x00\x00gxg\x00g\x05ayz'),
+            'xgaaaaayz'
+        )
+        self.assertRaises(ZTRError, self.trace.RLEUncompress, '\x03\x00\x00\x00gxg\x05')
+        self.assertRaises(ZTRError, self.trace.RLEUncompress, '\x04\x00\x00\x00gxyz')
+
 
 class TestSequenceTrace:
     """
@@ -187,6 +252,26 @@ class TestSequenceTrace:
         for cnt in range(len(self.start_tracesamps_A)):
             self.assertEqual(self.trace.getTraceSample('A', cnt), self.start_tracesamps_A[cnt])
 
+    def test_sampleStorage(self):
+        # Verify that all of the sample storage backends give the same trace
+        # data, both before and after reverse complementing.
+        for sampstorage in (TS_ARRAY, TS_MMAP):
+            trace = self.trace.__class__(sampstorage)
+            trace.loadFile(self.filename)
+
+            self.assertEqual(trace.getTraceLength(), self.trace_length)
+            self.assertEqual(trace.getMaxTraceVal(), self.max_trace_val)
+            for cnt in range(len(self.start_tracesamps_A)):
+                self.assertEqual(trace.getTraceSample('A', cnt), self.start_tracesamps_A[cnt])
+            for base in ('A', 'C', 'G', 'T'):
+                self.assertEqual(list(trace.getTraceSamples(base)), self.trace.getTraceSamples(base))
+
+            trace.reverseComplement()
+            self.trace.reverseComplement()
+            for base in ('A', 'C', 'G', 'T'):
+                self.assertEqual(list(trace.getTraceSamples(base)), self.trace.getTraceSamples(base))
+            self.trace.reverseComplement()
+
     def test_getFileName(self):
         self.assertEqual(self.trace.getFileName(), os.path.basename(self.filename))
 
@@ -203,6 +288,53 @@ class TestSequenceTrace:
         self.assertFalse(self.trace.isReverseComplemented())
         self.assertEqual(self.trace.getBaseCalls(), self.base_calls)
 
+    def test_reverseComplementPosPastEnd(self):
+        # Base call positions past the end of the trace should not prevent
+        # reverse complementing.
+        tracelen = self.trace.getTraceLength()
+        self.trace.basepos[-1] = tracelen + 5
+
+        self.trace.reverseComplement()
+        self.assertEqual(self.trace.getBaseCallPos(0), -6)
+        self.assertEqual(self.trace.getBaseCallPos(1), tracelen - 1 - self.base_pos[-2])
+
+        self.trace.reverseComplement()
+        self.assertEqual(self.trace.getBaseCallPos(len(self.base_pos) - 1), tracelen + 5)
+
+    def test_reverseComplementView(self):
+        # Compare a reverse-complemented view of the trace with a fully
+        # reverse-complemented copy.
+        rctrace = self.trace.__class__()
+        rctrace.loadFile(self.filename)
+        rctrace.reverseComplement()
+
+        self.trace.reverseComplement(lazy=True)
+        self.assertTrue(self.trace.isReverseComplemented())
+        self.assertEqual(self.trace.getBaseCalls(), self.rev_compl)
+        self.assertEqual(self.trace.getTraceLength(), rctrace.getTraceLength())
+
+        numbases = self.trace.getNumBaseCalls()
+        for cnt in range(-1, numbases):
+            self.assertEqual(self.trace.getBaseCall(cnt), rctrace.getBaseCall(cnt))
+            self.assertEqual(self.trace.getBaseCallPos(cnt), rctrace.getBaseCallPos(cnt))
+            self.assertEqual(self.trace.getBaseCallConf(cnt), rctrace.getBaseCallConf(cnt))
+
+        for base in ('A', 'C', 'G', 'T'):
+            self.assertEqual(list(self.trace.getTraceSamples(base)), list(rctrace.getTraceSamples(base)))
+            for cnt in (0, 1, 100, -1):
+                self.assertEqual(self.trace.getTraceSample(base, cnt), rctrace.getTraceSample(base, cnt))
+
+        for sampnum in range(0, self.trace.getTraceLength(), 7):
+            self.assertEqual(self.trace.getPrevBaseCallIndex(sampnum), rctrace.getPrevBaseCallIndex(sampnum))
+            self.assertEqual(self.trace.getNextBaseCallIndex(sampnum), rctrace.getNextBaseCallIndex(sampnum))
+
+        # Switching back out of view mode should restore the original data.
+        self.trace.reverseComplement(lazy=True)
+        self.assertFalse(self.trace.isReverseComplemented())
+        self.assertEqual(self.trace.getBaseCalls(), self.base_calls)
+        for cnt in range(len(self.base_pos)):
+            self.assertEqual(self.trace.getBaseCallPos(cnt), self.base_pos[cnt])
+
     def test_getPrevBaseCallIndex(self):
         # test that exact base call locations work
         for cnt in range(len(self.base_pos)):
@@ -299,6 +431,83 @@ class TestABISequenceTrace(unittest.TestCase, TestSequenceTrace):
         self.assertRaises(ABIVersionError, self.trace.loadFile, test_data + 'error-wrong_version.ab1')
         self.assertRaises(ABIIndexError, self.trace.loadFile, test_data + 'error-bad_index.ab1')
 
+    def readIndex(self, trace, data):
+        # The file index is discarded after a file is loaded, so read the
+        # header and index directly.
+        trace.filedata = data
+        trace.readHeader()
+        trace.readABIIndex()
+
+    def test_getIndexEntry(self):
+        trace = ABISequenceTrace()
+        self.readIndex(trace, open(self.filename, 'rb').read())
+
+        entry = trace.getIndexEntry('PBAS', 1)
+        self.assertEqual(entry['did'], 'PBAS')
+        self.assertEqual(entry['idv'], 1)
+        self.assertIsNone(trace.getIndexEntry('PBAS', 99))
+        self.assertIsNone(trace.getIndexEntry('XXXX', 1))
+
+        entries = trace.getIndexEntriesById('DATA')
+        self.assertEqual([entry['idv'] for entry in entries], range(1, 13))
+        self.assertEqual(trace.getIndexEntriesById('XXXX'), [])
+
+    def test_truncated_data(self):
+        # Point the first processed trace data index entry past the end of the
+        # file data.
+        data = open(self.filename, 'rb').read()
+        trace = ABISequenceTrace()
+        self.readIndex(trace, data)
+        entrynum = trace.abiindex.index(trace.getIndexEntry('DATA', 9))
+        fieldpos = trace.index_offset + entrynum * 28 + 20
+        data = data[:fieldpos] + pack('>I', len(data) - 10) + data[fieldpos+4:]
+
+        tmpfile = tempfile.NamedTemporaryFile(suffix='.ab1', delete=False)
+        try:
+            tmpfile.write(data)
+            tmpfile.close()
+            self.assertRaises(ABIDataError, self.trace.loadFile, tmpfile.name)
+        finally:
+            os.remove(tmpfile.name)
+
+    def loadModifiedEntry(self, name, dformat, values):
+        """
+        Changes the data format of an index entry and its first values, and
+        then loads the modified file.  Returns the loaded trace.
+        """
+        data = open(self.filename, 'rb').read()
+        trace = ABISequenceTrace()
+        self.readIndex(trace, data)
+        entry = trace.getIndexEntry(name, 1)
+        entrynum = trace.abiindex.index(entry)
+        fieldpos = trace.index_offset + entrynum * 28 + 8
+        data = data[:fieldpos] + pack('>h', dformat) + data[fieldpos+2:]
+        data = data[:entry['offset']] + values + data[entry['offset'] + len(values):]
+
+        tmpfile = tempfile.NamedTemporaryFile(suffix='.ab1', delete=False)
+        try:
+            tmpfile.write(data)
+            tmpfile.close()
+            trace = ABISequenceTrace()
+            trace.loadFile(tmpfile.name)
+        finally:
+            os.remove(tmpfile.name)
+
+        return trace
+
+    def test_dataFormats(self):
+        # Unsigned confidence scores can be greater than 127.
+        trace = self.loadModifiedEntry('PCON', 1, pack('>B', 200))
+        self.assertEqual(trace.getBaseCallConf(0), 200)
+        self.assertEqual(trace.getBaseCallConf(1), self.bc_conf[1])
+
+        # Signed base call locations can be negative.
+        trace = self.loadModifiedEntry('PLOC', 4, pack('>h', -3))
+        self.assertEqual(trace.getBaseCallPos(0), -3)
+        self.assertEqual(trace.getBaseCallPos(1), self.base_pos[1])
+        trace.reverseComplement()
+        self.assertEqual(trace.getBaseCallPos(len(self.base_pos) - 1), trace.getTraceLength() + 2)
+
     # Test a trace file where the user-edited base calls differ from the basecaller-assigned base calls.
     # In this case, the user-edited base calls should be used.
     def test_mismatch_bases(self):
@@ -0,0 +1,298 @@
+#!/usr/bin/python
+# Copyright (C) 2018 Brian J. Stucky
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from seqtrace.core.tracecache import TraceCache, DiskTraceCache, estimateTraceSize
+from seqtrace.core.sequencetrace import SequenceTraceFactory, TS_LIST, TS_ARRAY, TS_MMAP
+
+import unittest
+import os
+import os.path
+import shutil
+import struct
+import tempfile
+import threading
+
+
+# set the location of the test data files
+test_data = os.path.dirname(__file__) + '/test_data/'
+
+
+class TestTraceCache(unittest.TestCase):
+    def setUp(self):
+        # Work with copies of the test files so that they can be modified.
+        self.tmpdir = tempfile.mkdtemp()
+        self.fnames = []
+        for fname in ('forward.ab1', 'forward.scf', 'forward.ztr'):
+            shutil.copy(test_data + fname, self.tmpdir)
+            self.fnames.append(os.path.join(self.tmpdir, fname))
+
+        self.cache = TraceCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def checkSameTrace(self, trace1, trace2):
+        # Compare the traces through their accessors, which give the same
+        # results for reverse-complemented views and transformed traces.
+        self.assertEqual(trace1.getBaseCalls(), trace2.getBaseCalls())
+        self.assertEqual(
+            [trace1.getBaseCallPos(index) for index in range(trace1.getNumBaseCalls())],
+            [trace2.getBaseCallPos(index) for index in range(trace2.getNumBaseCalls())]
+        )
+        self.assertEqual(list(trace1.getBaseCallConfs()), list(trace2.getBaseCallConfs()))
+        for base in ('A', 'C', 'G', 'T'):
+            self.assertEqual(list(trace1.getTraceSamples(base)), list(trace2.getTraceSamples(base)))
+        self.assertEqual(trace1.getComments(), trace2.getComments())
+        self.assertEqual(trace1.isReverseComplemented(), trace2.isReverseComplemented())
+
+    def test_getTrace(self):
+        for fname in self.fnames:
+            trace = self.cache.getTrace(fname)
+            self.checkSameTrace(trace, SequenceTraceFactory.loadTraceFile(fname))
+        self.assertEqual(self.cache.getLoadCount(), 3)
+        self.assertEqual(self.cache.getNumTraces(), 3)
+
+        # Getting the traces again should not parse the files.
+        for fname in self.fnames:
+            trace = self.cache.getTrace(fname)
+            self.checkSameTrace(trace, SequenceTraceFactory.loadTraceFile(fname))
+        self.assertEqual(self.cache.getLoadCount(), 3)
+        self.assertEqual(self.cache.getHitCount(), 3)
+
+        self.assertRaises(IOError, self.cache.getTrace, os.path.join(self.tmpdir, 'missing.ztr'))
+
+    def test_threads(self):
+        # Every request from concurrent threads should be counted as either a
+        # load or a cache hit.
+        def getTraces():
+            for cnt in range(20):
+                for fname in self.fnames:
+                    self.cache.getTrace(fname, cnt % 2 == 1)
+
+        threads = [threading.Thread(target=getTraces) for cnt in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.cache.getLoadCount() + self.cache.getHitCount(), 4 * 20 * 3)
+        self.assertEqual(self.cache.getNumTraces(), 3)
+
+    def test_independentCopies(self):
+        # Modifying a trace returned by the cache should not affect the cached
+        # trace.
+        trace = self.cache.getTrace(self.fnames[0])
+        trace.reverseComplement()
+        trace.comments['NAME'] = 'changed'
+
+        trace = self.cache.getTrace(self.fnames[0])
+        self.checkSameTrace(trace, SequenceTraceFactory.loadTraceFile(self.fnames[0]))
+
+    def test_reverse(self):
+        for fname in self.fnames:
+            rctrace = SequenceTraceFactory.loadTraceFile(fname)
+            rctrace.reverseComplement()
+
+            # The reverse complement should be derived from the cached forward
+            # trace without parsing the file again.
+            self.cache.getTrace(fname)
+            self.checkSameTrace(self.cache.getTrace(fname, True), rctrace)
+            self.checkSameTrace(self.cache.getTrace(fname, True), rctrace)
+
+        # Reverse-complemented traces are views of the cached forward traces,
+        # so they do not need their own cache entries.
+        self.assertEqual(self.cache.getLoadCount(), 3)
+        self.assertEqual(self.cache.getNumTraces(), 3)
+
+        # Requesting only the reverse complement should also work.
+        self.cache.clear()
+        trace = self.cache.getTrace(self.fnames[2], True)
+        self.checkSameTrace(trace, rctrace)
+        self.assertEqual(self.cache.getLoadCount(), 4)
+
+    def test_invalidation(self):
+        fname = self.fnames[0]
+        self.cache.getTrace(fname)
+        self.cache.getTrace(fname, True)
+
+        self.assertTrue(self.cache.hasTrace(fname))
+        self.assertFalse(self.cache.hasTrace(self.fnames[1]))
+        self.assertFalse(self.cache.hasTrace(os.path.join(self.tmpdir, 'missing.ztr')))
+
+        # Changing the modification time should invalidate the entry.
+        stat = os.stat(fname)
+        os.utime(fname, (stat.st_atime, stat.st_mtime + 10))
+        self.assertFalse(self.cache.hasTrace(fname))
+        self.cache.getTrace(fname)
+        self.assertEqual(self.cache.getLoadCount(), 2)
+
+        # Changing the size should invalidate the entry.
+        fout = open(fname, 'ab')
+        fout.write('\0')
+        fout.close()
+        os.utime(fname, (stat.st_atime, stat.st_mtime + 10))
+        self.cache.getTrace(fname, True)
+        self.assertEqual(self.cache.getLoadCount(), 3)
+
+        # Test explicit invalidation.
+        self.cache.invalidate(fname)
+        self.assertEqual(self.cache.getNumTraces(), 0)
+        self.assertEqual(self.cache.getTotalBytes(), 0)
+
+    def test_memoryBudget(self):
+        sizes = []
+        for fname in self.fnames:
+            sizes.append(estimateTraceSize(SequenceTraceFactory.loadTraceFile(fname, self.cache.sampstorage)))
+
+        # Only allow room for the two most recently used traces.
+        self.cache.setMaxBytes(sizes[1] + sizes[2])
+        for fname in self.fnames:
+            self.cache.getTrace(fname)
+        self.assertEqual(self.cache.getNumTraces(), 2)
+        self.assertTrue(self.cache.getTotalBytes() <= self.cache.getMaxBytes())
+
+        self.cache.getTrace(self.fnames[1])
+        self.cache.getTrace(self.fnames[2])
+        self.assertEqual(self.cache.getLoadCount(), 3)
+        self.cache.getTrace(self.fnames[0])
+        self.assertEqual(self.cache.getLoadCount(), 4)
+
+        # Shrinking the budget should evict traces immediately.
+        self.cache.setMaxBytes(0)
+        self.assertEqual(self.cache.getNumTraces(), 0)
+        self.assertEqual(self.cache.getTotalBytes(), 0)
+
+
+class TestDiskTraceCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fnames = []
+        for fname in ('forward.ab1', 'forward.scf', 'forward.ztr'):
+            shutil.copy(test_data + fname, self.tmpdir)
+            self.fnames.append(os.path.join(self.tmpdir, fname))
+            # Use whole-second modification times so that they can be restored
+            # exactly.
+            os.utime(self.fnames[-1], (1500000000, 1500000000))
+
+        self.cache = DiskTraceCache(os.path.join(self.tmpdir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def checkSameTrace(self, trace1, trace2):
+        self.assertEqual(trace1.__class__, trace2.__class__)
+        self.assertEqual(trace1.getBaseCalls(), trace2.getBaseCalls())
+        self.assertEqual(list(trace1.basepos), list(trace2.basepos))
+        self.assertEqual(list(trace1.bcconf), list(trace2.bcconf))
+        self.assertEqual(trace1.getMaxTraceVal(), trace2.getMaxTraceVal())
+        self.assertEqual(trace1.getFileName(), trace2.getFileName())
+        for base in ('A', 'C', 'G', 'T'):
+            self.assertEqual(list(trace1.getTraceSamples(base)), list(trace2.getTraceSamples(base)))
+        self.assertEqual(trace1.getComments(), trace2.getComments())
+
+    def test_storeAndLoad(self):
+        for fname in self.fnames:
+            self.assertIsNone(self.cache.loadTrace(fname))
+
+            trace = SequenceTraceFactory.loadTraceFile(fname)
+            self.assertTrue(self.cache.storeTrace(fname, trace))
+            for sampstorage in (TS_LIST, TS_ARRAY, TS_MMAP):
+                cached = self.cache.loadTrace(fname, sampstorage)
+                self.checkSameTrace(cached, trace)
+
+                # Make sure the cached trace is fully functional.
+                rctrace = SequenceTraceFactory.loadTraceFile(fname)
+                rctrace.reverseComplement()
+                cached.reverseComplement()
+                self.checkSameTrace(cached, rctrace)
+
+        # Reverse-complemented traces should not be cached.
+        self.assertFalse(self.cache.storeTrace(self.fnames[0], rctrace))
+
+    def test_comments(self):
+        fname = self.fnames[0]
+        trace = SequenceTraceFactory.loadTraceFile(fname)
+
+        # Comment keys and values can contain any characters.
+        trace.comments = {'KEY\0A': 'value\0a', '': 'empty key', 'NAME': ''}
+        self.assertTrue(self.cache.storeTrace(fname, trace))
+        self.assertEqual(self.cache.loadTrace(fname).comments, trace.comments)
+
+        # Comments data that does not decode to key/value pairs should cause
+        # the cache file to be ignored.
+        trace.comments = {'K': 'V'}
+        self.cache.storeTrace(fname, trace)
+        cachepath = self.cache.getCachePath(fname)
+        cachedata = open(cachepath, 'rb').read()
+        for baddata in (
+            # a string length past the end of the data
+            cachedata[:-5] + struct.pack('=I', 100) + 'V',
+            # a key with no value
+            cachedata[:-10] + struct.pack('=I', 6) + cachedata[-6:]
+        ):
+            fout = open(cachepath, 'wb')
+            fout.write(baddata)
+            fout.close()
+            self.assertIsNone(self.cache.loadTrace(fname))
+
+    def test_factory(self):
+        for fname in self.fnames:
+            trace = SequenceTraceFactory.loadTraceFile(fname, TS_ARRAY, self.cache)
+            self.assertTrue(os.path.exists(self.cache.getCachePath(fname)))
+            self.checkSameTrace(
+                SequenceTraceFactory.loadTraceFile(fname, TS_ARRAY, self.cache), trace
+            )
+
+        # Make sure the traces are actually loaded from the cache by replacing
+        # a trace file with a damaged file that has the same size and time.
+        data = open(self.fnames[2], 'rb').read()
+        stat = os.stat(self.fnames[2])
+        fout = open(self.fnames[2], 'wb')
+        fout.write('\0' * len(data))
+        fout.close()
+        os.utime(self.fnames[2], (stat.st_atime, stat.st_mtime))
+        self.checkSameTrace(
+            SequenceTraceFactory.loadTraceFile(self.fnames[2], TS_ARRAY, self.cache), trace
+        )
+
+    def test_invalidCacheFiles(self):
+        fname = self.fnames[0]
+        trace = SequenceTraceFactory.loadTraceFile(fname)
+        self.cache.storeTrace(fname, trace)
+        cachepath = self.cache.getCachePath(fname)
+        cachedata = open(cachepath, 'rb').read()
+
+        # A changed source file should invalidate the cache file.
+        stat = os.stat(fname)
+        os.utime(fname, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNone(self.cache.loadTrace(fname))
+        os.utime(fname, (stat.st_atime, stat.st_mtime))
+        self.assertIsNotNone(self.cache.loadTrace(fname))
+
+        # Truncated, empty, and wrong-version cache files should be ignored.
+        for baddata in (
+            cachedata[:-10], cachedata[:20], '',
+            cachedata[:8] + '\xff\xff' + cachedata[10:]
+        ):
+            fout = open(cachepath, 'wb')
+            fout.write(baddata)
+            fout.close()
+            self.assertIsNone(self.cache.loadTrace(fname))
+
+        # Clearing the cache should remove the cache files.
+        self.cache.clear()
+        self.assertFalse(os.path.exists(cachepath))